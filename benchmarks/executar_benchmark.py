@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+
+import pandas as pd
+
+from benchmarks.gerador_dados import gerar_planilhas_sinteticas, ARQUIVO_MAPEAMENTO_GRAVADO
+from src.data_handler import (
+    ler_esquemas_planilhas, definir_colunas_necessarias, carregar_planilhas_entrada,
+    consolidar_e_calcular_custos, agregar_custos_em_streaming
+)
+from src.agent_mapper import processar_mapeamento_identificado
+from src.report_generator import gerar_relatorio_excel
+from src.metrics import medir_etapa, obter_eventos, limpar_metricas
+
+DIRETORIO_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+DIRETORIO_DADOS_PADRAO = os.path.join(DIRETORIO_BENCHMARKS, "dados")
+ARQUIVO_HISTORICO_PADRAO = os.path.join(DIRETORIO_BENCHMARKS, "resultados", "historico.jsonl")
+NOMES_PLANILHAS = ["colaboradores.xlsx", "github.xlsx", "gympass.xlsx", "google_workspace.xlsx", "unimed.xlsx"]
+ETAPAS_MEDIDAS = ["carregar_planilhas_entrada", "agregar_custos_em_streaming", "consolidar_e_calcular_custos", "gerar_relatorio_excel"]
+# Uma etapa só é marcada como regressão se ficar 20% e pelo menos 50 ms mais lenta (evita ruído em etapas curtas).
+LIMIAR_REGRESSAO = 0.20
+LIMIAR_REGRESSAO_ABSOLUTO_S = 0.05
+
+
+def preparar_dados(linhas: int, semente: int, diretorio_dados: str) -> str:
+    """Gera as planilhas sintéticas uma única vez por (linhas, semente) e reaproveita nas execuções seguintes."""
+    diretorio = os.path.join(diretorio_dados, f"{linhas}_s{semente}")
+    if not os.path.isfile(os.path.join(diretorio, ARQUIVO_MAPEAMENTO_GRAVADO)):
+        print(f"[preparar_dados] Gerando planilhas sintéticas com {linhas} colaboradores em '{diretorio}'...")
+        gerar_planilhas_sinteticas(diretorio, linhas, semente)
+    return diretorio
+
+
+def mapear_com_gravacao(diretorio: str) -> Dict[str, Any]:
+    """Mapeador gravado: reproduz offline e de forma determinística a identificação de colunas do LLM."""
+    with open(os.path.join(diretorio, ARQUIVO_MAPEAMENTO_GRAVADO), "r", encoding="utf-8") as f:
+        identificacoes = json.load(f)
+    mapeamento: Dict[str, Any] = {}
+    for nome_planilha, ident in identificacoes.items():
+        mapeamento.update(processar_mapeamento_identificado(
+            nome_planilha, ident["col_nome_identificada"], ident["col_cpf_identificada"], ident["col_custo_identificada"]
+        ))
+    return mapeamento
+
+
+def executar_rodada(diretorio: str, modo_compacto: bool, modo_streaming: bool, usar_cache: bool) -> Dict[str, float]:
+    """Uma execução das etapas medidas. Retorna o tempo de parede (s) e o pico de RSS (do processo e o aumento) por etapa."""
+    limpar_metricas()
+    mapeamento = mapear_com_gravacao(diretorio)
+    amostras = ler_esquemas_planilhas(diretorio, NOMES_PLANILHAS)
+    colunas = definir_colunas_necessarias(mapeamento, {nome: list(df.columns) for nome, df in amostras.items()})
+
+    custos_pre_agregados = None
+    if modo_streaming:
+        with medir_etapa("carregar_planilhas_entrada", perfilar=False):
+            dataframes = carregar_planilhas_entrada(diretorio, ["colaboradores.xlsx"], colunas, usar_cache=usar_cache)
+        with medir_etapa("agregar_custos_em_streaming", perfilar=False):
+            custos_pre_agregados = agregar_custos_em_streaming(diretorio, NOMES_PLANILHAS, mapeamento, modo_compacto=modo_compacto)
+    else:
+        with medir_etapa("carregar_planilhas_entrada", perfilar=False):
+            dataframes = carregar_planilhas_entrada(diretorio, NOMES_PLANILHAS, colunas, usar_cache=usar_cache)
+    with medir_etapa("consolidar_e_calcular_custos", perfilar=False):
+        df_final = consolidar_e_calcular_custos(
+            dataframes, mapeamento, modo_compacto=modo_compacto, custos_pre_agregados=custos_pre_agregados
+        )
+    diretorio_saida = tempfile.mkdtemp(prefix="benchmark_rateio_")
+    try:
+        with medir_etapa("gerar_relatorio_excel", perfilar=False):
+            gerar_relatorio_excel(df_final, mapeamento, diretorio_saida, "Relatorio_Benchmark.xlsx")
+    finally:
+        shutil.rmtree(diretorio_saida, ignore_errors=True)
+
+    resultado: Dict[str, float] = {}
+    for evento in obter_eventos("etapa"):
+        if evento["etapa"] in ETAPAS_MEDIDAS:
+            resultado[f"{evento['etapa']}_s"] = evento["wall_s"]
+            resultado[f"{evento['etapa']}_pico_rss_processo_bytes"] = evento["pico_rss_processo_bytes"]
+            resultado[f"{evento['etapa']}_aumento_pico_rss_bytes"] = evento["aumento_pico_rss_bytes"]
+    return resultado
+
+
+def obter_commit_atual() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=DIRETORIO_BENCHMARKS
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def carregar_historico(arquivo_historico: str) -> List[Dict[str, Any]]:
+    if not os.path.isfile(arquivo_historico):
+        return []
+    with open(arquivo_historico, "r", encoding="utf-8") as f:
+        return [json.loads(linha) for linha in f if linha.strip()]
+
+
+def comparar_com_anterior(resultado: Dict[str, Any], historico: List[Dict[str, Any]]) -> List[str]:
+    """Compara com a última execução de mesma configuração; lista as etapas mais lentas que o limiar."""
+    chave = ("linhas", "semente", "modo_compacto", "modo_streaming", "usar_cache")
+    anteriores = [h for h in historico if all(h.get(c) == resultado.get(c) for c in chave)]
+    if not anteriores:
+        print("  (sem execução anterior com a mesma configuração para comparar)")
+        return []
+    anterior = anteriores[-1]
+    regressoes = []
+    for etapa in ETAPAS_MEDIDAS:
+        atual, base = resultado.get(f"{etapa}_s"), anterior.get(f"{etapa}_s")
+        if atual is None or not base:
+            continue
+        variacao = (atual - base) / base
+        regrediu = variacao > LIMIAR_REGRESSAO and atual - base > LIMIAR_REGRESSAO_ABSOLUTO_S
+        marcador = "  <-- REGRESSÃO" if regrediu else ""
+        print(f"  {etapa}: {base:.3f}s -> {atual:.3f}s ({variacao:+.1%}){marcador}")
+        if regrediu:
+            regressoes.append(etapa)
+    return regressoes
+
+
+def executar_benchmark(
+    tamanhos: List[int],
+    repeticoes: int = 3,
+    semente: int = 42,
+    modo_compacto: bool = False,
+    modo_streaming: bool = False,
+    usar_cache: bool = False,
+    diretorio_dados: str = DIRETORIO_DADOS_PADRAO,
+    arquivo_historico: str = ARQUIVO_HISTORICO_PADRAO
+) -> List[Dict[str, Any]]:
+    """
+    Executa as etapas do pipeline sobre dados sintéticos de cada tamanho, `repeticoes` vezes, e guarda
+    o melhor tempo de cada etapa no histórico (JSON lines), comparando com a execução anterior equivalente.
+    Cada resultado traz em `regressoes` as etapas que ficaram mais lentas que o limiar.
+    """
+    historico = carregar_historico(arquivo_historico)
+    os.makedirs(os.path.dirname(arquivo_historico), exist_ok=True)
+    resultados = []
+    for linhas in tamanhos:
+        diretorio = preparar_dados(linhas, semente, diretorio_dados)
+        rodadas = [executar_rodada(diretorio, modo_compacto, modo_streaming, usar_cache) for _ in range(repeticoes)]
+        resultado: Dict[str, Any] = {
+            "instante": datetime.now().isoformat(timespec="seconds"),
+            "commit": obter_commit_atual(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "linhas": linhas,
+            "semente": semente,
+            "repeticoes": repeticoes,
+            "modo_compacto": modo_compacto,
+            "modo_streaming": modo_streaming,
+            "usar_cache": usar_cache,
+        }
+        for campo in rodadas[0]:
+            valores = [r[campo] for r in rodadas if r.get(campo) is not None]
+            if valores:
+                resultado[campo] = min(valores) if campo.endswith("_s") else max(valores)
+        print(f"\n=== Benchmark: {linhas} colaboradores (melhor de {repeticoes}) ===")
+        regressoes = comparar_com_anterior(resultado, historico)
+        with open(arquivo_historico, "a", encoding="utf-8") as f:
+            f.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+        historico.append(resultado)
+        resultados.append({**resultado, "regressoes": regressoes})
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline de rateio com dados sintéticos")
+    parser.add_argument(
+        "--linhas", default="1000,10000,100000",
+        help="Tamanhos (número de colaboradores) separados por vírgula. Padrão: 1000,10000,100000."
+    )
+    parser.add_argument("--repeticoes", type=int, default=3, help="Execuções por tamanho; vale o melhor tempo. Padrão: 3.")
+    parser.add_argument("--semente", type=int, default=42, help="Semente do gerador de dados. Padrão: 42.")
+    parser.add_argument("--modo-compacto", action="store_true", help="Executa com o modo compacto de memória.")
+    parser.add_argument("--streaming", action="store_true", help="Agrega os fornecedores em streaming.")
+    parser.add_argument("--com-cache", action="store_true", help="Usa o cache colunar das planilhas (mede a leitura quente).")
+    parser.add_argument("--historico", default=ARQUIVO_HISTORICO_PADRAO, help="Arquivo JSON lines com o histórico de resultados.")
+    parser.add_argument(
+        "--falhar-em-regressao", action="store_true",
+        help="Termina com código 2 se alguma etapa regredir em relação à execução anterior equivalente."
+    )
+    args = parser.parse_args()
+    resultados = executar_benchmark(
+        [int(t) for t in args.linhas.split(",") if t.strip()],
+        repeticoes=args.repeticoes,
+        semente=args.semente,
+        modo_compacto=args.modo_compacto,
+        modo_streaming=args.streaming,
+        usar_cache=args.com_cache,
+        arquivo_historico=args.historico
+    )
+    if args.falhar_em_regressao and any(r["regressoes"] for r in resultados):
+        sys.exit(2)
@@ -0,0 +1,159 @@
+import os
+import json
+import argparse
+from typing import Dict, List, Any
+
+import numpy as np
+import pandas as pd
+
+LIMITE_LINHAS_XLSX = 1_048_575
+ARQUIVO_MAPEAMENTO_GRAVADO = "mapeamento_gravado.json"
+
+PRIMEIROS_NOMES = [
+    "Adolfo", "Adriana", "Afonso", "Alan", "Alberto", "Beatriz", "Bruno", "Camila", "Carlos", "Débora",
+    "Eduardo", "Fernanda", "Gabriel", "Helena", "Igor", "Joana", "João", "Larissa", "Márcio", "Natália",
+    "Otávio", "Patrícia", "Rafael", "Sônia", "Tiago", "Úrsula", "Vinícius", "Yasmin",
+]
+SOBRENOMES = [
+    "Moreira", "Nogueira", "Barros", "Esteves", "da Luz", "Silva", "Souza", "Oliveira", "Pereira", "Lima",
+    "Gonçalves", "Araújo", "Ribeiro", "Carvalho", "Rocha", "Almeida", "Castro", "Mendes", "Cardoso", "Teixeira",
+]
+DEPARTAMENTOS = ["R&D", "G&A", "S&M", "COGS"]
+
+# Variações de cabeçalho por papel; o gerador sorteia uma por planilha para exercitar o mapeamento.
+CABECALHOS_POR_PLANILHA: Dict[str, Dict[str, List[str]]] = {
+    "colaboradores": {
+        "nome": ["Nome", "Nome Completo", "Colaborador"],
+        "cpf": ["CPF", "CPF do Colaborador", "Documento"],
+        "custo": ["Salario", "Salário Base", "Remuneração"],
+    },
+    "github": {
+        "nome": ["Assinante", "Usuário", "Nome"],
+        "cpf": ["Documento", "CPF"],
+        "custo": ["Valor Mensal", "Custo Mensal", "Total"],
+    },
+    "gympass": {
+        "nome": ["Assinante", "Beneficiário", "Nome"],
+        "cpf": ["Documento", "CPF", "Nº Documento"],
+        "custo": ["Valor Mensal", "Mensalidade"],
+    },
+    "google_workspace": {
+        "nome": ["Assinante", "Usuário", "Titular"],
+        "cpf": ["Documento", "CPF"],
+        "custo": ["Valor Mensal", "Valor", "Custo"],
+    },
+    "unimed": {
+        "nome": ["Beneficiário", "Nome do Beneficiário", "Titular"],
+        "cpf": ["CPF", "CPF Beneficiário"],
+        "custo": ["Total", "Valor Total", "Mensalidade"],
+    },
+}
+# Fração de colaboradores presentes em cada fornecedor e fração dessas linhas repetidas (mesmo CPF).
+COBERTURA_FORNECEDORES = {"github": 0.6, "gympass": 0.4, "google_workspace": 0.9, "unimed": 0.7}
+FRACAO_DUPLICADOS = {"github": 0.05, "gympass": 0.02, "google_workspace": 0.01, "unimed": 0.25}
+FRACAO_CPFS_DESCONHECIDOS = 0.01
+
+
+def gerar_cpfs_validos(rng: np.random.Generator, quantidade: int) -> np.ndarray:
+    """CPFs distintos com dígitos verificadores válidos, como inteiros de 11 dígitos."""
+    bases = np.unique(rng.integers(1_000_000, 999_999_999, size=int(quantidade * 1.1) + 10))
+    bases = rng.permutation(bases)[:quantidade]
+    digitos = (bases[:, None] // 10 ** np.arange(8, -1, -1)) % 10
+    dv1 = (digitos * np.arange(10, 1, -1)).sum(axis=1) * 10 % 11 % 10
+    dv2 = ((digitos * np.arange(11, 2, -1)).sum(axis=1) + dv1 * 2) * 10 % 11 % 10
+    return bases * 100 + dv1 * 10 + dv2
+
+
+def formatar_cpfs_variados(rng: np.random.Generator, cpfs: np.ndarray) -> pd.Series:
+    """Mistura os formatos vistos nas exportações: '123.456.789-09', só dígitos e número (sem zeros à esquerda)."""
+    texto = pd.Series(cpfs).astype(str).str.zfill(11)
+    formatado = texto.str[:3] + "." + texto.str[3:6] + "." + texto.str[6:9] + "-" + texto.str[9:]
+    formato = rng.integers(0, 3, size=len(cpfs))
+    return pd.Series(
+        np.where(formato == 0, formatado, np.where(formato == 1, texto, cpfs.astype(object))),
+        dtype=object
+    )
+
+
+def gerar_nomes(rng: np.random.Generator, quantidade: int) -> np.ndarray:
+    primeiros = np.array(PRIMEIROS_NOMES, dtype=object)[rng.integers(0, len(PRIMEIROS_NOMES), quantidade)]
+    sobrenomes = np.array(SOBRENOMES, dtype=object)[rng.integers(0, len(SOBRENOMES), quantidade)]
+    return primeiros + " " + sobrenomes
+
+
+def _escrever_xlsx(df: pd.DataFrame, caminho: str) -> None:
+    if len(df) > LIMITE_LINHAS_XLSX:
+        raise ValueError(f"'{os.path.basename(caminho)}' teria {len(df)} linhas, acima do limite do XLSX.")
+    # Sem constant_memory: o pandas grava coluna a coluna, o que esse modo do xlsxwriter não suporta.
+    try:
+        import xlsxwriter  # noqa: F401
+        df.to_excel(caminho, index=False, engine="xlsxwriter")
+    except ImportError:
+        df.to_excel(caminho, index=False)
+
+
+def gerar_planilhas_sinteticas(diretorio_saida: str, linhas: int, semente: int = 42) -> Dict[str, Any]:
+    """
+    Gera as cinco planilhas de entrada com `linhas` colaboradores em `diretorio_saida`. Os cabeçalhos variam
+    por planilha, os CPFs vêm em formatos mistos, os fornecedores repetem CPFs (várias licenças, rubricas)
+    e trazem CPFs fora do quadro. Grava também o mapeamento esperado (`mapeamento_gravado.json`), no
+    formato de identificação do LLM, para o mapeador gravado do benchmark. Retorna esse mapeamento.
+    """
+    rng = np.random.default_rng(semente)
+    os.makedirs(diretorio_saida, exist_ok=True)
+    identificacoes: Dict[str, Dict[str, str]] = {}
+
+    def escolher_cabecalhos(nome_planilha: str) -> Dict[str, str]:
+        variacoes = CABECALHOS_POR_PLANILHA[nome_planilha]
+        escolhidos = {papel: opcoes[rng.integers(0, len(opcoes))] for papel, opcoes in variacoes.items()}
+        identificacoes[nome_planilha] = {
+            "col_nome_identificada": escolhidos["nome"],
+            "col_cpf_identificada": escolhidos["cpf"],
+            "col_custo_identificada": escolhidos["custo"],
+        }
+        return escolhidos
+
+    cpfs = gerar_cpfs_validos(rng, linhas)
+    nomes = gerar_nomes(rng, linhas)
+    cabecalhos = escolher_cabecalhos("colaboradores")
+    colaboradores = pd.DataFrame({
+        cabecalhos["nome"]: nomes,
+        cabecalhos["cpf"]: formatar_cpfs_variados(rng, cpfs),
+        "Departamento": np.array(DEPARTAMENTOS, dtype=object)[rng.integers(0, len(DEPARTAMENTOS), linhas)],
+        cabecalhos["custo"]: rng.normal(8000, 3000, linhas).clip(1500).round(2),
+    })
+    _escrever_xlsx(colaboradores, os.path.join(diretorio_saida, "colaboradores.xlsx"))
+
+    for nome_planilha, cobertura in COBERTURA_FORNECEDORES.items():
+        presentes = rng.choice(linhas, size=max(1, int(linhas * cobertura)), replace=False)
+        repetidos = rng.choice(presentes, size=int(len(presentes) * FRACAO_DUPLICADOS[nome_planilha]))
+        indices = np.concatenate([presentes, repetidos])
+        cpfs_fornecedor = cpfs[indices]
+        nomes_fornecedor = nomes[indices]
+        desconhecidos = int(len(indices) * FRACAO_CPFS_DESCONHECIDOS)
+        if desconhecidos:
+            cpfs_fornecedor = np.concatenate([cpfs_fornecedor, gerar_cpfs_validos(rng, desconhecidos)])
+            nomes_fornecedor = np.concatenate([nomes_fornecedor, gerar_nomes(rng, desconhecidos)])
+        ordem = rng.permutation(len(cpfs_fornecedor))
+        cabecalhos = escolher_cabecalhos(nome_planilha)
+        df = pd.DataFrame({
+            cabecalhos["nome"]: nomes_fornecedor[ordem],
+            cabecalhos["cpf"]: formatar_cpfs_variados(rng, cpfs_fornecedor[ordem]),
+            "Data Ativacao": pd.Timestamp("2021-01-01") + pd.to_timedelta(rng.integers(0, 1500, len(ordem)), unit="D"),
+            cabecalhos["custo"]: rng.gamma(2.0, 150.0, len(ordem)).round(2),
+        })
+        _escrever_xlsx(df, os.path.join(diretorio_saida, f"{nome_planilha}.xlsx"))
+
+    with open(os.path.join(diretorio_saida, ARQUIVO_MAPEAMENTO_GRAVADO), "w", encoding="utf-8") as f:
+        json.dump(identificacoes, f, indent=2, ensure_ascii=False)
+    return identificacoes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera planilhas de entrada sintéticas para benchmark")
+    parser.add_argument("diretorio", help="Diretório de saída das planilhas.")
+    parser.add_argument("--linhas", type=int, default=1000, help="Número de colaboradores. Padrão: 1000.")
+    parser.add_argument("--semente", type=int, default=42, help="Semente do gerador aleatório. Padrão: 42.")
+    args = parser.parse_args()
+    gerar_planilhas_sinteticas(args.diretorio, args.linhas, args.semente)
+    print(f"Planilhas sintéticas com {args.linhas} colaboradores geradas em: {args.diretorio}")
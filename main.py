@@ -1,44 +1,142 @@
 import os
 import json
+import argparse
+from typing import Any, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
 load_dotenv() 
 
-from src.data_handler import carregar_planilhas_entrada, consolidar_e_calcular_custos
-from src.agent_mapper import obter_mapeamento_colunas 
-from src.report_generator import gerar_relatorio_excel 
+import pandas as pd
 
-def run_pipeline():
-    print("Iniciando Pipeline de Rateio de Custos (Completo)...")
+from src.data_handler import (
+    ler_esquemas_planilhas, definir_colunas_necessarias,
+    carregar_planilhas_entrada, consolidar_e_calcular_custos, agregar_custos_em_streaming,
+    NOMES_PLANILHAS_PADRAO
+)
+from src.report_generator import gerar_saidas_relatorio, FORMATOS_SAIDA_DISPONIVEIS
+from src.incremental import consolidar_incremental
+from src.batch_runner import executar_lote
+from src.watcher import SessaoPipelineAquecida, observar_diretorio, DEBOUNCE_PADRAO_S
+from src.historico import registrar_no_historico
+from src.servico_consulta import servir_consultas, PORTA_PADRAO
+from src.mapping_cache import carregar_mapeamento_arquivo, salvar_ultimo_mapeamento, caminho_ultimo_mapeamento
+from src.metrics import configurar_metricas, medir_etapa, imprimir_resumo_metricas
 
-    project_root_dir = os.path.dirname(os.path.abspath(__file__))
-    input_data_dir = os.path.join(project_root_dir, 'data', 'input')
-    output_data_dir = os.path.join(project_root_dir, 'data', 'output') 
-    nome_arquivo_relatorio = "Relatorio_Rateio_Custos.xlsx"
-    
-    nomes_planilhas = [
-        "colaboradores.xlsx", "github.xlsx", "gympass.xlsx",
-        "google_workspace.xlsx", "unimed.xlsx"
-    ]
-    dataframes_brutos = carregar_planilhas_entrada(input_data_dir, nomes_planilhas)
-    if dataframes_brutos is None:
-        print("Pipeline interrompido: erro no carregamento dos dados (Etapa 1).")
-        return
+def consolidar_completo(
+    input_data_dir: str,
+    nomes_planilhas: List[str],
+    forcar_atualizacao_mapeamento: bool = False,
+    modo_compacto: bool = False,
+    modo_streaming: bool = False,
+    arquivo_mapeamento: Optional[str] = None,
+    rollups_departamento: Optional[Dict[str, pd.DataFrame]] = None
+) -> Optional[Tuple[pd.DataFrame, Dict[str, Any]]]:
+    """
+    Etapas 1 a 3 sobre todas as planilhas. Retorna (DataFrame consolidado, mapeamento) ou None.
+    Com `arquivo_mapeamento`, a Etapa 2 é substituída pelo mapeamento desse JSON (sem LLM).
+    `rollups_departamento`, se informado, recebe os totais por departamento calculados na consolidação.
+    """
+    with medir_etapa("leitura_esquemas"):
+        amostras_planilhas = ler_esquemas_planilhas(input_data_dir, nomes_planilhas)
+    if amostras_planilhas is None:
+        print("Pipeline interrompido: erro na leitura dos cabeçalhos das planilhas (Etapa 1).")
+        return None
 
     esquemas_originais = {
-        nome_df: list(df.columns) for nome_df, df in dataframes_brutos.items()
+        nome_df: list(df.columns) for nome_df, df in amostras_planilhas.items()
     }
-    print("\nChamando LLM para obter o mapeamento de colunas...")
-    mapeamento_colunas = obter_mapeamento_colunas(esquemas_originais)
+    if arquivo_mapeamento:
+        print(f"\nUsando o mapeamento de colunas de '{arquivo_mapeamento}' (Etapa 2 ignorada)...")
+        with medir_etapa("mapeamento_colunas"):
+            mapeamento_colunas = carregar_mapeamento_arquivo(arquivo_mapeamento, esquemas_originais)
+    else:
+        # Importado aqui: só o caminho com Etapa 2 precisa da pilha do LLM.
+        from src.agent_mapper import obter_mapeamento_colunas
+        print("\nObtendo o mapeamento de colunas (cache, heurística local ou LLM)...")
+        with medir_etapa("mapeamento_colunas"):
+            mapeamento_colunas = obter_mapeamento_colunas(
+                esquemas_originais,
+                forcar_atualizacao=forcar_atualizacao_mapeamento,
+                amostras=amostras_planilhas
+            )
 
     if mapeamento_colunas is None or not mapeamento_colunas : 
         print("Pipeline interrompido: erro ou nenhum mapeamento de colunas (Etapa 2).")
-        return
+        return None
+
+    colunas_por_planilha = definir_colunas_necessarias(mapeamento_colunas, esquemas_originais)
+    custos_pre_agregados = None
+    if modo_streaming:
+        # Só 'colaboradores' (limitado ao quadro de pessoal) é carregado inteiro; fornecedores são lidos em lotes.
+        with medir_etapa("carregamento_planilhas"):
+            dataframes_brutos = carregar_planilhas_entrada(input_data_dir, ["colaboradores.xlsx"], colunas_por_planilha)
+        with medir_etapa("agregacao_streaming"):
+            custos_pre_agregados = agregar_custos_em_streaming(
+                input_data_dir, nomes_planilhas, mapeamento_colunas, modo_compacto=modo_compacto
+            )
+        if custos_pre_agregados is None:
+            print("Pipeline interrompido: erro na agregação em streaming dos custos (Etapa 3).")
+            return None
+    else:
+        with medir_etapa("carregamento_planilhas"):
+            dataframes_brutos = carregar_planilhas_entrada(input_data_dir, nomes_planilhas, colunas_por_planilha)
+    if dataframes_brutos is None:
+        print("Pipeline interrompido: erro no carregamento dos dados (Etapa 1).")
+        return None
     
     print("\nMapeamento de Colunas Final Recebido em main.py:")
     print(json.dumps(mapeamento_colunas, indent=2, ensure_ascii=False))
 
-    df_final_calculado = consolidar_e_calcular_custos(dataframes_brutos, mapeamento_colunas)
+    with medir_etapa("consolidacao") as extras:
+        df_final_calculado = consolidar_e_calcular_custos(
+            dataframes_brutos, mapeamento_colunas, modo_compacto=modo_compacto,
+            custos_pre_agregados=custos_pre_agregados, rollups_departamento=rollups_departamento
+        )
+        extras["linhas"] = 0 if df_final_calculado is None else len(df_final_calculado)
+    if df_final_calculado is None:
+        return None
+    return df_final_calculado, mapeamento_colunas
+
+def run_pipeline(
+    forcar_atualizacao_mapeamento: bool = False,
+    modo_compacto: bool = False,
+    formatos_saida: Optional[List[str]] = None,
+    competencia: Optional[str] = None,
+    modo_streaming: bool = False,
+    modo_incremental: bool = False,
+    arquivo_mapeamento: Optional[str] = None,
+    registrar_historico: bool = False,
+    dividir_por_departamento: bool = False
+):
+    print("Iniciando Pipeline de Rateio de Custos (Completo)...")
+
+    project_root_dir = os.path.dirname(os.path.abspath(__file__))
+    input_data_dir = os.path.join(project_root_dir, 'data', 'input')
+    output_data_dir = os.path.join(project_root_dir, 'data', 'output') 
+    nome_base_relatorio = "Relatorio_Rateio_Custos"
+    
+    nomes_planilhas = list(NOMES_PLANILHAS_PADRAO)
+    rollups_departamento: Dict[str, pd.DataFrame] = {}
+    if modo_incremental:
+        with medir_etapa("consolidacao_incremental"):
+            resultado = consolidar_incremental(
+                input_data_dir, nomes_planilhas,
+                forcar_atualizacao_mapeamento=forcar_atualizacao_mapeamento,
+                modo_compacto=modo_compacto,
+                arquivo_mapeamento=arquivo_mapeamento
+            )
+    else:
+        resultado = consolidar_completo(
+            input_data_dir, nomes_planilhas,
+            forcar_atualizacao_mapeamento=forcar_atualizacao_mapeamento,
+            modo_compacto=modo_compacto,
+            modo_streaming=modo_streaming,
+            arquivo_mapeamento=arquivo_mapeamento,
+            rollups_departamento=rollups_departamento
+        )
+    df_final_calculado, mapeamento_colunas = resultado if resultado else (None, None)
+    if mapeamento_colunas and len(mapeamento_colunas) == len(nomes_planilhas):
+        salvar_ultimo_mapeamento(mapeamento_colunas)
 
     if df_final_calculado is None or df_final_calculado.empty:
         print("Pipeline interrompido: erro na consolidação ou cálculo de custos (Etapa 3).")
@@ -47,17 +145,159 @@ def run_pipeline():
     print("\nDataFrame Final Calculado (primeiras linhas):")
     print(df_final_calculado.head())
 
-    sucesso_relatorio = gerar_relatorio_excel(
-        df_final_calculado, 
-        mapeamento_colunas, 
-        output_data_dir, 
-        nome_arquivo_relatorio
-    )
+    with medir_etapa("geracao_saidas", perfilar=False):
+        sucesso_relatorio = gerar_saidas_relatorio(
+            df_final_calculado, 
+            mapeamento_colunas, 
+            output_data_dir, 
+            nome_base_relatorio,
+            formatos_saida or ["xlsx"],
+            competencia=competencia,
+            rollups=rollups_departamento or None,
+            dividir_por_departamento=dividir_por_departamento
+        )
+    if registrar_historico:
+        with medir_etapa("historico", perfilar=False):
+            sucesso_relatorio = bool(
+                registrar_no_historico(df_final_calculado, mapeamento_colunas, competencia=competencia)
+            ) and sucesso_relatorio
 
     if sucesso_relatorio:
         print("\nPipeline de Rateio de Custos concluído com SUCESSO!")
     else:
-        print("\nPipeline de Rateio de Custos concluído com ERROS na geração do relatório.")
+        print("\nPipeline de Rateio de Custos concluído com ERROS na geração das saídas.")
+
+def run_watch_mode(
+    forcar_atualizacao_mapeamento: bool = False,
+    modo_compacto: bool = False,
+    formatos_saida: Optional[List[str]] = None,
+    competencia: Optional[str] = None,
+    debounce_s: float = DEBOUNCE_PADRAO_S
+):
+    """Processo de longa duração: mantém os dados carregados e regenera as saídas a cada alteração em data/input."""
+    project_root_dir = os.path.dirname(os.path.abspath(__file__))
+    sessao = SessaoPipelineAquecida(
+        os.path.join(project_root_dir, 'data', 'input'),
+        os.path.join(project_root_dir, 'data', 'output'),
+        list(NOMES_PLANILHAS_PADRAO),
+        "Relatorio_Rateio_Custos",
+        formatos_saida or ["xlsx"],
+        competencia=competencia,
+        modo_compacto=modo_compacto
+    )
+    observar_diretorio(sessao, debounce_s=debounce_s, forcar_atualizacao_mapeamento=forcar_atualizacao_mapeamento)
 
 if __name__ == "__main__":
-    run_pipeline()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Pipeline de Rateio de Custos")
+    parser.add_argument(
+        "--atualizar-mapeamento", action="store_true",
+        help="Ignora o cache de mapeamento de colunas e consulta o LLM novamente."
+    )
+    parser.add_argument(
+        "--modo-compacto", action="store_true",
+        help="Valores em centavos inteiros, colunas categóricas e relatório de memória por etapa."
+    )
+    parser.add_argument(
+        "--formatos", default="xlsx",
+        help=f"Formatos de saída separados por vírgula ({', '.join(FORMATOS_SAIDA_DISPONIVEIS)}). Padrão: xlsx."
+    )
+    parser.add_argument(
+        "--competencia", default=None,
+        help="Competência (AAAA-MM) gravada nas saídas Parquet/CSV/SQLite/DuckDB. Padrão: mês atual."
+    )
+    parser.add_argument(
+        "--streaming", action="store_true",
+        help="Agrega os custos dos fornecedores lendo as planilhas em lotes (entradas maiores que a memória)."
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Reprocessa apenas as planilhas alteradas desde a última execução incremental."
+    )
+    parser.add_argument(
+        "--metricas", default=None, metavar="ARQUIVO",
+        help="Grava tempo, CPU e memória por etapa/planilha e latência/tokens do LLM como JSON lines em ARQUIVO."
+    )
+    parser.add_argument(
+        "--perfil", default=None, metavar="DIRETORIO",
+        help="Gera um perfil cProfile (<etapa>.prof) por etapa em DIRETORIO."
+    )
+    parser.add_argument(
+        "--tracemalloc", action="store_true",
+        help="Registra o pico de memória alocada pelo Python (tracemalloc) em cada etapa."
+    )
+    parser.add_argument(
+        "--lote", default=None, metavar="MANIFESTO",
+        help="Processa todos os jobs (empresas/competências) do manifesto JSON em um pool de processos."
+    )
+    parser.add_argument(
+        "--processos", type=int, default=None,
+        help="Número máximo de processos do modo lote. Padrão: núcleos disponíveis."
+    )
+    parser.add_argument(
+        "--observar", action="store_true",
+        help="Mantém os dados em memória e regenera as saídas a cada alteração nas planilhas de data/input."
+    )
+    parser.add_argument(
+        "--debounce", type=float, default=DEBOUNCE_PADRAO_S,
+        help=f"Segundos sem novas alterações antes de regenerar, no modo observação. Padrão: {DEBOUNCE_PADRAO_S}."
+    )
+    parser.add_argument(
+        "--mapeamento", default=None, metavar="ARQUIVO",
+        help="Usa o mapeamento de colunas do JSON em ARQUIVO e pula a Etapa 2 (sem cache, heurística ou LLM)."
+    )
+    parser.add_argument(
+        "--mapeamento-anterior", action="store_true",
+        help="Reutiliza o mapeamento completo da última execução e pula a Etapa 2."
+    )
+    parser.add_argument(
+        "--historico", action="store_true",
+        help="Acrescenta o consolidado da competência ao histórico de custos em data/historico/ (SQLite)."
+    )
+    parser.add_argument(
+        "--dividir-departamentos", action="store_true",
+        help="Além do relatório completo, gera um workbook XLSX por departamento (em paralelo)."
+    )
+    parser.add_argument(
+        "--servir", action="store_true",
+        help="Serve consultas por CPF e por departamento (HTTP em localhost) sobre a competência mais recente do histórico."
+    )
+    parser.add_argument(
+        "--porta", type=int, default=PORTA_PADRAO,
+        help=f"Porta do serviço de consultas. Padrão: {PORTA_PADRAO}."
+    )
+    args = parser.parse_args()
+    if args.mapeamento and args.mapeamento_anterior:
+        parser.error("use --mapeamento ou --mapeamento-anterior, não ambos.")
+    arquivo_mapeamento = caminho_ultimo_mapeamento() if args.mapeamento_anterior else args.mapeamento
+    if arquivo_mapeamento and (args.lote or args.observar):
+        parser.error("--mapeamento/--mapeamento-anterior não se aplicam aos modos lote e observação.")
+    configurar_metricas(args.metricas, args.perfil, args.tracemalloc)
+    formatos_saida = [f.strip() for f in args.formatos.split(",") if f.strip()]
+    if args.servir:
+        servir_consultas(porta=args.porta, competencia=args.competencia)
+    elif args.observar:
+        run_watch_mode(
+            forcar_atualizacao_mapeamento=args.atualizar_mapeamento,
+            modo_compacto=args.modo_compacto,
+            formatos_saida=formatos_saida,
+            competencia=args.competencia,
+            debounce_s=args.debounce
+        )
+    elif args.lote:
+        with medir_etapa("lote", perfilar=False):
+            executar_lote(args.lote, max_processos=args.processos, forcar_atualizacao_mapeamento=args.atualizar_mapeamento)
+    else:
+        with medir_etapa("pipeline", perfilar=False):
+            run_pipeline(
+                forcar_atualizacao_mapeamento=args.atualizar_mapeamento,
+                modo_compacto=args.modo_compacto,
+                formatos_saida=formatos_saida,
+                competencia=args.competencia,
+                modo_streaming=args.streaming,
+                modo_incremental=args.incremental,
+                arquivo_mapeamento=arquivo_mapeamento,
+                registrar_historico=args.historico,
+                dividir_por_departamento=args.dividir_departamentos
+            )
+    if args.metricas or args.perfil or args.tracemalloc:
+        imprimir_resumo_metricas()
\ No newline at end of file
@@ -1,25 +1,52 @@
 import os
 import json
 import time
+import asyncio
 import traceback
 from typing import Dict, List, Optional, Any
 
 from dotenv import load_dotenv
-import litellm
+
+from src.mapping_cache import (
+    carregar_cache_mapeamento, salvar_cache_mapeamento, aplicar_politica_expiracao,
+    buscar_mapeamento_em_cache, registrar_mapeamento_em_cache
+)
+from src.rate_limiter import LimitadorTaxa, calcular_espera_backoff
+from src.heuristic_mapper import mapear_colunas_heuristico, LIMIAR_CONFIANCA_HEURISTICA
+from src.metrics import registrar_evento
 
 load_dotenv()
 
+# Incrementar sempre que o prompt de mapeamento mudar, para invalidar o cache de mapeamentos.
+VERSAO_PROMPT_MAPEAMENTO = "v1"
+
+# Importado sob demanda por `importar_litellm`: o import leva segundos e é dispensável quando
+# o mapeamento vem do cache, da heurística local ou de um arquivo.
+litellm = None
+
+def importar_litellm():
+    """Importa o LiteLLM na primeira chamada que realmente precisa do LLM e o reaproveita depois."""
+    global litellm
+    if litellm is None:
+        import litellm as modulo_litellm
+        litellm = modulo_litellm
+    return litellm
+
+def obter_nome_modelo_litellm() -> str:
+    """Retorna o nome do modelo no formato do LiteLLM, sem exigir a API key."""
+    return f"groq/{os.getenv('GROQ_MODEL_NAME', 'llama3-8b-8192')}"
+
 def configurar_llm_direct() -> Optional[Dict[str, str]]:
     """Carrega configuração do LLM (modelo e API key) do ambiente."""
     print("[configurar_llm_direct] Carregando configuração do LLM...")
     api_key = os.getenv("GROQ_API_KEY")
-    model_name_from_env = os.getenv("GROQ_MODEL_NAME", "llama3-8b-8192") 
 
     if not api_key:
         print("[configurar_llm_direct] ERRO CRÍTICO: GROQ_API_KEY não encontrada. Verifique o .env.")
         return None
     
-    litellm_model_name = f"groq/{model_name_from_env}"
+    litellm_model_name = obter_nome_modelo_litellm()
+    importar_litellm()
 
     print(f"[configurar_llm_direct] Configuração LLM: Modelo='{litellm_model_name}', API Key Carregada (parcial): {api_key[:5]}...")
     return {"model": litellm_model_name, "api_key": api_key}
@@ -58,16 +85,14 @@ def processar_mapeamento_identificado(
     print(f"{func_prefix} Mapeamento para '{nome_planilha}' processado: {json.dumps(result_dict)}")
     return result_dict
 
-def obter_mapeamento_para_planilha_unica(
-    llm_config: Dict[str, str], 
+MAX_TOKENS_RESPOSTA_MAPEAMENTO = 300
+MAX_TENTATIVAS_RATE_LIMIT = int(os.getenv("LLM_MAX_TENTATIVAS_RATE_LIMIT", "5"))
+
+def montar_mensagens_mapeamento(
     nome_planilha_atual: str, 
     colunas_da_planilha_atual: List[str]
-) -> Optional[Dict[str, Any]]:
-    """
-    Envia um prompt ao LLM para mapear uma única planilha e espera um JSON com os nomes das colunas.
-    """
-    func_prefix = "[obter_mapeamento_para_planilha_unica]"
-    
+) -> List[Dict[str, str]]:
+    """Monta as mensagens (system + user) do prompt de mapeamento de uma única planilha."""
     system_prompt = """Você é um assistente especialista em análise de dados. Sua tarefa é identificar colunas específicas em um esquema de planilha fornecido."""
     
     user_prompt = f"""
@@ -99,111 +124,444 @@ def obter_mapeamento_para_planilha_unica(
     Use sua melhor capacidade semântica para encontrar as colunas corretas, mesmo que os nomes tenham pequenas variações (ex: 'Assinante' para nome, 'Documento' para CPF).
     """
 
-    messages = [
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_prompt}
     ]
 
+def extrair_json_resposta(llm_response_content: str) -> Any:
+    """Remove cercas de código markdown (```json ... ```) e decodifica o JSON da resposta."""
+    if llm_response_content.startswith("```json"):
+        llm_response_content = llm_response_content[len("```json"):].strip()
+    if llm_response_content.endswith("```"):
+        llm_response_content = llm_response_content[:-len("```")].strip()
+    return json.loads(llm_response_content)
+
+def interpretar_resposta_mapeamento(
+    response: Any,
+    nome_planilha_atual: str,
+    colunas_da_planilha_atual: List[str]
+) -> Optional[Dict[str, Any]]:
+    """
+    Decodifica a resposta do LLM para uma planilha e a valida com `validar_identificacao_colunas`
+    (chaves presentes e colunas existentes no esquema) antes de convertê-la no mapeamento padronizado.
+    """
+    func_prefix = "[interpretar_resposta_mapeamento]"
+    if response.choices and response.choices[0].message and response.choices[0].message.content:
+        llm_response_content = response.choices[0].message.content.strip()
+        print(f"{func_prefix} Resposta bruta do LLM para '{nome_planilha_atual}': '{llm_response_content}'")
+        
+        try:
+            identificacao_cols = extrair_json_resposta(llm_response_content)
+            return validar_identificacao_colunas(nome_planilha_atual, identificacao_cols, colunas_da_planilha_atual)
+        except json.JSONDecodeError as e:
+            print(f"{func_prefix} ERRO: Falha ao decodificar JSON da resposta do LLM para '{nome_planilha_atual}': {e}")
+            print(f"String que causou o erro: '{llm_response_content}'")
+            return None
+    else:
+        print(f"{func_prefix} ERRO: Resposta do LLM malformada ou vazia para '{nome_planilha_atual}'. Detalhes: {response}")
+        return None
+
+def estimar_tokens_mensagens(messages: List[Dict[str, str]], max_tokens_resposta: int) -> int:
+    """Estimativa conservadora (~4 caracteres por token) do consumo de uma chamada."""
+    return sum(len(m["content"]) for m in messages) // 4 + max_tokens_resposta
+
+def registrar_chamada_llm(
+    modo: str,
+    planilhas: List[str],
+    tentativa: int,
+    latencia_s: float,
+    status: str,
+    response: Any = None,
+    espera_limitador_s: float = 0.0,
+    espera_backoff_s: float = 0.0
+) -> None:
+    """Registra latência, esperas e tokens (informados pela API em `response.usage`) de uma chamada ao LLM."""
+    uso = getattr(response, "usage", None)
+    registrar_evento(
+        "llm_chamada", modo=modo, planilhas=planilhas, tentativa=tentativa, status=status,
+        latencia_s=round(latencia_s, 6), espera_limitador_s=round(espera_limitador_s, 6),
+        espera_backoff_s=round(espera_backoff_s, 6),
+        prompt_tokens=getattr(uso, "prompt_tokens", None),
+        completion_tokens=getattr(uso, "completion_tokens", None),
+        total_tokens=getattr(uso, "total_tokens", None)
+    )
+
+def obter_mapeamento_para_planilha_unica(
+    llm_config: Dict[str, str], 
+    nome_planilha_atual: str, 
+    colunas_da_planilha_atual: List[str]
+) -> Optional[Dict[str, Any]]:
+    """
+    Envia um prompt ao LLM para mapear uma única planilha e espera um JSON com os nomes das colunas.
+    """
+    func_prefix = "[obter_mapeamento_para_planilha_unica]"
+    importar_litellm()
+    messages = montar_mensagens_mapeamento(nome_planilha_atual, colunas_da_planilha_atual)
+
     print(f"{func_prefix} Enviando prompt para LLM para planilha '{nome_planilha_atual}'...")
     
+    inicio_chamada = time.perf_counter()
     try:
         response = litellm.completion(
             model=llm_config["model"],
             messages=messages,
             api_key=llm_config["api_key"],
             temperature=0.0,
-            max_tokens=300, 
+            max_tokens=MAX_TOKENS_RESPOSTA_MAPEAMENTO, 
             timeout=30
         )
-        
-        if response.choices and response.choices[0].message and response.choices[0].message.content:
-            llm_response_content = response.choices[0].message.content.strip()
-            print(f"{func_prefix} Resposta bruta do LLM para '{nome_planilha_atual}': '{llm_response_content}'")
-            
-            try:
-                if llm_response_content.startswith("```json"):
-                    llm_response_content = llm_response_content[len("```json"):].strip()
-                if llm_response_content.endswith("```"):
-                    llm_response_content = llm_response_content[:-len("```")].strip()
-
-                identificacao_cols = json.loads(llm_response_content)
-                
-                chaves_necessarias = ["col_nome_identificada", "col_cpf_identificada", "col_custo_identificada"]
-                if all(key in identificacao_cols for key in chaves_necessarias):
-                    return processar_mapeamento_identificado(
-                        nome_planilha=nome_planilha_atual,
-                        col_original_nome=identificacao_cols["col_nome_identificada"],
-                        col_original_cpf=identificacao_cols["col_cpf_identificada"],
-                        col_original_custo_principal=identificacao_cols["col_custo_identificada"]
-                    )
-                else:
-                    print(f"{func_prefix} ERRO: JSON do LLM não contém todas as chaves esperadas para '{nome_planilha_atual}'. Recebido: {identificacao_cols}")
-                    return None
-            except json.JSONDecodeError as e:
-                print(f"{func_prefix} ERRO: Falha ao decodificar JSON da resposta do LLM para '{nome_planilha_atual}': {e}")
-                print(f"String que causou o erro: '{llm_response_content}'")
-                return None
-        else:
-            print(f"{func_prefix} ERRO: Resposta do LLM malformada ou vazia para '{nome_planilha_atual}'. Detalhes: {response}")
-            return None
+        registrar_chamada_llm("individual", [nome_planilha_atual], 1, time.perf_counter() - inicio_chamada, "ok", response)
+        return interpretar_resposta_mapeamento(response, nome_planilha_atual, colunas_da_planilha_atual)
             
     except litellm.exceptions.RateLimitError as rle:
+        registrar_chamada_llm("individual", [nome_planilha_atual], 1, time.perf_counter() - inicio_chamada, "rate_limit")
         print(f"{func_prefix} ERRO DE RATE LIMIT da API Groq para '{nome_planilha_atual}': {rle}")
         raise 
     except Exception as e:
+        registrar_chamada_llm("individual", [nome_planilha_atual], 1, time.perf_counter() - inicio_chamada, "erro")
         print(f"{func_prefix} ERRO CRÍTICO em litellm.completion para '{nome_planilha_atual}': {type(e).__name__} - {e}")
         print(traceback.format_exc())
         raise
 
-def obter_mapeamento_colunas(esquemas_originais: Dict[str, List[str]]) -> Optional[Dict]:
+async def obter_mapeamento_para_planilha_unica_async(
+    llm_config: Dict[str, str], 
+    nome_planilha_atual: str, 
+    colunas_da_planilha_atual: List[str],
+    limitador: LimitadorTaxa
+) -> Optional[Dict[str, Any]]:
     """
-    Orquestra o mapeamento de colunas iterando sobre cada planilha e chamando o LLM.
+    Versão assíncrona de `obter_mapeamento_para_planilha_unica`. Respeita o limitador de taxa
+    compartilhado e, em caso de rate limit, repete a chamada com backoff exponencial com jitter.
     """
-    print("\n--- Iniciando Etapa 2: Mapeamento de Colunas (Loop Direto com LiteLLM) ---")
-    
-    llm_config = configurar_llm_direct()
-    if not llm_config:
-        print("  [ERRO CRÍTICO] Configuração do LLM falhou. Mapeamento não pode prosseguir.")
-        print("--- Etapa 2 Falhou ---")
+    func_prefix = "[obter_mapeamento_para_planilha_unica_async]"
+    importar_litellm()
+    messages = montar_mensagens_mapeamento(nome_planilha_atual, colunas_da_planilha_atual)
+    tokens_estimados = estimar_tokens_mensagens(messages, MAX_TOKENS_RESPOSTA_MAPEAMENTO)
+
+    for tentativa in range(MAX_TENTATIVAS_RATE_LIMIT):
+        inicio_espera = time.perf_counter()
+        await limitador.adquirir(tokens_estimados)
+        espera_limitador = time.perf_counter() - inicio_espera
+        print(f"{func_prefix} Enviando prompt para LLM para planilha '{nome_planilha_atual}' (tentativa {tentativa + 1})...")
+        inicio_chamada = time.perf_counter()
+        try:
+            response = await litellm.acompletion(
+                model=llm_config["model"],
+                messages=messages,
+                api_key=llm_config["api_key"],
+                temperature=0.0,
+                max_tokens=MAX_TOKENS_RESPOSTA_MAPEAMENTO, 
+                timeout=30
+            )
+        except litellm.exceptions.RateLimitError as rle:
+            espera = calcular_espera_backoff(tentativa)
+            registrar_chamada_llm("individual", [nome_planilha_atual], tentativa + 1, time.perf_counter() - inicio_chamada,
+                                  "rate_limit", espera_limitador_s=espera_limitador, espera_backoff_s=espera)
+            print(f"{func_prefix} RATE LIMIT para '{nome_planilha_atual}': {rle}. Nova tentativa em {espera:.1f}s.")
+            await asyncio.sleep(espera)
+            continue
+        except Exception as e:
+            registrar_chamada_llm("individual", [nome_planilha_atual], tentativa + 1, time.perf_counter() - inicio_chamada,
+                                  "erro", espera_limitador_s=espera_limitador)
+            print(f"{func_prefix} ERRO CRÍTICO em litellm.acompletion para '{nome_planilha_atual}': {type(e).__name__} - {e}")
+            print(traceback.format_exc())
+            raise
+
+        registrar_chamada_llm("individual", [nome_planilha_atual], tentativa + 1, time.perf_counter() - inicio_chamada,
+                              "ok", response, espera_limitador_s=espera_limitador)
+        uso = getattr(response, "usage", None)
+        if uso is not None and getattr(uso, "total_tokens", None):
+            limitador.ajustar_tokens(tokens_estimados, uso.total_tokens)
+        return interpretar_resposta_mapeamento(response, nome_planilha_atual, colunas_da_planilha_atual)
+
+    print(f"{func_prefix} ERRO: Rate limit persistente para '{nome_planilha_atual}' após {MAX_TENTATIVAS_RATE_LIMIT} tentativas.")
+    return None
+
+async def mapear_planilhas_concorrente(
+    llm_config: Dict[str, str],
+    esquemas: Dict[str, List[str]],
+    limitador: Optional[LimitadorTaxa] = None
+) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Dispara o mapeamento de todas as planilhas concorrentemente. A vazão é controlada pelo
+    limitador de taxa (RPM/TPM), e a falha de uma planilha não interrompe as demais.
+    """
+    limitador = limitador or LimitadorTaxa()
+    nomes = list(esquemas.keys())
+    resultados = await asyncio.gather(
+        *(obter_mapeamento_para_planilha_unica_async(llm_config, nome, esquemas[nome], limitador) for nome in nomes),
+        return_exceptions=True
+    )
+    mapeamentos: Dict[str, Optional[Dict[str, Any]]] = {}
+    for nome, resultado in zip(nomes, resultados):
+        if isinstance(resultado, Exception):
+            print(f"  [ERRO INESPERADO] ao processar '{nome}': {type(resultado).__name__} - {resultado}")
+            mapeamentos[nome] = None
+        else:
+            mapeamentos[nome] = resultado
+    return mapeamentos
+
+def montar_mensagens_mapeamento_lote(esquemas: Dict[str, List[str]]) -> List[Dict[str, str]]:
+    """Monta um único prompt que pede o mapeamento de todas as planilhas de `esquemas` de uma vez."""
+    system_prompt = """Você é um assistente especialista em análise de dados. Sua tarefa é identificar colunas específicas em esquemas de planilhas fornecidos."""
+
+    descricao_esquemas = "\n".join(f"    - '{nome}': {colunas}" for nome, colunas in esquemas.items())
+    user_prompt = f"""
+    Analise os esquemas das planilhas abaixo (nome da planilha: lista de colunas):
+{descricao_esquemas}
+
+    Para CADA planilha, você DEVE identificar exatamente três colunas da lista dela:
+    1.  A coluna que representa o NOME COMPLETO do colaborador.
+    2.  A coluna que representa o CPF (documento de identificação fiscal) do colaborador.
+    3.  A coluna principal de CUSTO MONETÁRIO a ser extraída desta planilha específica.
+        Lembre-se das dicas de coluna de custo:
+        - Para 'colaboradores', a coluna de custo é 'Salario'.
+        - Para 'github', a coluna de custo é 'Valor Mensal'.
+        - Para 'gympass', a coluna de custo é 'Valor Mensal'.
+        - Para 'google_workspace', a coluna de custo é 'Valor Mensal'.
+        - Para 'unimed', a coluna de custo é 'Total'.
+
+    Responda APENAS com um objeto JSON cujas chaves são os nomes das planilhas e cujos valores são objetos com as chaves:
+    - "col_nome_identificada"
+    - "col_cpf_identificada"
+    - "col_custo_identificada"
+
+    Exemplo de formato de resposta JSON esperado (APENAS O JSON):
+    {{
+      "nome_da_planilha": {{
+        "col_nome_identificada": "Nome Original da Coluna Nome",
+        "col_cpf_identificada": "Nome Original da Coluna CPF",
+        "col_custo_identificada": "Nome Original da Coluna Custo"
+      }}
+    }}
+
+    Use sua melhor capacidade semântica para encontrar as colunas corretas, mesmo que os nomes tenham pequenas variações (ex: 'Assinante' para nome, 'Documento' para CPF).
+    """
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def validar_identificacao_colunas(
+    nome_planilha: str,
+    identificacao_cols: Any,
+    colunas_da_planilha: List[str]
+) -> Optional[Dict[str, Any]]:
+    """
+    Valida a identificação de colunas de uma planilha (chaves presentes e colunas existentes no esquema)
+    e, se válida, a converte via `processar_mapeamento_identificado`.
+    """
+    func_prefix = "[validar_identificacao_colunas]"
+    chaves_necessarias = ["col_nome_identificada", "col_cpf_identificada", "col_custo_identificada"]
+    if not isinstance(identificacao_cols, dict) or not all(key in identificacao_cols for key in chaves_necessarias):
+        print(f"{func_prefix} ERRO: Identificação incompleta para '{nome_planilha}'. Recebido: {identificacao_cols}")
         return None
+    colunas_existentes = {str(c) for c in colunas_da_planilha}
+    inexistentes = [identificacao_cols[k] for k in chaves_necessarias if str(identificacao_cols[k]) not in colunas_existentes]
+    if inexistentes:
+        print(f"{func_prefix} ERRO: Colunas {inexistentes} não existem em '{nome_planilha}'.")
+        return None
+    resultado = processar_mapeamento_identificado(
+        nome_planilha=nome_planilha,
+        col_original_nome=identificacao_cols["col_nome_identificada"],
+        col_original_cpf=identificacao_cols["col_cpf_identificada"],
+        col_original_custo_principal=identificacao_cols["col_custo_identificada"]
+    )
+    return None if "erro" in resultado else resultado
+
+async def obter_mapeamento_lote_async(
+    llm_config: Dict[str, str],
+    esquemas: Dict[str, List[str]],
+    limitador: LimitadorTaxa
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Mapeia todas as planilhas de `esquemas` em uma única chamada ao LLM. Retorna apenas as planilhas
+    cujo mapeamento passou na validação; as demais ficam de fora para serem reprocessadas individualmente.
+    """
+    func_prefix = "[obter_mapeamento_lote_async]"
+    importar_litellm()
+    messages = montar_mensagens_mapeamento_lote(esquemas)
+    max_tokens_resposta = MAX_TOKENS_RESPOSTA_MAPEAMENTO + 100 * len(esquemas)
+    tokens_estimados = estimar_tokens_mensagens(messages, max_tokens_resposta)
+
+    response = None
+    planilhas = list(esquemas)
+    for tentativa in range(MAX_TENTATIVAS_RATE_LIMIT):
+        inicio_espera = time.perf_counter()
+        await limitador.adquirir(tokens_estimados)
+        espera_limitador = time.perf_counter() - inicio_espera
+        print(f"{func_prefix} Enviando prompt em lote para {len(esquemas)} planilha(s) (tentativa {tentativa + 1})...")
+        inicio_chamada = time.perf_counter()
+        try:
+            response = await litellm.acompletion(
+                model=llm_config["model"],
+                messages=messages,
+                api_key=llm_config["api_key"],
+                temperature=0.0,
+                max_tokens=max_tokens_resposta,
+                timeout=60
+            )
+            registrar_chamada_llm("lote", planilhas, tentativa + 1, time.perf_counter() - inicio_chamada,
+                                  "ok", response, espera_limitador_s=espera_limitador)
+            break
+        except litellm.exceptions.RateLimitError as rle:
+            espera = calcular_espera_backoff(tentativa)
+            registrar_chamada_llm("lote", planilhas, tentativa + 1, time.perf_counter() - inicio_chamada,
+                                  "rate_limit", espera_limitador_s=espera_limitador, espera_backoff_s=espera)
+            print(f"{func_prefix} RATE LIMIT no lote: {rle}. Nova tentativa em {espera:.1f}s.")
+            await asyncio.sleep(espera)
+        except Exception as e:
+            registrar_chamada_llm("lote", planilhas, tentativa + 1, time.perf_counter() - inicio_chamada,
+                                  "erro", espera_limitador_s=espera_limitador)
+            print(f"{func_prefix} ERRO em litellm.acompletion no lote: {type(e).__name__} - {e}")
+            return {}
+
+    if response is None:
+        print(f"{func_prefix} ERRO: Rate limit persistente no lote após {MAX_TENTATIVAS_RATE_LIMIT} tentativas.")
+        return {}
+    uso = getattr(response, "usage", None)
+    if uso is not None and getattr(uso, "total_tokens", None):
+        limitador.ajustar_tokens(tokens_estimados, uso.total_tokens)
+
+    if not (response.choices and response.choices[0].message and response.choices[0].message.content):
+        print(f"{func_prefix} ERRO: Resposta do LLM malformada ou vazia para o lote. Detalhes: {response}")
+        return {}
+    llm_response_content = response.choices[0].message.content.strip()
+    print(f"{func_prefix} Resposta bruta do LLM para o lote: '{llm_response_content}'")
+    try:
+        identificacoes = extrair_json_resposta(llm_response_content)
+    except json.JSONDecodeError as e:
+        print(f"{func_prefix} ERRO: Falha ao decodificar JSON da resposta do lote: {e}")
+        return {}
+    if not isinstance(identificacoes, dict):
+        print(f"{func_prefix} ERRO: Resposta do lote não é um objeto JSON. Recebido: {identificacoes}")
+        return {}
+
+    mapeamentos: Dict[str, Dict[str, Any]] = {}
+    for nome_planilha, colunas in esquemas.items():
+        mapeamento = validar_identificacao_colunas(nome_planilha, identificacoes.get(nome_planilha), colunas)
+        if mapeamento:
+            mapeamentos[nome_planilha] = mapeamento
+    return mapeamentos
+
+async def mapear_planilhas_em_lote(
+    llm_config: Dict[str, str],
+    esquemas: Dict[str, List[str]],
+    limitador: Optional[LimitadorTaxa] = None
+) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Mapeia todas as planilhas em uma única chamada e recorre a chamadas individuais (concorrentes)
+    apenas para as planilhas que falharam na validação do lote.
+    """
+    limitador = limitador or LimitadorTaxa()
+    mapeamentos: Dict[str, Optional[Dict[str, Any]]] = dict(
+        await obter_mapeamento_lote_async(llm_config, esquemas, limitador)
+    )
+    esquemas_falhos = {nome: colunas for nome, colunas in esquemas.items() if nome not in mapeamentos}
+    if esquemas_falhos:
+        print(f"[mapear_planilhas_em_lote] {len(esquemas_falhos)} planilha(s) sem mapeamento válido no lote. "
+              f"Recorrendo a chamadas individuais: {list(esquemas_falhos)}")
+        mapeamentos.update(await mapear_planilhas_concorrente(llm_config, esquemas_falhos, limitador))
+    return mapeamentos
+
+def obter_mapeamento_colunas(
+    esquemas_originais: Dict[str, List[str]],
+    usar_cache: bool = True,
+    forcar_atualizacao: bool = False,
+    modo_lote: bool = True,
+    amostras: Optional[Dict[str, Any]] = None,
+    usar_heuristica: bool = True
+) -> Optional[Dict]:
+    """
+    Orquestra o mapeamento de colunas. Esquemas já mapeados anteriormente (mesmas colunas, modelo e
+    versão do prompt) são servidos do cache em disco, sem chamada de rede nem espera; `forcar_atualizacao`
+    ignora o cache e o regrava. Os demais passam primeiro pelo mapeador heurístico local (cabeçalhos e,
+    se houver `amostras` — DataFrames por planilha —, formato dos valores), e só os esquemas ambíguos
+    vão ao LLM: com `modo_lote`, todas as planilhas pendentes são mapeadas em uma única chamada;
+    caso contrário (ou para as que falharem no lote), o LLM é consultado concorrentemente, uma chamada
+    por planilha.
+    """
+    print("\n--- Iniciando Etapa 2: Mapeamento de Colunas (LiteLLM Assíncrono) ---")
 
     mapeamento_final_agregado: Dict[str, Any] = {}
     nomes_planilhas_processadas = list(esquemas_originais.keys())
-    
-    ATRASO_ENTRE_CHAMADAS_SEGUNDOS = 10 
+    modelo = obter_nome_modelo_litellm()
 
-    for i, (nome_planilha, colunas_planilha) in enumerate(esquemas_originais.items()):
-        print(f"\n[obter_mapeamento_colunas] Processando planilha {i+1}/{len(esquemas_originais)}: '{nome_planilha}'...")
-        
-        if i > 0: 
-            print(f"Aguardando {ATRASO_ENTRE_CHAMADAS_SEGUNDOS} segundos para evitar rate limit...")
-            time.sleep(ATRASO_ENTRE_CHAMADAS_SEGUNDOS)
-        
-        try:
-            mapeamento_parcial = obter_mapeamento_para_planilha_unica(
-                llm_config, 
-                nome_planilha, 
-                colunas_planilha
+    cache: Dict[str, Any] = {}
+    if usar_cache:
+        cache = carregar_cache_mapeamento()
+        removidas = aplicar_politica_expiracao(cache)
+        if removidas:
+            print(f"[obter_mapeamento_colunas] {removidas} entrada(s) expirada(s) removida(s) do cache.")
+
+    esquemas_pendentes: Dict[str, List[str]] = {}
+    for nome_planilha, colunas_planilha in esquemas_originais.items():
+        mapeamento_em_cache = None
+        if usar_cache and not forcar_atualizacao:
+            mapeamento_em_cache = buscar_mapeamento_em_cache(
+                cache, nome_planilha, colunas_planilha, modelo, VERSAO_PROMPT_MAPEAMENTO
             )
-            
+        if mapeamento_em_cache:
+            mapeamento_final_agregado.update(mapeamento_em_cache)
+            print(f"[obter_mapeamento_colunas] Mapeamento para '{nome_planilha}' obtido do cache.")
+            registrar_evento("mapeamento", planilha=nome_planilha, origem="cache")
+            continue
+
+        if usar_heuristica:
+            amostra = (amostras or {}).get(nome_planilha)
+            identificacao, confianca = mapear_colunas_heuristico(nome_planilha, colunas_planilha, amostra)
+            if identificacao and confianca >= LIMIAR_CONFIANCA_HEURISTICA:
+                mapeamento_heuristico = validar_identificacao_colunas(nome_planilha, identificacao, colunas_planilha)
+                if mapeamento_heuristico:
+                    mapeamento_final_agregado.update(mapeamento_heuristico)
+                    print(f"[obter_mapeamento_colunas] Mapeamento para '{nome_planilha}' obtido pela heurística local "
+                          f"(confiança {confianca:.2f}).")
+                    registrar_evento("mapeamento", planilha=nome_planilha, origem="heuristica", confianca=round(confianca, 4))
+                    continue
+            print(f"[obter_mapeamento_colunas] Heurística local inconclusiva para '{nome_planilha}' "
+                  f"(confiança {confianca:.2f}). Encaminhando ao LLM.")
+
+        esquemas_pendentes[nome_planilha] = colunas_planilha
+
+    if esquemas_pendentes:
+        llm_config = configurar_llm_direct()
+        if not llm_config:
+            print("  [ERRO CRÍTICO] Configuração do LLM falhou. Mapeamento não pode prosseguir.")
+            print("--- Etapa 2 Falhou ---")
+            if usar_cache:
+                salvar_cache_mapeamento(cache)
+            return mapeamento_final_agregado or None
+
+        if modo_lote and len(esquemas_pendentes) > 1:
+            print(f"[obter_mapeamento_colunas] Mapeando {len(esquemas_pendentes)} planilha(s) via LLM em lote...")
+            resultados = asyncio.run(mapear_planilhas_em_lote(llm_config, esquemas_pendentes))
+        else:
+            print(f"[obter_mapeamento_colunas] Mapeando {len(esquemas_pendentes)} planilha(s) via LLM concorrentemente...")
+            resultados = asyncio.run(mapear_planilhas_concorrente(llm_config, esquemas_pendentes))
+
+        for nome_planilha, mapeamento_parcial in resultados.items():
             if mapeamento_parcial:
                 if "erro" in mapeamento_parcial: 
                     print(f"  Erro ao processar mapeamento para '{nome_planilha}': {mapeamento_parcial['erro']}")
                 else:
                     mapeamento_final_agregado.update(mapeamento_parcial)
+                    if usar_cache:
+                        registrar_mapeamento_em_cache(
+                            cache, nome_planilha, esquemas_pendentes[nome_planilha], modelo,
+                            VERSAO_PROMPT_MAPEAMENTO, mapeamento_parcial
+                        )
                     print(f"Mapeamento para '{nome_planilha}' agregado com sucesso.")
+                    registrar_evento("mapeamento", planilha=nome_planilha, origem="llm")
             else:
                 print(f"  Não foi possível obter mapeamento para '{nome_planilha}'.")
 
-        except litellm.exceptions.RateLimitError:
-             print(f"  [RATE LIMIT] Atingido para '{nome_planilha}'. Interrompendo o processo de mapeamento.")
-             break 
-        except Exception as e:
-            print(f"  [ERRO INESPERADO] ao processar '{nome_planilha}': {type(e).__name__} - {e}")
-            print(f"  Continuando para a próxima planilha, se houver.")
+    if usar_cache:
+        salvar_cache_mapeamento(cache)
             
     if len(mapeamento_final_agregado) == len(nomes_planilhas_processadas):
-        print("\n--- Etapa 2 Concluída com Sucesso (Mapeamento Direto com LiteLLM) ---")
+        print("\n--- Etapa 2 Concluída com Sucesso (LiteLLM Assíncrono) ---")
     else:
         print(f"\n--- Etapa 2 Concluída com Mapeamento Parcial ({len(mapeamento_final_agregado)}/{len(nomes_planilhas_processadas)} planilhas) ---")
     
@@ -218,9 +576,8 @@ def obter_mapeamento_colunas(esquemas_originais: Dict[str, List[str]]) -> Option
         print("Nenhuma planilha foi mapeada com sucesso.")
         return None
 
-
 if __name__ == '__main__':
-    print("Executando teste direto de agent_mapper.py (Loop Direto com LiteLLM)...")
+    print("Executando teste direto de agent_mapper.py (LiteLLM Assíncrono)...")
     esquemas_teste = {
         'colaboradores': ['Nome', 'CPF', 'Departamento', 'Salario'],
         'github': ['Assinante', 'Documento', 'Data Ativacao', 'Copilot', 'Licença', 'Valor Mensal'],
@@ -236,6 +593,6 @@ if __name__ == '__main__':
         print("\nIniciando teste da função obter_mapeamento_colunas com esquemas de teste...")
         mapeamento = obter_mapeamento_colunas(esquemas_teste)
         if mapeamento and len(mapeamento) > 0 :
-            print("\nResultado do teste de mapeamento (Loop Direto com LiteLLM): OK")
+            print("\nResultado do teste de mapeamento (LiteLLM Assíncrono): OK")
         else:
-            print("\nTeste de mapeamento (Loop Direto com LiteLLM) falhou ou não retornou mapeamentos.")
\ No newline at end of file
+            print("\nTeste de mapeamento (LiteLLM Assíncrono) falhou ou não retornou mapeamentos.")
\ No newline at end of file
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Any, Tuple
+
+import pandas as pd
+
+from src.data_handler import (
+    ler_esquemas_planilhas, definir_colunas_necessarias, carregar_planilhas_entrada,
+    consolidar_e_calcular_custos, agregar_custos_em_streaming, NOMES_PLANILHAS_PADRAO
+)
+from src.report_generator import gerar_saidas_relatorio
+
+NOME_BASE_RELATORIO_LOTE = "Relatorio_Rateio_Custos"
+ARQUIVO_RESUMO_LOTE = "resumo_lote.json"
+
+
+def carregar_manifesto(caminho_manifesto: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Lê o manifesto do modo lote: um JSON com `jobs` (lista) e, opcionalmente, `padrao` (valores comuns).
+    Cada job tem `nome` e `diretorio_input` e pode definir `competencia`, `diretorio_output`, `formatos`,
+    `planilhas`, `modo_compacto` e `modo_streaming`. Caminhos relativos partem da pasta do manifesto.
+    Retorna a lista de jobs já completados com os valores padrão, ou None se o manifesto for inválido.
+    """
+    func_prefix = "[carregar_manifesto]"
+    try:
+        with open(caminho_manifesto, "r", encoding="utf-8") as f:
+            manifesto = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"{func_prefix} ERRO: Não foi possível ler o manifesto '{caminho_manifesto}': {e}")
+        return None
+
+    base = os.path.dirname(os.path.abspath(caminho_manifesto))
+    padrao = {
+        "formatos": ["xlsx"], "planilhas": list(NOMES_PLANILHAS_PADRAO),
+        "modo_compacto": False, "modo_streaming": False, "competencia": None,
+        "diretorio_output": "output",
+        **manifesto.get("padrao", {}),
+    }
+    jobs: List[Dict[str, Any]] = []
+    nomes_vistos = set()
+    for i, job in enumerate(manifesto.get("jobs", [])):
+        if not job.get("nome") or not job.get("diretorio_input"):
+            print(f"{func_prefix} ERRO: Job #{i + 1} sem 'nome' ou 'diretorio_input': {job}")
+            return None
+        if job["nome"] in nomes_vistos:
+            print(f"{func_prefix} ERRO: Nome de job repetido: '{job['nome']}'.")
+            return None
+        nomes_vistos.add(job["nome"])
+        completo = {**padrao, **job}
+        completo["diretorio_input"] = os.path.join(base, completo["diretorio_input"])
+        # Sem diretório próprio, cada job grava em uma subpasta com o seu nome.
+        if "diretorio_output" in job:
+            completo["diretorio_output"] = os.path.join(base, job["diretorio_output"])
+        else:
+            completo["diretorio_output"] = os.path.join(base, padrao["diretorio_output"], job["nome"])
+        jobs.append(completo)
+    if not jobs:
+        print(f"{func_prefix} ERRO: O manifesto não contém jobs.")
+        return None
+    return jobs
+
+
+def _ler_esquemas_job(job: Dict[str, Any]) -> Optional[Dict[str, pd.DataFrame]]:
+    return ler_esquemas_planilhas(job["diretorio_input"], job["planilhas"])
+
+
+def mapear_esquemas_distintos(
+    amostras_por_job: Dict[str, Dict[str, pd.DataFrame]],
+    forcar_atualizacao_mapeamento: bool = False
+) -> Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]]:
+    """
+    Mapeia uma única vez cada esquema distinto (planilha, colunas) encontrado entre os jobs, no processo
+    principal, com o cache de mapeamento e o cliente LLM compartilhados. As variantes são agrupadas em
+    rodadas de no máximo um esquema por planilha, e cada rodada é uma chamada a `obter_mapeamento_colunas`
+    (cache → heurística → uma chamada em lote ao LLM). Retorna o mapeamento por (planilha, colunas).
+    """
+    variantes: Dict[str, Dict[Tuple[str, ...], pd.DataFrame]] = {}
+    for amostras in amostras_por_job.values():
+        for nome_planilha, amostra in amostras.items():
+            variantes.setdefault(nome_planilha, {}).setdefault(tuple(amostra.columns), amostra)
+
+    total_variantes = sum(len(v) for v in variantes.values())
+    print(f"[mapear_esquemas_distintos] {total_variantes} esquema(s) distinto(s) entre {len(amostras_por_job)} job(s).")
+    mapeados: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]] = {}
+    listas_variantes = {nome: list(v.items()) for nome, v in variantes.items()}
+    for rodada in range(max(len(v) for v in listas_variantes.values())):
+        esquemas_rodada: Dict[str, List[str]] = {}
+        amostras_rodada: Dict[str, pd.DataFrame] = {}
+        for nome_planilha, lista in listas_variantes.items():
+            if rodada < len(lista):
+                colunas, amostra = lista[rodada]
+                esquemas_rodada[nome_planilha] = list(colunas)
+                amostras_rodada[nome_planilha] = amostra
+        from src.agent_mapper import obter_mapeamento_colunas  # Só a Etapa 2 precisa da pilha do LLM.
+        mapeamento_rodada = obter_mapeamento_colunas(
+            esquemas_rodada, forcar_atualizacao=forcar_atualizacao_mapeamento, amostras=amostras_rodada
+        ) or {}
+        for nome_planilha, colunas in esquemas_rodada.items():
+            if nome_planilha in mapeamento_rodada:
+                mapeados[(nome_planilha, tuple(colunas))] = {nome_planilha: mapeamento_rodada[nome_planilha]}
+    return mapeados
+
+
+def executar_job(job: Dict[str, Any], mapeamento_colunas: Dict[str, Any], esquemas: Dict[str, List[str]]) -> Dict[str, Any]:
+    """
+    Etapas 1 (carga) e 3 de um job, com o mapeamento já resolvido. Executado em um processo do pool;
+    a leitura das planilhas do job é sequencial, pois o paralelismo do lote já é entre jobs.
+    Retorna o resumo do job (status, linhas, custo total, tempo e diretório de saída).
+    """
+    inicio = time.perf_counter()
+    resumo: Dict[str, Any] = {"nome": job["nome"], "competencia": job["competencia"], "diretorio_output": job["diretorio_output"]}
+    try:
+        colunas_por_planilha = definir_colunas_necessarias(mapeamento_colunas, esquemas)
+        custos_pre_agregados = None
+        if job["modo_streaming"]:
+            dataframes_brutos = carregar_planilhas_entrada(
+                job["diretorio_input"], ["colaboradores.xlsx"], colunas_por_planilha, paralelo=False
+            )
+            custos_pre_agregados = agregar_custos_em_streaming(
+                job["diretorio_input"], job["planilhas"], mapeamento_colunas, modo_compacto=job["modo_compacto"]
+            )
+        else:
+            dataframes_brutos = carregar_planilhas_entrada(
+                job["diretorio_input"], job["planilhas"], colunas_por_planilha, paralelo=False
+            )
+        if dataframes_brutos is None or (job["modo_streaming"] and custos_pre_agregados is None):
+            return {**resumo, "status": "erro", "erro": "falha no carregamento das planilhas"}
+
+        rollups: Dict[str, pd.DataFrame] = {}
+        df_final = consolidar_e_calcular_custos(
+            dataframes_brutos, mapeamento_colunas, modo_compacto=job["modo_compacto"],
+            custos_pre_agregados=custos_pre_agregados, rollups_departamento=rollups
+        )
+        if df_final is None or df_final.empty:
+            return {**resumo, "status": "erro", "erro": "falha na consolidação"}
+
+        sucesso = gerar_saidas_relatorio(
+            df_final, mapeamento_colunas, job["diretorio_output"], NOME_BASE_RELATORIO_LOTE,
+            job["formatos"], competencia=job["competencia"], rollups=rollups
+        )
+        custo_total = df_final["Custo_Geral_Total"].sum()
+        if df_final.attrs.get("valores_em_centavos"):
+            custo_total = custo_total / 100
+        resumo.update({
+            "status": "ok" if sucesso else "erro",
+            "linhas": len(df_final),
+            "custo_geral_total": round(float(custo_total), 2),
+        })
+        if not sucesso:
+            resumo["erro"] = "falha na geração das saídas"
+    except Exception as e:
+        resumo.update({"status": "erro", "erro": f"{type(e).__name__}: {e}"})
+    resumo["tempo_s"] = round(time.perf_counter() - inicio, 3)
+    return resumo
+
+
+def executar_lote(
+    caminho_manifesto: str,
+    max_processos: Optional[int] = None,
+    forcar_atualizacao_mapeamento: bool = False
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Processa todos os jobs do manifesto em uma única invocação. Os cabeçalhos são lidos em um pool de
+    processos; os esquemas distintos são mapeados uma vez no processo principal (cache e LLM compartilhados);
+    carga, consolidação e saídas de cada job rodam no pool, um job por processo. Grava um resumo JSON
+    (`resumo_lote.json`) ao lado do manifesto e retorna a lista de resumos, ou None se o manifesto for inválido.
+    """
+    func_prefix = "[executar_lote]"
+    print("\n--- Iniciando Processamento em Lote ---")
+    inicio = time.perf_counter()
+    jobs = carregar_manifesto(caminho_manifesto)
+    if jobs is None:
+        return None
+
+    nucleos_disponiveis = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    num_processos = max(1, min(len(jobs), max_processos or nucleos_disponiveis))
+    print(f"{func_prefix} {len(jobs)} job(s) em {num_processos} processo(s).")
+
+    resumos: Dict[str, Dict[str, Any]] = {}
+    with ProcessPoolExecutor(max_workers=num_processos) as executor:
+        amostras_por_job: Dict[str, Dict[str, pd.DataFrame]] = {}
+        for job, amostras in zip(jobs, executor.map(_ler_esquemas_job, jobs)):
+            if amostras is None:
+                resumos[job["nome"]] = {"nome": job["nome"], "status": "erro", "erro": "falha na leitura dos cabeçalhos"}
+            else:
+                amostras_por_job[job["nome"]] = amostras
+
+        mapeados = mapear_esquemas_distintos(amostras_por_job, forcar_atualizacao_mapeamento) if amostras_por_job else {}
+
+        futuros = {}
+        for job in jobs:
+            amostras = amostras_por_job.get(job["nome"])
+            if amostras is None:
+                continue
+            esquemas = {nome: list(df.columns) for nome, df in amostras.items()}
+            faltantes = [nome for nome, colunas in esquemas.items() if (nome, tuple(colunas)) not in mapeados]
+            if faltantes:
+                resumos[job["nome"]] = {"nome": job["nome"], "status": "erro", "erro": f"sem mapeamento para {faltantes}"}
+                continue
+            mapeamento_job: Dict[str, Any] = {}
+            for nome, colunas in esquemas.items():
+                mapeamento_job.update(mapeados[(nome, tuple(colunas))])
+            futuros[job["nome"]] = executor.submit(executar_job, job, mapeamento_job, esquemas)
+
+        for nome_job, futuro in futuros.items():
+            try:
+                resumos[nome_job] = futuro.result()
+            except Exception as e:
+                resumos[nome_job] = {"nome": nome_job, "status": "erro", "erro": f"{type(e).__name__}: {e}"}
+
+    lista_resumos = [resumos[job["nome"]] for job in jobs]
+    caminho_resumo = os.path.join(os.path.dirname(os.path.abspath(caminho_manifesto)), ARQUIVO_RESUMO_LOTE)
+    try:
+        with open(caminho_resumo, "w", encoding="utf-8") as f:
+            json.dump({
+                "manifesto": os.path.abspath(caminho_manifesto),
+                "tempo_total_s": round(time.perf_counter() - inicio, 3),
+                "processos": num_processos,
+                "jobs": lista_resumos,
+            }, f, indent=2, ensure_ascii=False)
+    except OSError as e:
+        print(f"{func_prefix} ALERTA: Não foi possível gravar o resumo do lote: {e}")
+
+    print("\n--- Resumo do Lote ---")
+    for resumo in lista_resumos:
+        detalhe = (f"{resumo.get('linhas')} colaboradores, total {resumo.get('custo_geral_total')}, {resumo.get('tempo_s')}s"
+                   if resumo["status"] == "ok" else resumo.get("erro"))
+        print(f"  [{resumo['status'].upper()}] {resumo['nome']}: {detalhe}")
+    com_erro = sum(1 for r in lista_resumos if r["status"] != "ok")
+    print(f"{func_prefix} {len(lista_resumos) - com_erro}/{len(lista_resumos)} job(s) concluído(s) em "
+          f"{time.perf_counter() - inicio:.1f}s. Resumo em: {caminho_resumo}")
+    print("--- Processamento em Lote Concluído ---")
+    return lista_resumos
@@ -1,27 +1,260 @@
 import pandas as pd
+import numpy as np
 import os
-from typing import Dict, List, Optional, Any
+import json
+import hashlib
+from typing import Dict, Iterator, List, Optional, Any, Sequence, Tuple
 import traceback 
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import load_workbook
 
-def carregar_planilhas_entrada(diretorio_input: str, nomes_arquivos_esperados: List[str]) -> Optional[Dict[str, pd.DataFrame]]:
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow é opcional: sem ele, o cache colunar fica desativado.
+    feather = None
+
+from src.metrics import iniciar_medicao, finalizar_medicao, registrar_evento
+
+DIRETORIO_CACHE_PLANILHAS_PADRAO = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'cache', 'planilhas'
+)
+LINHAS_AMOSTRA_ESQUEMA = 50
+COLUNA_DATA_ATIVACAO = "Data Ativacao"
+# Colunas lidas além das mapeadas (nome, CPF, custo), por planilha.
+COLUNAS_ADICIONAIS_POR_PLANILHA: Dict[str, List[str]] = {
+    "colaboradores": ["Departamento"],
+    "github": [COLUNA_DATA_ATIVACAO],
+    "google_workspace": [COLUNA_DATA_ATIVACAO],
+}
+NOMES_PLANILHAS_PADRAO = [
+    "colaboradores.xlsx", "github.xlsx", "gympass.xlsx",
+    "google_workspace.xlsx", "unimed.xlsx"
+]
+
+def ler_esquemas_planilhas(
+    diretorio_input: str, 
+    nomes_arquivos_esperados: List[str],
+    linhas_amostra: int = LINHAS_AMOSTRA_ESQUEMA
+) -> Optional[Dict[str, pd.DataFrame]]:
+    """
+    Lê apenas o cabeçalho e as primeiras `linhas_amostra` linhas de cada planilha, em modo
+    somente leitura (streaming) do openpyxl, sem carregar o arquivo inteiro.
+    Retorna um DataFrame de amostra por planilha; `list(df.columns)` é o esquema original.
+    """
+    func_prefix = "[ler_esquemas_planilhas]"
+    amostras: Dict[str, pd.DataFrame] = {}
+    if not os.path.isdir(diretorio_input):
+        print(f"{func_prefix} ERRO: O diretório de input especificado não existe: {diretorio_input}")
+        return None
+    for nome_arquivo in nomes_arquivos_esperados:
+        caminho_completo = os.path.join(diretorio_input, nome_arquivo)
+        if not os.path.isfile(caminho_completo):
+            print(f"{func_prefix} ERRO: Arquivo esperado não encontrado: {caminho_completo}")
+            return None
+        try:
+            workbook = load_workbook(caminho_completo, read_only=True, data_only=True)
+            try:
+                linhas = list(workbook.worksheets[0].iter_rows(max_row=linhas_amostra + 1, values_only=True))
+            finally:
+                workbook.close()
+        except Exception as e:
+            print(f"{func_prefix} ERRO ao ler o cabeçalho de '{nome_arquivo}': {e}")
+            return None
+        if not linhas:
+            print(f"{func_prefix} ERRO: Planilha '{nome_arquivo}' está vazia.")
+            return None
+        cabecalho = [
+            str(valor) if valor is not None else f"Unnamed: {i}" for i, valor in enumerate(linhas[0])
+        ]
+        chave_df = nome_arquivo.replace('.xlsx', '')
+        amostras[chave_df] = pd.DataFrame(linhas[1:], columns=cabecalho).infer_objects()
+        print(f"{func_prefix} Esquema de '{nome_arquivo}': {cabecalho}")
+    return amostras
+
+def definir_colunas_necessarias(
+    mapeamento_colunas: Dict[str, Any],
+    esquemas_originais: Dict[str, List[str]]
+) -> Dict[str, List[str]]:
+    """
+    Retorna, por planilha, as colunas originais efetivamente usadas na consolidação
+    (nome, CPF, custo e as adicionais existentes), para carregar somente elas.
+    """
+    colunas_por_planilha: Dict[str, List[str]] = {}
+    for nome_df, mapa in mapeamento_colunas.items():
+        colunas = [
+            mapa['coluna_original_nome'], mapa['coluna_original_cpf'], mapa['coluna_original_custo_principal']
+        ]
+        adicionais = list(COLUNAS_ADICIONAIS_POR_PLANILHA.get(nome_df, []))
+        if mapa.get('coluna_original_departamento'):
+            adicionais.append(mapa['coluna_original_departamento'])
+        colunas.extend(c for c in adicionais if c in esquemas_originais.get(nome_df, []))
+        colunas_por_planilha[nome_df] = list(dict.fromkeys(colunas))
+    return colunas_por_planilha
+
+def calcular_hash_arquivo(caminho: str, tamanho_bloco: int = 1 << 20) -> str:
+    hash_conteudo = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+            hash_conteudo.update(bloco)
+    return hash_conteudo.hexdigest()
+
+def obter_assinaturas(diretorio_input: str, nomes_arquivos: List[str]) -> Dict[str, Optional[Tuple[int, int]]]:
+    """(tamanho, mtime em ns) de cada arquivo; None para os ausentes (ex.: no meio de uma substituição)."""
+    assinaturas: Dict[str, Optional[Tuple[int, int]]] = {}
+    for nome_arquivo in nomes_arquivos:
+        try:
+            estado = os.stat(os.path.join(diretorio_input, nome_arquivo))
+            assinaturas[nome_arquivo] = (estado.st_size, estado.st_mtime_ns)
+        except FileNotFoundError:
+            assinaturas[nome_arquivo] = None
+    return assinaturas
+
+def _caminhos_cache_planilha(
+    diretorio_cache: str, caminho_completo: str, usecols: Optional[List[str]]
+) -> Tuple[str, str]:
+    chave = hashlib.sha256(
+        json.dumps([os.path.abspath(caminho_completo), usecols], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()[:32]
+    base = os.path.join(diretorio_cache, chave)
+    return f"{base}.feather", f"{base}.json"
+
+def _ler_cache_planilha(caminho_completo: str, usecols: Optional[List[str]], diretorio_cache: str) -> Optional[pd.DataFrame]:
+    """
+    Retorna o DataFrame do cache colunar se o arquivo de origem não mudou. Tamanho e mtime iguais
+    bastam; se só o mtime mudou, o hash do conteúdo decide (e os metadados são atualizados).
+    """
+    caminho_dados, caminho_meta = _caminhos_cache_planilha(diretorio_cache, caminho_completo, usecols)
+    if feather is None or not (os.path.isfile(caminho_dados) and os.path.isfile(caminho_meta)):
+        return None
+    try:
+        with open(caminho_meta, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        estado = os.stat(caminho_completo)
+        if estado.st_size != meta.get("tamanho"):
+            return None
+        if estado.st_mtime_ns != meta.get("mtime_ns"):
+            if calcular_hash_arquivo(caminho_completo) != meta.get("sha256"):
+                return None
+            meta["mtime_ns"] = estado.st_mtime_ns
+            with open(caminho_meta, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+        return feather.read_table(caminho_dados, memory_map=True).to_pandas()
+    except Exception as e:
+        print(f"  [ALERTA] Cache colunar inválido para '{os.path.basename(caminho_completo)}' ({e}). Relendo o XLSX.")
+        return None
+
+def _gravar_cache_planilha(
+    df: pd.DataFrame, caminho_completo: str, usecols: Optional[List[str]], diretorio_cache: str
+) -> None:
+    if feather is None:
+        return
+    caminho_dados, caminho_meta = _caminhos_cache_planilha(diretorio_cache, caminho_completo, usecols)
+    try:
+        os.makedirs(diretorio_cache, exist_ok=True)
+        estado = os.stat(caminho_completo)
+        # Sem compressão, para que a leitura possa mapear o arquivo em memória (memory_map).
+        feather.write_feather(df, f"{caminho_dados}.tmp", compression="uncompressed")
+        os.replace(f"{caminho_dados}.tmp", caminho_dados)
+        with open(caminho_meta, "w", encoding="utf-8") as f:
+            json.dump({
+                "origem": os.path.abspath(caminho_completo),
+                "usecols": usecols,
+                "tamanho": estado.st_size,
+                "mtime_ns": estado.st_mtime_ns,
+                "sha256": calcular_hash_arquivo(caminho_completo),
+            }, f)
+    except Exception as e:
+        print(f"  [ALERTA] Não foi possível gravar o cache colunar de '{os.path.basename(caminho_completo)}': {e}")
+
+def _ler_planilha_excel(
+    caminho_completo: str, 
+    usecols: Optional[List[str]],
+    diretorio_cache: Optional[str] = None
+) -> Tuple[pd.DataFrame, bool, Dict[str, Any]]:
+    """
+    Leitura de um único arquivo; função de módulo para poder ser executada em outro processo.
+    Com `diretorio_cache`, usa/atualiza o cache colunar. Retorna (DataFrame, veio_do_cache, medidas),
+    com as medidas de tempo e memória tomadas no próprio processo que leu o arquivo.
+    """
+    inicio = iniciar_medicao()
+    if diretorio_cache:
+        df_cache = _ler_cache_planilha(caminho_completo, usecols, diretorio_cache)
+        if df_cache is not None:
+            return df_cache, True, finalizar_medicao(inicio)
+    df = pd.read_excel(caminho_completo, usecols=usecols)
+    if diretorio_cache:
+        _gravar_cache_planilha(df, caminho_completo, usecols, diretorio_cache)
+    return df, False, finalizar_medicao(inicio)
+
+def carregar_planilhas_entrada(
+    diretorio_input: str, 
+    nomes_arquivos_esperados: List[str],
+    colunas_por_planilha: Optional[Dict[str, List[str]]] = None,
+    paralelo: bool = True,
+    max_processos: Optional[int] = None,
+    usar_cache: bool = True,
+    diretorio_cache: Optional[str] = None
+) -> Optional[Dict[str, pd.DataFrame]]:
+    """
+    Carrega as planilhas de entrada. Se `colunas_por_planilha` for informado, cada arquivo
+    é lido apenas com as colunas listadas para ele (`usecols`).
+    Com `paralelo`, os arquivos são lidos simultaneamente em um pool de processos
+    (até `max_processos`, por padrão o número de núcleos disponíveis). Qualquer falha
+    interrompe o carregamento e retorna None, como no modo sequencial.
+    Com `usar_cache` (e pyarrow instalado), cada DataFrame lido é guardado em um cache colunar
+    (Feather) e o XLSX só é relido quando o arquivo de origem muda.
+    """
     dataframes: Dict[str, pd.DataFrame] = {}
     print("--- Iniciando Etapa 1: Carregamento das Planilhas de Entrada ---")
     if not os.path.isdir(diretorio_input):
         print(f"  [ERRO] O diretório de input especificado não existe: {diretorio_input}")
         return None
+    diretorio_cache_efetivo = (diretorio_cache or DIRETORIO_CACHE_PLANILHAS_PADRAO) if usar_cache else None
+    tarefas = []
     for nome_arquivo in nomes_arquivos_esperados:
         caminho_completo = os.path.join(diretorio_input, nome_arquivo)
         if not os.path.isfile(caminho_completo):
             print(f"  [ERRO] Arquivo esperado não encontrado: {caminho_completo}")
             return None 
-        try:
-            chave_df = nome_arquivo.replace('.xlsx', '')
-            dataframes[chave_df] = pd.read_excel(caminho_completo)
-            print(f"  [OK] Planilha '{nome_arquivo}' carregada como DataFrame '{chave_df}'. "
-                  f"({len(dataframes[chave_df])} linhas)")
-        except Exception as e:
-            print(f"  [ERRO] Ocorreu um erro inesperado ao ler o arquivo '{nome_arquivo}': {e}")
-            return None
+        chave_df = nome_arquivo.replace('.xlsx', '')
+        usecols = (colunas_por_planilha or {}).get(chave_df)
+        tarefas.append((nome_arquivo, chave_df, caminho_completo, usecols))
+
+    nucleos_disponiveis = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    num_processos = min(len(tarefas), max_processos or nucleos_disponiveis)
+    if paralelo and num_processos > 1:
+        print(f"  Lendo {len(tarefas)} planilhas em paralelo ({num_processos} processos)...")
+        with ProcessPoolExecutor(max_workers=num_processos) as executor:
+            futuros = [
+                executor.submit(_ler_planilha_excel, caminho_completo, usecols, diretorio_cache_efetivo)
+                for _, _, caminho_completo, usecols in tarefas
+            ]
+            for (nome_arquivo, chave_df, _, _), futuro in zip(tarefas, futuros):
+                try:
+                    dataframes[chave_df], do_cache, medidas = futuro.result()
+                    print(f"  [OK] Planilha '{nome_arquivo}' carregada como DataFrame '{chave_df}'. "
+                          f"({len(dataframes[chave_df])} linhas{', cache' if do_cache else ''})")
+                    registrar_evento("planilha", planilha=nome_arquivo, linhas=len(dataframes[chave_df]),
+                                     cache=do_cache, **medidas)
+                except Exception as e:
+                    print(f"  [ERRO] Ocorreu um erro inesperado ao ler o arquivo '{nome_arquivo}': {e}")
+                    for futuro_pendente in futuros:
+                        futuro_pendente.cancel()
+                    return None
+    else:
+        for nome_arquivo, chave_df, caminho_completo, usecols in tarefas:
+            try:
+                dataframes[chave_df], do_cache, medidas = _ler_planilha_excel(
+                    caminho_completo, usecols, diretorio_cache_efetivo
+                )
+                print(f"  [OK] Planilha '{nome_arquivo}' carregada como DataFrame '{chave_df}'. "
+                      f"({len(dataframes[chave_df])} linhas{', cache' if do_cache else ''})")
+                registrar_evento("planilha", planilha=nome_arquivo, linhas=len(dataframes[chave_df]),
+                                 cache=do_cache, **medidas)
+            except Exception as e:
+                print(f"  [ERRO] Ocorreu um erro inesperado ao ler o arquivo '{nome_arquivo}': {e}")
+                return None
     if len(dataframes) == len(nomes_arquivos_esperados):
         print("Todas as planilhas de entrada foram carregadas com sucesso.")
         print("--- Etapa 1 Concluída ---")
@@ -31,10 +264,418 @@ def carregar_planilhas_entrada(diretorio_input: str, nomes_arquivos_esperados: L
         print("--- Etapa 1 Falhou ---")
         return None
 
+_PESOS_DV1 = np.arange(10, 1, -1)
+_PESOS_DV2 = np.arange(11, 1, -1)
+_POTENCIAS_CPF = 10 ** np.arange(10, -1, -1, dtype=np.int64)
+MAX_EXEMPLOS_CPF_INVALIDO = 5
+
+def cpf_com_digitos_validos(chaves: pd.Series) -> pd.Series:
+    """Valida os dois dígitos verificadores de chaves de CPF inteiras (zero à esquerda implícito), vetorialmente."""
+    valores = chaves.fillna(-1).to_numpy(dtype=np.int64)
+    digitos = (valores[:, None] // _POTENCIAS_CPF) % 10
+    dv1 = (digitos[:, :9] @ _PESOS_DV1) * 10 % 11 % 10
+    dv2 = (digitos[:, :10] @ _PESOS_DV2) * 10 % 11 % 10
+    todos_iguais = (digitos == digitos[:, :1]).all(axis=1)
+    validos = (valores >= 0) & (valores < 10 ** 11) & (dv1 == digitos[:, 9]) & (dv2 == digitos[:, 10]) & ~todos_iguais
+    return pd.Series(validos, index=chaves.index)
+
+def normalizar_cpf(serie_cpf: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """
+    Converte uma coluna de CPFs (texto formatado, número ou float vindo do Excel, ex. 12345678900.0)
+    em uma chave inteira (Int64; NA quando não há dígitos) e devolve também o motivo de invalidez
+    de cada linha (None quando o CPF é válido): 'vazio', 'mais de 11 dígitos', 'mascarado'
+    (ex. '123.456.789-XX', mantido como chave pelos dígitos visíveis) ou 'dígito verificador inválido'.
+    Chaves com motivo não são CPFs validados: só servem para vincular custos junto com o nome.
+    """
+    if pd.api.types.is_numeric_dtype(serie_cpf) and not pd.api.types.is_bool_dtype(serie_cpf):
+        chaves = serie_cpf.round().astype("Int64")
+        mascarado = pd.Series(False, index=serie_cpf.index)
+        excede = chaves.fillna(0) >= 10 ** 11
+    else:
+        texto = serie_cpf.astype("string").str.strip().str.replace(r"\.0+$", "", regex=True)
+        mascarado = texto.str.contains(r"[Xx*]", regex=True).fillna(False).astype(bool)
+        digitos = texto.str.replace(r"\D", "", regex=True)
+        tamanho = digitos.str.len().fillna(0)
+        excede = tamanho > 11
+        # Acima de 18 dígitos não cabe em int64; a linha fica sem chave (NA).
+        chaves = pd.to_numeric(digitos.mask((tamanho == 0) | (tamanho > 18)), errors="coerce").astype("Int64")
+
+    motivo = pd.Series(None, index=serie_cpf.index, dtype="object")
+    motivo[~cpf_com_digitos_validos(chaves)] = "dígito verificador inválido"
+    motivo[mascarado] = "mascarado"
+    motivo[excede] = "mais de 11 dígitos"
+    motivo[chaves.isna()] = "vazio"
+    return chaves, motivo
+
+def formatar_cpf(chaves: pd.Series) -> pd.Series:
+    """Chave inteira -> texto. CPFs com dígitos verificadores válidos recebem zeros à esquerda (11 dígitos)."""
+    texto = chaves.astype("Int64").astype("string")
+    validos = cpf_com_digitos_validos(chaves)
+    return texto.mask(validos, texto.str.zfill(11))
+
+def relatar_cpfs_invalidos(nome_planilha: str, serie_original: pd.Series, motivo: pd.Series) -> pd.DataFrame:
+    """Monta e imprime o relatório das linhas com CPF inválido de uma planilha."""
+    invalidos = motivo.notna()
+    relatorio = pd.DataFrame({
+        "planilha": nome_planilha,
+        "linha_excel": serie_original.index[invalidos] + 2,
+        "cpf_original": serie_original[invalidos].to_numpy(),
+        "motivo": motivo[invalidos].to_numpy(),
+    })
+    if not relatorio.empty:
+        contagem = relatorio["motivo"].value_counts().to_dict()
+        exemplos = relatorio.head(MAX_EXEMPLOS_CPF_INVALIDO)[["linha_excel", "cpf_original", "motivo"]].to_dict("records")
+        print(f"  [ALERTA] '{nome_planilha}': {len(relatorio)} CPF(s) inválido(s) {contagem}. Exemplos: {exemplos}")
+    return relatorio
+
+def _remover_acentos(texto: str) -> str:
+    """Decompõe (NFKD) e descarta as marcas combinantes, sem regex (o dtype "string" com pyarrow usa RE2)."""
+    return "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+
+def normalizar_nome(serie_nome: pd.Series) -> pd.Series:
+    """Nome -> chave de comparação entre planilhas: sem acentos, em minúsculas e com espaços simples."""
+    return (
+        serie_nome.astype("string").map(_remover_acentos, na_action="ignore").astype("string")
+        .str.lower().str.replace(r"\s+", " ", regex=True).str.strip()
+    )
+
+COLUNAS_CHAVE_CUSTOS = ["CPF_Padronizado", "CPF_Validado", "Nome_Chave", "Fonte"]
+
+def _custos_em_formato_longo(
+    chaves: pd.Series,
+    validados: pd.Series,
+    nomes: pd.Series,
+    valores: pd.Series,
+    fonte: str,
+    datas: Optional[pd.Series] = None
+) -> pd.DataFrame:
+    """
+    Linhas de custo de um fornecedor no formato longo: chave de CPF, se o CPF foi validado (sem motivo
+    de invalidez em `normalizar_cpf`), nome normalizado, fonte, valor e data de ativação.
+    """
+    return pd.DataFrame({
+        "CPF_Padronizado": chaves.astype("Int64"),
+        "CPF_Validado": validados.astype(bool),
+        "Nome_Chave": normalizar_nome(nomes),
+        "Fonte": fonte,
+        "Valor": valores,
+        "Data_Ativacao": datas if datas is not None else pd.Series(pd.NaT, index=chaves.index, dtype="datetime64[ns]"),
+    })
+
+def _somar_custos_longos(df_longo: pd.DataFrame) -> pd.DataFrame:
+    """
+    Soma os valores e guarda a primeira data de ativação por (CPF, validação, nome, fonte). Linhas sem CPF ou sem
+    nome são mantidas (dropna=False), para que a soma por fonte continue igual ao total da fatura.
+    """
+    return df_longo.groupby(COLUNAS_CHAVE_CUSTOS, sort=False, dropna=False).agg(
+        Valor=("Valor", "sum"), Data_Ativacao=("Data_Ativacao", "min")
+    ).reset_index()
+
+def agregar_custos_por_cpf(
+    dataframes_padronizados: Dict[str, pd.DataFrame],
+    mapeamento_colunas: Dict[str, Any]
+) -> pd.DataFrame:
+    """
+    Empilha as linhas de custo de todos os fornecedores em formato longo e soma com um único groupby
+    por (CPF, nome normalizado, fonte): várias linhas da mesma pessoa (licenças, parcelas) são somadas,
+    mas pessoas diferentes que compartilham a chave de CPF continuam separadas até a alocação
+    (`alocar_custos_aos_colaboradores`). Retorna colunas CPF_Padronizado, CPF_Validado, Nome_Chave,
+    Fonte, Valor e Data_Ativacao (primeira ativação, quando a fonte a possui).
+    """
+    func_prefix = "[agregar_custos_por_cpf]"
+    partes_longas = []
+    for nome_df, df_padronizado in dataframes_padronizados.items():
+        if nome_df == "colaboradores":
+            continue
+        nome_coluna_custo = mapeamento_colunas[nome_df]['nome_padronizado_custo']
+        if "CPF_Padronizado" not in df_padronizado.columns or nome_coluna_custo not in df_padronizado.columns:
+            print(f"{func_prefix} ALERTA: '{nome_df}' sem 'CPF_Padronizado' ou '{nome_coluna_custo}'. Fonte ignorada.")
+            continue
+        partes_longas.append(_custos_em_formato_longo(
+            df_padronizado["CPF_Padronizado"],
+            df_padronizado["CPF_Validado"],
+            df_padronizado["Nome_Padronizado"],
+            pd.to_numeric(df_padronizado[nome_coluna_custo], errors='coerce'),
+            nome_coluna_custo,
+            df_padronizado.get(nome_coluna_data_ativacao(nome_coluna_custo)),
+        ))
+
+    if not partes_longas:
+        return pd.DataFrame(columns=COLUNAS_CHAVE_CUSTOS + ["Valor", "Data_Ativacao"])
+    return _somar_custos_longos(pd.concat(partes_longas, ignore_index=True))
+
+def alocar_custos_aos_colaboradores(
+    df_colaboradores: pd.DataFrame,
+    custos_longos: pd.DataFrame
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Vincula cada linha agregada de custo a exatamente um colaborador:
+    1. CPF validado dos dois lados, com a chave pertencente a um único colaborador: pela chave;
+    2. demais casos (CPF mascarado, parcial ou com dígito verificador inválido, ou chave compartilhada
+       por vários colaboradores): pela chave mais o nome normalizado, desde que o par identifique um
+       único colaborador. Chaves não validadas nunca são vinculadas só pelos dígitos.
+    O que sobra (sem CPF, CPF fora do cadastro, par chave + nome ausente ou repetido) não é alocado.
+    Retorna (custos alocados com a coluna 'Posicao' do colaborador, custos não alocados).
+    """
+    colaboradores = pd.DataFrame({
+        "Posicao": np.arange(len(df_colaboradores)),
+        "CPF_Padronizado": df_colaboradores["CPF_Padronizado"].astype("Int64").array,
+        "CPF_Validado": df_colaboradores["CPF_Validado"].astype(bool).to_numpy(),
+        "Nome_Chave": normalizar_nome(df_colaboradores["Nome_Padronizado"]).array,
+    })
+    colaboradores = colaboradores[colaboradores["CPF_Padronizado"].notna()]
+    chave_unica = colaboradores.drop_duplicates("CPF_Padronizado", keep=False)
+    por_chave = chave_unica[chave_unica["CPF_Validado"]][["CPF_Padronizado", "Posicao"]]
+    por_chave_e_nome = colaboradores[colaboradores["Nome_Chave"].notna()].drop_duplicates(
+        ["CPF_Padronizado", "Nome_Chave"], keep=False
+    )[["CPF_Padronizado", "Nome_Chave", "Posicao"]]
+
+    custos = custos_longos.reset_index(drop=True)
+    pela_chave = custos["CPF_Validado"].astype(bool) & custos["CPF_Padronizado"].isin(
+        por_chave["CPF_Padronizado"]
+    ).fillna(False).astype(bool)
+    alocados_pela_chave = custos[pela_chave].merge(por_chave, on="CPF_Padronizado", how="inner")
+    pelo_nome = custos[~pela_chave].merge(por_chave_e_nome, on=["CPF_Padronizado", "Nome_Chave"], how="left")
+    alocados = pd.concat([alocados_pela_chave, pelo_nome[pelo_nome["Posicao"].notna()]], ignore_index=True)
+    alocados["Posicao"] = alocados["Posicao"].astype("int64")
+    return alocados, pelo_nome[pelo_nome["Posicao"].isna()].drop(columns="Posicao")
+
+TAMANHO_LOTE_STREAMING = 50_000
+
+def _iterar_lotes_arquivo(
+    caminho_completo: str,
+    colunas: List[str],
+    tamanho_lote: int,
+    colunas_opcionais: Sequence[str] = ()
+) -> Iterator[pd.DataFrame]:
+    """
+    Lê `colunas` de um arquivo de entrada em lotes de até `tamanho_lote` linhas, sem carregá-lo inteiro:
+    XLSX via openpyxl somente leitura (`iter_rows`), CSV via `chunksize` e Parquet via `iter_batches`.
+    As `colunas_opcionais` presentes no cabeçalho também são lidas; as ausentes são ignoradas.
+    """
+    extensao = os.path.splitext(caminho_completo)[1].lower()
+    if extensao == ".csv":
+        cabecalho = list(pd.read_csv(caminho_completo, nrows=0).columns)
+        colunas = colunas + [col for col in colunas_opcionais if col in cabecalho and col not in colunas]
+        yield from pd.read_csv(caminho_completo, usecols=colunas, chunksize=tamanho_lote)
+        return
+    if extensao == ".parquet":
+        import pyarrow.parquet as pq
+        arquivo_parquet = pq.ParquetFile(caminho_completo)
+        cabecalho = arquivo_parquet.schema_arrow.names
+        colunas = colunas + [col for col in colunas_opcionais if col in cabecalho and col not in colunas]
+        for lote in arquivo_parquet.iter_batches(batch_size=tamanho_lote, columns=colunas):
+            yield lote.to_pandas()
+        return
+
+    workbook = load_workbook(caminho_completo, read_only=True, data_only=True)
+    try:
+        linhas = workbook.worksheets[0].iter_rows(values_only=True)
+        cabecalho = [str(valor) if valor is not None else f"Unnamed: {i}" for i, valor in enumerate(next(linhas, ()))]
+        colunas = colunas + [col for col in colunas_opcionais if col in cabecalho and col not in colunas]
+        faltantes = [col for col in colunas if col not in cabecalho]
+        if faltantes:
+            raise KeyError(f"Colunas {faltantes} não encontradas em '{os.path.basename(caminho_completo)}'")
+        posicoes = [cabecalho.index(col) for col in colunas]
+        lote = []
+        for linha in linhas:
+            lote.append([linha[i] if i < len(linha) else None for i in posicoes])
+            if len(lote) >= tamanho_lote:
+                yield pd.DataFrame(lote, columns=colunas)
+                lote = []
+        if lote:
+            yield pd.DataFrame(lote, columns=colunas)
+    finally:
+        workbook.close()
+
+def agregar_custos_em_streaming(
+    diretorio_input: str,
+    nomes_arquivos: List[str],
+    mapeamento_colunas: Dict[str, Any],
+    tamanho_lote: int = TAMANHO_LOTE_STREAMING,
+    modo_compacto: bool = False
+) -> Optional[pd.DataFrame]:
+    """
+    Equivalente a `agregar_custos_por_cpf` para entradas grandes demais para a memória: percorre as
+    linhas de cada fornecedor em lotes e mantém apenas a soma acumulada e a primeira data de ativação
+    (nas fontes que a possuem) por (CPF, nome, fonte).
+    O pico de memória é limitado pelo número de pessoas distintas, não pelo número de linhas das faturas.
+    Retorna o mesmo formato longo de `agregar_custos_por_cpf`.
+    """
+    func_prefix = "[agregar_custos_em_streaming]"
+    print(f"{func_prefix} Agregando custos dos fornecedores em lotes de {tamanho_lote} linhas...")
+    somas_por_fonte: List[pd.DataFrame] = []
+    for nome_arquivo in nomes_arquivos:
+        nome_df = os.path.splitext(nome_arquivo)[0]
+        if nome_df == "colaboradores":
+            continue
+        if nome_df not in mapeamento_colunas:
+            print(f"{func_prefix} ALERTA: Mapeamento não encontrado para '{nome_df}'. Pulando.")
+            continue
+        mapa = mapeamento_colunas[nome_df]
+        col_nome, col_cpf = mapa['coluna_original_nome'], mapa['coluna_original_cpf']
+        col_custo, nome_coluna_custo = mapa['coluna_original_custo_principal'], mapa['nome_padronizado_custo']
+        colunas_opcionais = [
+            col for col in COLUNAS_ADICIONAIS_POR_PLANILHA.get(nome_df, []) if col == COLUNA_DATA_ATIVACAO
+        ]
+        acumulado: Optional[pd.DataFrame] = None
+        total_linhas, contagem_invalidos = 0, {}
+        inicio = iniciar_medicao()
+        try:
+            colunas = list(dict.fromkeys([col_nome, col_cpf, col_custo]))
+            for lote in _iterar_lotes_arquivo(
+                os.path.join(diretorio_input, nome_arquivo), colunas, tamanho_lote, colunas_opcionais
+            ):
+                total_linhas += len(lote)
+                chaves, motivo = normalizar_cpf(lote[col_cpf])
+                for chave_motivo, quantidade in motivo.value_counts().items():
+                    contagem_invalidos[chave_motivo] = contagem_invalidos.get(chave_motivo, 0) + int(quantidade)
+                valores = converter_para_centavos(lote[col_custo]) if modo_compacto else arredondar_para_centavos(lote[col_custo])
+                datas = (
+                    pd.to_datetime(lote[COLUNA_DATA_ATIVACAO], errors='coerce', dayfirst=True)
+                    if COLUNA_DATA_ATIVACAO in lote.columns else None
+                )
+                parcial = _somar_custos_longos(
+                    _custos_em_formato_longo(chaves, motivo.isna(), lote[col_nome], valores, nome_coluna_custo, datas)
+                )
+                acumulado = parcial if acumulado is None else _somar_custos_longos(pd.concat([acumulado, parcial], ignore_index=True))
+        except Exception as e:
+            print(f"{func_prefix} ERRO ao processar '{nome_arquivo}' em lotes: {type(e).__name__} - {e}")
+            return None
+        if contagem_invalidos:
+            print(f"  [ALERTA] '{nome_df}': CPFs inválidos {contagem_invalidos}.")
+        if acumulado is not None:
+            somas_por_fonte.append(acumulado)
+        print(f"{func_prefix} '{nome_arquivo}': {total_linhas} linhas agregadas em {0 if acumulado is None else len(acumulado)} pessoas.")
+        registrar_evento("planilha", planilha=nome_arquivo, linhas=total_linhas, cache=False, streaming=True,
+                         **finalizar_medicao(inicio))
+
+    if not somas_por_fonte:
+        return pd.DataFrame(columns=COLUNAS_CHAVE_CUSTOS + ["Valor", "Data_Ativacao"])
+    return pd.concat(somas_por_fonte, ignore_index=True)
+
+COLUNAS_CATEGORICAS = ["Departamento", "Plano", "Tipo", "Licença"]
+COLUNAS_CENTRO_CUSTO = ["Centro_Custo_Ferramentas", "Centro_Custo_Beneficios"]
+ROTULO_SEM_DEPARTAMENTO = "Sem Departamento"
+ROTULO_TOTAL_GERAL = "Total Geral"
+ROTULO_NAO_ALOCADO = "Não Alocado"
+# Diferença máxima (em reais) aceita entre o total do relatório e o da fatura quando os valores são float.
+TOLERANCIA_CONFERENCIA_TOTAIS = 0.005
+
+def nome_coluna_data_ativacao(nome_coluna_custo: str) -> str:
+    """'Custo_GitHub' -> 'Data_Ativacao_GitHub'."""
+    return f"Data_Ativacao_{nome_coluna_custo.replace('Custo_', '', 1)}"
+
+def converter_para_centavos(serie: pd.Series) -> pd.Series:
+    """Valores monetários em reais -> centavos inteiros (int64), para somas exatas."""
+    return (pd.to_numeric(serie, errors='coerce') * 100).round().fillna(0).astype("int64")
+
+def arredondar_para_centavos(serie: pd.Series) -> pd.Series:
+    """
+    Valores monetários em reais arredondados a centavos (float), linha a linha e no mesmo ponto em que
+    o modo compacto converte para centavos inteiros: relatório, totais por departamento e os dois modos
+    somam os mesmos centavos.
+    """
+    return pd.to_numeric(serie, errors='coerce').round(2)
+
+def calcular_rollups_departamento(
+    df_consolidado: pd.DataFrame,
+    mapeamento_colunas: Dict[str, Any]
+) -> Dict[str, pd.DataFrame]:
+    """
+    Totais por departamento em um único groupby vetorizado: número de colaboradores, custo por fonte,
+    centros de custo e total, custo per capita e participação de cada fonte no total do departamento,
+    seguidos de uma linha 'Não Alocado' (se houver) e de uma linha de total geral. Retorna
+    {"Departamentos": ..., "CentrosDeCusto": ...}, este último em formato longo (departamento, centro de
+    custo, valor, participação). Valores em reais, também no modo compacto. Sem a coluna 'Departamento',
+    retorna um dicionário vazio.
+    """
+    if "Departamento" not in df_consolidado.columns or "Custo_Geral_Total" not in df_consolidado.columns:
+        return {}
+    colunas_fontes = [
+        mapa['nome_padronizado_custo'] for mapa in mapeamento_colunas.values()
+        if mapa['nome_padronizado_custo'] in df_consolidado.columns
+    ]
+    colunas_centros = [col for col in COLUNAS_CENTRO_CUSTO if col in df_consolidado.columns]
+    colunas_somadas = list(dict.fromkeys(colunas_fontes + colunas_centros + ["Custo_Geral_Total"]))
+
+    # A linha 'Não Alocado' (custos sem colaborador único) não entra no groupby: vira uma linha própria.
+    eh_colaborador = (
+        ~df_consolidado["Nao_Alocado"] if "Nao_Alocado" in df_consolidado.columns
+        else pd.Series(True, index=df_consolidado.index)
+    )
+    df_colaboradores = df_consolidado[eh_colaborador]
+    departamentos = df_colaboradores["Departamento"].astype(object).fillna(ROTULO_SEM_DEPARTAMENTO)
+    por_departamento = df_colaboradores.groupby(departamentos, sort=True).agg(
+        Colaboradores=("Custo_Geral_Total", "size"), **{col: (col, "sum") for col in colunas_somadas}
+    )
+    por_departamento.index.name = "Departamento"
+    # Linhas extras acrescentadas depois da agregação, com índice posicional: um departamento real
+    # chamado 'Total Geral' ou 'Não Alocado' continua sendo uma linha separada.
+    linhas = [por_departamento.reset_index()]
+    if not eh_colaborador.all():
+        linhas.append(pd.DataFrame([{
+            "Departamento": ROTULO_NAO_ALOCADO, "Colaboradores": 0,
+            **df_consolidado.loc[~eh_colaborador, colunas_somadas].sum().to_dict(),
+        }]))
+    linhas.append(pd.DataFrame([{
+        "Departamento": ROTULO_TOTAL_GERAL, "Colaboradores": len(df_colaboradores),
+        **df_consolidado[colunas_somadas].sum().to_dict(),
+    }]))
+    agregado = pd.concat(linhas, ignore_index=True)
+    agregado["Colaboradores"] = agregado["Colaboradores"].astype("int64")
+    if df_consolidado.attrs.get("valores_em_centavos"):
+        agregado[colunas_somadas] = agregado[colunas_somadas] / 100
+    agregado[colunas_somadas] = agregado[colunas_somadas].astype("float64").round(2)
+
+    total = agregado["Custo_Geral_Total"].where(agregado["Custo_Geral_Total"] != 0)
+    agregado["Custo_Per_Capita"] = (
+        agregado["Custo_Geral_Total"] / agregado["Colaboradores"].where(agregado["Colaboradores"] > 0)
+    ).fillna(0).round(2)
+    participacoes = agregado[colunas_fontes].div(total, axis=0).fillna(0).round(4)
+    participacoes.columns = [f"Participacao_{col}" for col in colunas_fontes]
+    df_departamentos = pd.concat([agregado, participacoes], axis=1)
+
+    # Centros de custo: salário base (custo de 'colaboradores'), ferramentas e benefícios.
+    coluna_salario = mapeamento_colunas.get("colaboradores", {}).get("nome_padronizado_custo")
+    colunas_centro = [col for col in [coluna_salario] + colunas_centros if col in agregado.columns]
+    valores_centro = agregado[colunas_centro]
+    df_centros = pd.DataFrame({
+        "Departamento": np.repeat(agregado["Departamento"].to_numpy(), len(colunas_centro)),
+        "Centro_Custo": np.tile(colunas_centro, len(valores_centro)),
+        "Valor": valores_centro.to_numpy().ravel(),
+        "Participacao": valores_centro.div(total, axis=0).fillna(0).round(4).to_numpy().ravel(),
+    })
+    return {"Departamentos": df_departamentos, "CentrosDeCusto": df_centros}
+
+def medir_memoria(dataframes: Dict[str, pd.DataFrame]) -> int:
+    """Memória ocupada (bytes, incluindo o conteúdo de strings) pelo conjunto de DataFrames."""
+    return int(sum(df.memory_usage(deep=True).sum() for df in dataframes.values()))
+
+def imprimir_relatorio_memoria(etapa: str, bytes_antes: int, bytes_depois: int) -> None:
+    reducao = (1 - bytes_depois / bytes_antes) * 100 if bytes_antes else 0.0
+    print(f"  [MEMÓRIA] {etapa}: {bytes_antes / 1024 ** 2:.3f} MB -> {bytes_depois / 1024 ** 2:.3f} MB ({reducao:.1f}% menor)")
+
 def consolidar_e_calcular_custos(
     dataframes_brutos: Dict[str, pd.DataFrame], 
-    mapeamento_colunas: Dict[str, Any]
+    mapeamento_colunas: Dict[str, Any],
+    modo_compacto: bool = False,
+    custos_pre_agregados: Optional[pd.DataFrame] = None,
+    rollups_departamento: Optional[Dict[str, pd.DataFrame]] = None
 ) -> Optional[pd.DataFrame]:
+    """
+    Padroniza as planilhas, agrega os custos por CPF e nome, aloca cada custo a um único colaborador
+    (`alocar_custos_aos_colaboradores`) e calcula subtotais e total por colaborador. Custos que não
+    identificam um único colaborador vão para uma linha 'Não Alocado' (coluna `Nao_Alocado` verdadeira),
+    e o total de cada fonte no consolidado é conferido com o total da fatura (divergência -> None).
+    Se `custos_pre_agregados` (saída de `agregar_custos_em_streaming`) for informado, os custos dos
+    fornecedores vêm dele e `dataframes_brutos` precisa conter apenas 'colaboradores'.
+    Com `modo_compacto`, os valores monetários ficam em centavos inteiros (int64, somas exatas;
+    sinalizado em `df.attrs["valores_em_centavos"]`), as colunas de baixa cardinalidade viram
+    `category`, e um relatório de memória antes/depois é impresso por etapa.
+    Se `rollups_departamento` (um dicionário) for informado, recebe os totais por departamento e
+    centro de custo de `calcular_rollups_departamento`, calculados sobre o consolidado já em memória.
+    """
     func_prefix = "[consolidar_e_calcular_custos]"
     print(f"\n--- Iniciando Etapa 3: Consolidação e Cálculo de Custos ---")
 
@@ -44,6 +685,8 @@ def consolidar_e_calcular_custos(
 
     dataframes_padronizados: Dict[str, pd.DataFrame] = {}
     nomes_custos_individuais_padronizados = [] 
+    relatorios_cpf_invalidos: List[pd.DataFrame] = []
+    totais_faturados: Dict[str, Any] = {}
 
     for nome_df_original, df_bruto in dataframes_brutos.items():
         if nome_df_original not in mapeamento_colunas:
@@ -59,15 +702,32 @@ def consolidar_e_calcular_custos(
             print(f"{func_prefix} ERRO: Colunas mapeadas {colunas_necessarias_originais} não encontradas em '{nome_df_original}'. Disponíveis: {list(df_bruto.columns)}")
             return None
         try:
+            # Cópia explícita só das colunas mapeadas: as atribuições abaixo não podem alterar `df_bruto`.
             df_temp = df_bruto[colunas_necessarias_originais].copy()
             df_temp.rename(columns={
                 col_orig_nome: "Nome_Padronizado", 
                 col_orig_cpf: "CPF_Padronizado",    
                 col_orig_custo: nome_pad_custo      
             }, inplace=True)
-            df_temp["CPF_Padronizado"] = df_temp["CPF_Padronizado"].astype(str).str.replace(r'\D', '', regex=True)
+            if modo_compacto:
+                df_temp[nome_pad_custo] = converter_para_centavos(df_temp[nome_pad_custo])
+            else:
+                df_temp[nome_pad_custo] = arredondar_para_centavos(df_temp[nome_pad_custo])
+            if (COLUNA_DATA_ATIVACAO in COLUNAS_ADICIONAIS_POR_PLANILHA.get(nome_df_original, [])
+                    and COLUNA_DATA_ATIVACAO in df_bruto.columns):
+                df_temp[nome_coluna_data_ativacao(nome_pad_custo)] = pd.to_datetime(
+                    df_bruto[COLUNA_DATA_ATIVACAO], errors='coerce', dayfirst=True
+                )
+            chaves_cpf, motivo_cpf = normalizar_cpf(df_temp["CPF_Padronizado"])
+            relatorios_cpf_invalidos.append(
+                relatar_cpfs_invalidos(nome_df_original, df_temp["CPF_Padronizado"], motivo_cpf)
+            )
+            df_temp["CPF_Padronizado"] = chaves_cpf
+            df_temp["CPF_Validado"] = motivo_cpf.isna()
             if nome_df_original != "colaboradores":
-                df_temp.drop_duplicates(subset=["CPF_Padronizado"], keep='first', inplace=True)
+                totais_faturados[nome_pad_custo] = pd.to_numeric(df_temp[nome_pad_custo], errors='coerce').sum()
+            if not df_temp["CPF_Padronizado"].hasnans:
+                df_temp["CPF_Padronizado"] = df_temp["CPF_Padronizado"].astype("int64")
             dataframes_padronizados[nome_df_original] = df_temp
             nomes_custos_individuais_padronizados.append(nome_pad_custo) 
             print(f"{func_prefix} DataFrame '{nome_df_original}' padronizado. Colunas: {list(df_temp.columns)}")
@@ -76,29 +736,90 @@ def consolidar_e_calcular_custos(
         except Exception as e:
             print(f"{func_prefix} ERRO ao padronizar '{nome_df_original}': {e}"); traceback.print_exc(); return None
             
+    total_cpfs_invalidos = sum(len(r) for r in relatorios_cpf_invalidos)
+    if total_cpfs_invalidos:
+        print(f"{func_prefix} ALERTA: {total_cpfs_invalidos} linha(s) com CPF inválido no total. "
+              f"Nas fontes de custo, linhas sem CPF vão para '{ROTULO_NAO_ALOCADO}'; CPFs mascarados ou inválidos "
+              f"só são vinculados junto com o nome.")
+
     if "colaboradores" not in dataframes_padronizados:
         print(f"{func_prefix} ERRO: DataFrame 'colaboradores' padronizado é essencial."); return None
 
-    df_consolidado = dataframes_padronizados["colaboradores"].copy()
-    print(f"{func_prefix} Iniciando merge dos DataFrames...")
-    for nome_df_original_loop, df_custo_atual in dataframes_padronizados.items():
-        if nome_df_original_loop == "colaboradores": continue
-        mapa_custo_atual = mapeamento_colunas[nome_df_original_loop]
-        nome_coluna_custo_especifico = mapa_custo_atual['nome_padronizado_custo']
-        if "CPF_Padronizado" in df_custo_atual.columns and nome_coluna_custo_especifico in df_custo_atual.columns:
-            df_para_merge = df_custo_atual[["CPF_Padronizado", nome_coluna_custo_especifico]]
-            df_consolidado = pd.merge(df_consolidado, df_para_merge, on="CPF_Padronizado", how="left")
-            print(f"{func_prefix} Merge com '{nome_df_original_loop}' realizado.")
-        else:
-            print(f"{func_prefix} ALERTA: '{nome_df_original_loop}' sem 'CPF_Padronizado' ou '{nome_coluna_custo_especifico}'. Merge pulado.")
+    if modo_compacto:
+        imprimir_relatorio_memoria(
+            "Padronização (planilhas brutas -> colunas padronizadas)",
+            medir_memoria(dataframes_brutos), medir_memoria(dataframes_padronizados)
+        )
+
+    df_consolidado = dataframes_padronizados["colaboradores"]
+    cpfs_repetidos = df_consolidado["CPF_Padronizado"][df_consolidado["CPF_Padronizado"].duplicated()].unique().tolist()
+    if len(cpfs_repetidos):
+        print(f"{func_prefix} ALERTA: CPFs repetidos em 'colaboradores' ({len(cpfs_repetidos)}): {cpfs_repetidos}. "
+              f"Os custos desses CPFs são vinculados pelo CPF e pelo nome.")
+
+    print(f"{func_prefix} Agregando custos dos fornecedores por CPF e nome...")
+    if custos_pre_agregados is not None:
+        custos_longos = custos_pre_agregados
+        nomes_custos_individuais_padronizados.extend(
+            fonte for fonte in custos_longos["Fonte"].unique() if fonte not in nomes_custos_individuais_padronizados
+        )
+        # O formato longo mantém todas as linhas das faturas (inclusive sem CPF): sua soma é o total faturado.
+        totais_faturados = custos_longos.groupby("Fonte", sort=False)["Valor"].sum().to_dict()
+    else:
+        custos_longos = agregar_custos_por_cpf(dataframes_padronizados, mapeamento_colunas)
+
+    nao_alocados_por_fonte: Dict[str, Any] = {}
+    if len(custos_longos):
+        alocados, nao_alocados = alocar_custos_aos_colaboradores(df_consolidado, custos_longos)
+        if len(alocados):
+            por_colaborador = alocados.groupby(["Posicao", "Fonte"], sort=False).agg(
+                Valor=("Valor", "sum"), Data_Ativacao=("Data_Ativacao", "min")
+            )
+            datas = por_colaborador["Data_Ativacao"].unstack("Fonte").dropna(axis=1, how="all")
+            datas.columns = [nome_coluna_data_ativacao(fonte) for fonte in datas.columns]
+            colunas_alocadas = pd.concat([por_colaborador["Valor"].unstack("Fonte"), datas], axis=1)
+            colunas_alocadas = colunas_alocadas.reindex(np.arange(len(df_consolidado))).rename_axis(columns=None)
+            colunas_alocadas.index = df_consolidado.index
+            df_consolidado = pd.concat([df_consolidado, colunas_alocadas], axis=1)
+        if len(nao_alocados):
+            nao_alocados_por_fonte = nao_alocados.groupby("Fonte", sort=False)["Valor"].sum().to_dict()
+            print(f"{func_prefix} ALERTA: {len(nao_alocados)} custo(s) sem colaborador único (sem CPF, CPF fora do "
+                  f"cadastro, ou CPF mascarado/compartilhado sem nome correspondente) vão para '{ROTULO_NAO_ALOCADO}': {nao_alocados_por_fonte}. "
+                  f"Exemplos: {nao_alocados.head(MAX_EXEMPLOS_CPF_INVALIDO).to_dict('records')}")
+    print(f"{func_prefix} Custos alocados aos colaboradores ({custos_longos['Fonte'].nunique()} fonte(s)).")
 
     for col_custo in nomes_custos_individuais_padronizados:
         if col_custo in df_consolidado.columns:
             df_consolidado[col_custo] = df_consolidado[col_custo].fillna(0)
+            if modo_compacto:
+                df_consolidado[col_custo] = df_consolidado[col_custo].astype("int64")
         else:
             print(f"{func_prefix} ALERTA: Coluna de custo '{col_custo}' ausente após merges. Adicionando com valor 0.")
             df_consolidado[col_custo] = 0
-            
+
+    col_orig_depto = mapeamento_colunas.get("colaboradores", {}).get("coluna_original_departamento")
+    if col_orig_depto and col_orig_depto in dataframes_brutos["colaboradores"].columns:
+        df_consolidado["Departamento"] = dataframes_brutos["colaboradores"][col_orig_depto]
+    elif "Departamento" in dataframes_brutos["colaboradores"].columns: 
+        df_consolidado["Departamento"] = dataframes_brutos["colaboradores"]["Departamento"]
+    if "Departamento" in df_consolidado.columns:
+        print(f"{func_prefix} Coluna 'Departamento' adicionada/confirmada.")
+
+    df_consolidado["Nao_Alocado"] = False
+    if nao_alocados_por_fonte:
+        linha_nao_alocada = {
+            "CPF_Padronizado": pd.NA, "CPF_Validado": False, "Nome_Padronizado": ROTULO_NAO_ALOCADO, "Nao_Alocado": True,
+            **{col: nao_alocados_por_fonte.get(col, 0) for col in nomes_custos_individuais_padronizados},
+        }
+        if "Departamento" in df_consolidado.columns:
+            linha_nao_alocada["Departamento"] = ROTULO_NAO_ALOCADO
+        df_consolidado = pd.concat([df_consolidado, pd.DataFrame([linha_nao_alocada])], ignore_index=True)
+        df_consolidado["CPF_Padronizado"] = df_consolidado["CPF_Padronizado"].astype("Int64")
+        if modo_compacto:
+            df_consolidado[nomes_custos_individuais_padronizados] = (
+                df_consolidado[nomes_custos_individuais_padronizados].astype("int64")
+            )
+
     print(f"{func_prefix} Calculando subtotais de custos...")
     custo_unimed_col = mapeamento_colunas.get("unimed", {}).get("nome_padronizado_custo", "Custo_Unimed")
     custo_gympass_col = mapeamento_colunas.get("gympass", {}).get("nome_padronizado_custo", "Custo_Gympass")
@@ -121,14 +842,31 @@ def consolidar_e_calcular_custos(
         
     df_consolidado["Custo_Geral_Total"] = df_consolidado[colunas_para_soma_total].sum(axis=1)
     print(f"{func_prefix} Custo Geral Total calculado.")
-    
-    col_orig_depto = mapeamento_colunas.get("colaboradores", {}).get("coluna_original_departamento")
-    if col_orig_depto and col_orig_depto in dataframes_brutos["colaboradores"].columns:
-        df_consolidado["Departamento"] = dataframes_brutos["colaboradores"][col_orig_depto]
-    elif "Departamento" in dataframes_brutos["colaboradores"].columns: 
-        df_consolidado["Departamento"] = dataframes_brutos["colaboradores"]["Departamento"]
-    if "Departamento" in df_consolidado.columns:
-        print(f"{func_prefix} Coluna 'Departamento' adicionada/confirmada.")
+
+    tolerancia = 0 if modo_compacto else TOLERANCIA_CONFERENCIA_TOTAIS
+    divergencias = {
+        fonte: (df_consolidado[fonte].sum(), total_faturado) for fonte, total_faturado in totais_faturados.items()
+        if abs(df_consolidado[fonte].sum() - total_faturado) > tolerancia
+    }
+    if divergencias:
+        print(f"{func_prefix} ERRO: Total por fonte difere do total faturado (consolidado, fatura): {divergencias}")
+        return None
+    print(f"{func_prefix} Conferência: total de cada fonte igual ao total faturado.")
+
+    if modo_compacto:
+        bytes_antes = medir_memoria({"consolidado": df_consolidado})
+        for col in COLUNAS_CATEGORICAS:
+            if col in df_consolidado.columns:
+                df_consolidado[col] = df_consolidado[col].astype("category")
+        df_consolidado.attrs["valores_em_centavos"] = True
+        imprimir_relatorio_memoria(
+            "Consolidado (colunas categóricas)", bytes_antes, medir_memoria({"consolidado": df_consolidado})
+        )
+
+    if rollups_departamento is not None:
+        rollups_departamento.update(calcular_rollups_departamento(df_consolidado, mapeamento_colunas))
+        if rollups_departamento:
+            print(f"{func_prefix} Totais por departamento calculados ({len(rollups_departamento['Departamentos'])} linha(s), com o total geral).")
 
     print(f"--- Etapa 3 Concluída: Consolidação e Cálculos Finalizados ---")
     return df_consolidado
\ No newline at end of file
@@ -0,0 +1,120 @@
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Any, Tuple
+
+import pandas as pd
+
+LIMIAR_CONFIANCA_HEURISTICA = 0.75
+MARGEM_MINIMA_ENTRE_CANDIDATAS = 0.08
+TAMANHO_AMOSTRA_VALORES = 200
+PESO_CABECALHO = 0.6
+PESO_VALORES = 0.4
+
+SINONIMOS_POR_PAPEL: Dict[str, List[str]] = {
+    "nome": ["nome", "nome completo", "assinante", "beneficiario", "colaborador", "funcionario", "titular", "usuario"],
+    "cpf": ["cpf", "documento", "doc", "cpf do colaborador", "numero do documento"],
+    "custo": ["valor mensal", "total", "salario", "custo", "valor", "mensalidade", "remuneracao"],
+}
+# Mesmas dicas de coluna de custo usadas no prompt do LLM (src/agent_mapper.py).
+DICAS_COLUNA_CUSTO: Dict[str, str] = {
+    "colaboradores": "salario", "github": "valor mensal", "gympass": "valor mensal",
+    "google_workspace": "valor mensal", "unimed": "total",
+}
+
+# Mascaramento aceito só no formato das faturas (sufixo inteiro "-XX"): IDs numéricos com X não contam como CPF.
+_PADRAO_CPF = r"\d{3}\.?\d{3}\.?\d{3}(?:-?\d{2}|-XX)"
+# Classe de letras explícita: o motor de regex das colunas string do pandas (Arrow/RE2) trata \w como ASCII.
+_LETRAS = "A-Za-zÀ-ÖØ-öø-ÿ"
+_PADRAO_NOME_PESSOA = rf"[{_LETRAS}]+(?:[ '\-][{_LETRAS}]+)+"
+
+
+def normalizar_cabecalho(cabecalho: Any) -> str:
+    """Minúsculas, sem acentos e com qualquer caractere não alfanumérico virando espaço simples."""
+    texto = unicodedata.normalize("NFKD", str(cabecalho)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", texto.lower()).split())
+
+
+def pontuar_cabecalho(cabecalho_normalizado: str, sinonimos: List[str]) -> float:
+    """Similaridade difusa (0..1) entre o cabeçalho e o sinônimo mais próximo do papel."""
+    melhor = 0.0
+    palavras = f" {cabecalho_normalizado} "
+    for sinonimo in sinonimos:
+        if cabecalho_normalizado == sinonimo:
+            return 1.0
+        similaridade = SequenceMatcher(None, cabecalho_normalizado, sinonimo).ratio()
+        if f" {sinonimo} " in palavras:
+            similaridade = max(similaridade, 0.8)
+        melhor = max(melhor, similaridade)
+    return melhor
+
+
+def pontuar_valores(serie: pd.Series, papel: str) -> float:
+    """Fração (0..1) dos valores amostrados que têm a cara do papel: CPF, valor monetário ou nome de pessoa."""
+    amostra = serie.dropna().head(TAMANHO_AMOSTRA_VALORES)
+    if amostra.empty:
+        return 0.0
+    if papel == "custo":
+        if pd.api.types.is_datetime64_any_dtype(amostra) or pd.api.types.is_bool_dtype(amostra):
+            return 0.0
+        return float(pd.to_numeric(amostra, errors="coerce").notna().mean())
+    if papel == "cpf":
+        if pd.api.types.is_numeric_dtype(amostra):
+            numeros = pd.to_numeric(amostra, errors="coerce")
+            return float(((numeros % 1 == 0) & (numeros >= 1e8) & (numeros < 1e11)).mean())
+        return float(amostra.astype(str).str.strip().str.fullmatch(_PADRAO_CPF).mean())
+    if papel == "nome":
+        if pd.api.types.is_numeric_dtype(amostra) or pd.api.types.is_datetime64_any_dtype(amostra):
+            return 0.0
+        return float(amostra.astype(str).str.normalize("NFC").str.strip().str.fullmatch(_PADRAO_NOME_PESSOA).mean())
+    return 0.0
+
+
+def mapear_colunas_heuristico(
+    nome_planilha: str,
+    colunas: List[str],
+    amostra: Optional[pd.DataFrame] = None
+) -> Tuple[Optional[Dict[str, str]], float]:
+    """
+    Mapeamento determinístico local: pontua cada coluna para os papéis nome/CPF/custo combinando
+    similaridade do cabeçalho e, se houver `amostra`, o formato dos valores.
+    Retorna (identificação no formato do LLM, confiança); a identificação é None se algum papel
+    ficar ambíguo (duas candidatas com pontuação próxima) ou sem candidata.
+    """
+    func_prefix = "[mapear_colunas_heuristico]"
+    if not colunas:
+        return None, 0.0
+
+    sinonimos = {papel: list(lista) for papel, lista in SINONIMOS_POR_PAPEL.items()}
+    if nome_planilha in DICAS_COLUNA_CUSTO:
+        sinonimos["custo"].insert(0, DICAS_COLUNA_CUSTO[nome_planilha])
+
+    cabecalhos_normalizados = {col: normalizar_cabecalho(col) for col in colunas}
+    escolhidas: Dict[str, str] = {}
+    confiancas: List[float] = []
+    for papel in ("cpf", "nome", "custo"):
+        pontuacoes = []
+        for col in colunas:
+            if col in escolhidas.values():
+                continue
+            pontuacao = pontuar_cabecalho(cabecalhos_normalizados[col], sinonimos[papel])
+            if amostra is not None and col in amostra.columns:
+                pontuacao = PESO_CABECALHO * pontuacao + PESO_VALORES * pontuar_valores(amostra[col], papel)
+            pontuacoes.append((pontuacao, col))
+        if not pontuacoes:
+            return None, 0.0
+        pontuacoes.sort(key=lambda item: item[0], reverse=True)
+        melhor_pontuacao, melhor_coluna = pontuacoes[0]
+        if len(pontuacoes) > 1 and melhor_pontuacao - pontuacoes[1][0] < MARGEM_MINIMA_ENTRE_CANDIDATAS:
+            print(f"{func_prefix} '{nome_planilha}': papel '{papel}' ambíguo entre "
+                  f"'{melhor_coluna}' ({melhor_pontuacao:.2f}) e '{pontuacoes[1][1]}' ({pontuacoes[1][0]:.2f}).")
+            return None, melhor_pontuacao
+        escolhidas[papel] = melhor_coluna
+        confiancas.append(melhor_pontuacao)
+
+    identificacao = {
+        "col_nome_identificada": escolhidas["nome"],
+        "col_cpf_identificada": escolhidas["cpf"],
+        "col_custo_identificada": escolhidas["custo"],
+    }
+    return identificacao, min(confiancas)
@@ -0,0 +1,243 @@
+import os
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from src.data_handler import converter_para_centavos, normalizar_cpf
+
+DIRETORIO_HISTORICO_PADRAO = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'historico'
+)
+ARQUIVO_HISTORICO = "historico_custos.sqlite"
+TABELA_HISTORICO = "historico_custos"
+TABELA_HISTORICO_DEPARTAMENTOS = "historico_departamentos"
+COLUNAS_SUBTOTAIS = ["Centro_Custo_Ferramentas", "Centro_Custo_Beneficios", "Custo_Geral_Total"]
+# Demais colunas das tabelas do histórico são valores monetários, gravados em centavos.
+COLUNAS_NAO_MONETARIAS = {
+    "Competencia", "CPF_Padronizado", "Nome_Padronizado", "Departamento", "Nao_Alocado", "Colaboradores"
+}
+
+
+def caminho_historico(diretorio_historico: Optional[str] = None) -> str:
+    return os.path.join(diretorio_historico or DIRETORIO_HISTORICO_PADRAO, ARQUIVO_HISTORICO)
+
+
+def _eh_monetaria(coluna: str) -> bool:
+    return coluna not in COLUNAS_NAO_MONETARIAS and not coluna.startswith("Data_Ativacao_")
+
+
+def _colunas_monetarias(df_consolidado: pd.DataFrame, mapeamento_colunas: Dict[str, Any]) -> List[str]:
+    """Custo de cada fonte (na ordem do mapeamento) seguido dos subtotais e do total."""
+    colunas = [mapa['nome_padronizado_custo'] for mapa in mapeamento_colunas.values()]
+    return [col for col in dict.fromkeys(colunas + COLUNAS_SUBTOTAIS) if col in df_consolidado.columns]
+
+
+def montar_lancamentos_historico(
+    df_consolidado: pd.DataFrame,
+    mapeamento_colunas: Dict[str, Any],
+    competencia: str
+) -> pd.DataFrame:
+    """
+    Converte a saída de `consolidar_e_calcular_custos` nas linhas do histórico: competência, CPF como
+    chave inteira, nome, departamento, marcador da linha de custos não alocados (0/1), custo por fonte,
+    subtotais e total em centavos inteiros (somas exatas entre competências) e as datas de ativação
+    por fonte em ISO (AAAA-MM-DD).
+    """
+    lancamentos = pd.DataFrame({
+        "Competencia": competencia,
+        "CPF_Padronizado": df_consolidado["CPF_Padronizado"].astype("Int64"),
+        "Nome_Padronizado": df_consolidado["Nome_Padronizado"].astype(object),
+        "Departamento": (
+            df_consolidado["Departamento"].astype(object) if "Departamento" in df_consolidado.columns else None
+        ),
+        "Nao_Alocado": (
+            df_consolidado["Nao_Alocado"].astype("int64") if "Nao_Alocado" in df_consolidado.columns else 0
+        ),
+    })
+    ja_em_centavos = bool(df_consolidado.attrs.get("valores_em_centavos"))
+    for col in _colunas_monetarias(df_consolidado, mapeamento_colunas):
+        lancamentos[col] = df_consolidado[col].astype("int64") if ja_em_centavos else converter_para_centavos(df_consolidado[col])
+    for col in sorted(c for c in df_consolidado.columns if c.startswith("Data_Ativacao_")):
+        lancamentos[col] = pd.to_datetime(df_consolidado[col], errors='coerce').dt.strftime("%Y-%m-%d")
+    return lancamentos
+
+
+def _garantir_tabela(conexao: sqlite3.Connection, lancamentos: pd.DataFrame) -> None:
+    """Cria a tabela e os índices na primeira gravação; fontes novas viram colunas novas (ALTER TABLE)."""
+    colunas_existentes = [linha[1] for linha in conexao.execute(f"PRAGMA table_info({TABELA_HISTORICO})")]
+    if not colunas_existentes:
+        lancamentos.head(0).to_sql(TABELA_HISTORICO, conexao, index=False)
+    else:
+        for col in lancamentos.columns:
+            if col not in colunas_existentes:
+                tipo = "INTEGER" if pd.api.types.is_integer_dtype(lancamentos[col]) else "TEXT"
+                conexao.execute(f'ALTER TABLE {TABELA_HISTORICO} ADD COLUMN "{col}" {tipo}')
+    # Competência e departamento lideram o índice de período; CPF lidera o de histórico individual.
+    conexao.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_{TABELA_HISTORICO}_competencia_departamento "
+        f"ON {TABELA_HISTORICO} (Competencia, Departamento)"
+    )
+    conexao.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_{TABELA_HISTORICO}_cpf_competencia "
+        f"ON {TABELA_HISTORICO} (CPF_Padronizado, Competencia)"
+    )
+
+
+def _atualizar_agregados_departamento(conexao: sqlite3.Connection, competencia: str) -> None:
+    """
+    Recalcula as linhas de `competencia` na tabela de totais por competência e departamento.
+    Se o histórico ganhou uma fonte nova desde a criação dessa tabela, ela é recriada por inteiro.
+    """
+    colunas_monetarias = [
+        linha[1] for linha in conexao.execute(f"PRAGMA table_info({TABELA_HISTORICO})") if _eh_monetaria(linha[1])
+    ]
+    selecao = (
+        "SELECT Competencia, Departamento, SUM(CASE WHEN Nao_Alocado = 1 THEN 0 ELSE 1 END) AS Colaboradores, "
+        + ", ".join(f'SUM("{col}") AS "{col}"' for col in colunas_monetarias)
+        + f" FROM {TABELA_HISTORICO}"
+    )
+    colunas_agregado = [linha[1] for linha in conexao.execute(f"PRAGMA table_info({TABELA_HISTORICO_DEPARTAMENTOS})")]
+    if colunas_agregado == ["Competencia", "Departamento", "Colaboradores"] + colunas_monetarias:
+        conexao.execute(f"DELETE FROM {TABELA_HISTORICO_DEPARTAMENTOS} WHERE Competencia = ?", (competencia,))
+        conexao.execute(
+            f"INSERT INTO {TABELA_HISTORICO_DEPARTAMENTOS} {selecao} WHERE Competencia = ? GROUP BY Competencia, Departamento",
+            (competencia,)
+        )
+        return
+    conexao.execute(f"DROP TABLE IF EXISTS {TABELA_HISTORICO_DEPARTAMENTOS}")
+    conexao.execute(f"CREATE TABLE {TABELA_HISTORICO_DEPARTAMENTOS} AS {selecao} GROUP BY Competencia, Departamento")
+    conexao.execute(
+        f"CREATE INDEX idx_{TABELA_HISTORICO_DEPARTAMENTOS}_competencia "
+        f"ON {TABELA_HISTORICO_DEPARTAMENTOS} (Competencia, Departamento)"
+    )
+
+
+def registrar_no_historico(
+    df_consolidado: pd.DataFrame,
+    mapeamento_colunas: Dict[str, Any],
+    competencia: Optional[str] = None,
+    diretorio_historico: Optional[str] = None
+) -> Optional[str]:
+    """
+    Acrescenta o consolidado de uma competência (AAAA-MM; padrão: mês atual) ao histórico de custos
+    em SQLite, substituindo as linhas já gravadas para a mesma competência. O histórico é indexado por
+    (competência, departamento) e por (CPF, competência), e mantém uma tabela de totais por competência
+    e departamento, de modo que as consultas não precisam percorrer todas as competências.
+    Retorna o caminho do banco, ou None em caso de erro.
+    """
+    func_prefix = "[registrar_no_historico]"
+    if df_consolidado is None or df_consolidado.empty:
+        print(f"{func_prefix} ERRO: DataFrame consolidado está vazio ou não foi fornecido.")
+        return None
+    competencia = competencia or datetime.now().strftime("%Y-%m")
+    caminho = caminho_historico(diretorio_historico)
+    try:
+        lancamentos = montar_lancamentos_historico(df_consolidado, mapeamento_colunas, competencia)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with sqlite3.connect(caminho) as conexao:
+            _garantir_tabela(conexao, lancamentos)
+            conexao.execute(f"DELETE FROM {TABELA_HISTORICO} WHERE Competencia = ?", (competencia,))
+            lancamentos.to_sql(TABELA_HISTORICO, conexao, if_exists="append", index=False)
+            _atualizar_agregados_departamento(conexao, competencia)
+    except Exception as e:
+        print(f"{func_prefix} ERRO ao gravar o histórico da competência '{competencia}': {type(e).__name__} - {e}")
+        return None
+    print(f"{func_prefix} Competência '{competencia}' gravada no histórico ({len(lancamentos)} colaboradores): {caminho}")
+    return caminho
+
+
+def _em_reais(df: pd.DataFrame) -> pd.DataFrame:
+    """Colunas monetárias (centavos no banco) -> reais."""
+    for col in df.columns:
+        if _eh_monetaria(col):
+            df[col] = df[col] / 100
+    return df
+
+
+def listar_competencias(diretorio_historico: Optional[str] = None) -> List[str]:
+    """Competências gravadas no histórico, da mais antiga para a mais recente."""
+    caminho = caminho_historico(diretorio_historico)
+    if not os.path.isfile(caminho):
+        return []
+    with sqlite3.connect(caminho) as conexao:
+        linhas = conexao.execute(
+            f"SELECT DISTINCT Competencia FROM {TABELA_HISTORICO_DEPARTAMENTOS} ORDER BY Competencia"
+        ).fetchall()
+    return [linha[0] for linha in linhas]
+
+
+def carregar_competencia(
+    competencia: Optional[str] = None,
+    diretorio_historico: Optional[str] = None
+) -> Tuple[Optional[str], pd.DataFrame]:
+    """
+    Linhas individuais de uma competência (padrão: a mais recente), com custos em reais, lidas pelo
+    índice de competência. Retorna (competência, DataFrame); (None, vazio) se não houver histórico.
+    """
+    competencias = listar_competencias(diretorio_historico)
+    if competencia is None:
+        competencia = competencias[-1] if competencias else None
+    if competencia is None or competencia not in competencias:
+        return None, pd.DataFrame()
+    with sqlite3.connect(caminho_historico(diretorio_historico)) as conexao:
+        df = pd.read_sql_query(
+            f"SELECT * FROM {TABELA_HISTORICO} WHERE Competencia = ?", conexao, params=(competencia,)
+        )
+    return competencia, _em_reais(df)
+
+
+def consultar_custo_departamentos(
+    meses: Optional[int] = None,
+    departamento: Optional[str] = None,
+    diretorio_historico: Optional[str] = None
+) -> pd.DataFrame:
+    """
+    Custo por departamento e competência nas últimas `meses` competências gravadas (todas, se None):
+    número de colaboradores, custo por fonte, subtotais e total, em reais. Lê apenas a tabela de
+    totais por departamento, sem percorrer as linhas individuais.
+    """
+    caminho = caminho_historico(diretorio_historico)
+    if not os.path.isfile(caminho):
+        print(f"[consultar_custo_departamentos] ALERTA: Histórico não encontrado em '{caminho}'.")
+        return pd.DataFrame()
+    competencias = listar_competencias(diretorio_historico)
+    if meses is not None:
+        competencias = competencias[-meses:] if meses > 0 else []
+    if not competencias:
+        return pd.DataFrame()
+    condicoes = [f"Competencia IN ({','.join('?' * len(competencias))})"]
+    parametros: List[Any] = list(competencias)
+    if departamento is not None:
+        condicoes.append("Departamento = ?")
+        parametros.append(departamento)
+    with sqlite3.connect(caminho) as conexao:
+        df = pd.read_sql_query(
+            f"SELECT * FROM {TABELA_HISTORICO_DEPARTAMENTOS} WHERE {' AND '.join(condicoes)} "
+            f"ORDER BY Competencia, Departamento",
+            conexao, params=parametros
+        )
+    return _em_reais(df)
+
+
+def consultar_historico_cpf(cpf: Any, diretorio_historico: Optional[str] = None) -> pd.DataFrame:
+    """
+    Todas as competências de um colaborador (CPF formatado ou não), em ordem cronológica, com custos
+    em reais e datas de ativação. Usa o índice por CPF: só as linhas desse CPF são lidas.
+    """
+    func_prefix = "[consultar_historico_cpf]"
+    caminho = caminho_historico(diretorio_historico)
+    if not os.path.isfile(caminho):
+        print(f"{func_prefix} ALERTA: Histórico não encontrado em '{caminho}'.")
+        return pd.DataFrame()
+    chaves, motivo = normalizar_cpf(pd.Series([cpf]))
+    if pd.isna(chaves.iloc[0]):
+        print(f"{func_prefix} ERRO: CPF inválido '{cpf}' ({motivo.iloc[0]}).")
+        return pd.DataFrame()
+    with sqlite3.connect(caminho) as conexao:
+        df = pd.read_sql_query(
+            f"SELECT * FROM {TABELA_HISTORICO} WHERE CPF_Padronizado = ? ORDER BY Competencia",
+            conexao, params=(int(chaves.iloc[0]),)
+        )
+    return _em_reais(df)
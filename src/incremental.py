@@ -0,0 +1,185 @@
+import os
+import json
+from typing import Dict, List, Optional, Any, Tuple
+
+import pandas as pd
+
+from src.data_handler import (
+    feather, calcular_hash_arquivo, ler_esquemas_planilhas, definir_colunas_necessarias,
+    carregar_planilhas_entrada, agregar_custos_em_streaming, consolidar_e_calcular_custos
+)
+from src.mapping_cache import carregar_mapeamento_arquivo
+
+DIRETORIO_ESTADO_INCREMENTAL_PADRAO = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'cache', 'incremental'
+)
+ARQUIVO_ESTADO = "estado.json"
+ARQUIVO_CONSOLIDADO = "consolidado.feather"
+VERSAO_ESTADO = 4
+
+
+def _estado_vazio(modo_compacto: bool) -> Dict[str, Any]:
+    return {"versao": VERSAO_ESTADO, "modo_compacto": modo_compacto, "fontes": {}}
+
+
+def carregar_estado_incremental(diretorio_estado: str, modo_compacto: bool) -> Dict[str, Any]:
+    """Estado da última execução; é descartado se a versão ou o modo compacto mudaram."""
+    caminho = os.path.join(diretorio_estado, ARQUIVO_ESTADO)
+    if not os.path.isfile(caminho):
+        return _estado_vazio(modo_compacto)
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            estado = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"[carregar_estado_incremental] ALERTA: Estado ilegível ({e}). Recalculando tudo.")
+        return _estado_vazio(modo_compacto)
+    if estado.get("versao") != VERSAO_ESTADO or estado.get("modo_compacto") != modo_compacto:
+        return _estado_vazio(modo_compacto)
+    return estado
+
+
+def salvar_estado_incremental(estado: Dict[str, Any], diretorio_estado: str) -> None:
+    os.makedirs(diretorio_estado, exist_ok=True)
+    caminho = os.path.join(diretorio_estado, ARQUIVO_ESTADO)
+    with open(f"{caminho}.tmp", "w", encoding="utf-8") as f:
+        json.dump(estado, f, indent=2, ensure_ascii=False)
+    os.replace(f"{caminho}.tmp", caminho)
+
+
+def calcular_assinatura_arquivo(caminho: str, assinatura_anterior: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Tamanho, mtime e SHA-256 do arquivo. Se tamanho e mtime coincidem com a assinatura anterior,
+    o hash anterior é reaproveitado sem reler o arquivo.
+    """
+    estado_arquivo = os.stat(caminho)
+    anterior = assinatura_anterior or {}
+    if anterior.get("tamanho") == estado_arquivo.st_size and anterior.get("mtime_ns") == estado_arquivo.st_mtime_ns:
+        sha256 = anterior.get("sha256")
+    else:
+        sha256 = calcular_hash_arquivo(caminho)
+    return {"tamanho": estado_arquivo.st_size, "mtime_ns": estado_arquivo.st_mtime_ns, "sha256": sha256}
+
+
+def _caminho_custos_fonte(diretorio_estado: str, nome_df: str) -> str:
+    return os.path.join(diretorio_estado, f"custos_{nome_df}.feather")
+
+
+def consolidar_incremental(
+    diretorio_input: str,
+    nomes_arquivos: List[str],
+    forcar_atualizacao_mapeamento: bool = False,
+    modo_compacto: bool = False,
+    diretorio_estado: Optional[str] = None,
+    arquivo_mapeamento: Optional[str] = None
+) -> Optional[Tuple[pd.DataFrame, Dict[str, Any]]]:
+    """
+    Etapas 1 a 3 reprocessando apenas as fontes cujo conteúdo mudou desde a última execução.
+    Para cada fornecedor são persistidos o mapeamento e os custos já agregados por CPF e nome; uma fonte
+    inalterada reaproveita esses dados sem ser relida nem remapeada. Subtotais e total são sempre
+    recalculados a partir das colunas por fonte. Sem nenhuma mudança, o último consolidado é devolvido.
+    Com `arquivo_mapeamento`, as fontes alteradas usam o mapeamento desse JSON em vez da Etapa 2.
+    Retorna (DataFrame consolidado, mapeamento de colunas completo) ou None em caso de erro.
+    """
+    func_prefix = "[consolidar_incremental]"
+    print("\n--- Iniciando Consolidação Incremental ---")
+    if feather is None:
+        print(f"{func_prefix} ERRO: O modo incremental requer o pacote 'pyarrow'.")
+        return None
+
+    diretorio_estado = diretorio_estado or DIRETORIO_ESTADO_INCREMENTAL_PADRAO
+    estado = carregar_estado_incremental(diretorio_estado, modo_compacto)
+    if forcar_atualizacao_mapeamento:
+        estado = _estado_vazio(modo_compacto)
+
+    assinaturas: Dict[str, Dict[str, Any]] = {}
+    arquivos_alterados: List[str] = []
+    for nome_arquivo in nomes_arquivos:
+        caminho_completo = os.path.join(diretorio_input, nome_arquivo)
+        if not os.path.isfile(caminho_completo):
+            print(f"{func_prefix} ERRO: Arquivo esperado não encontrado: {caminho_completo}")
+            return None
+        nome_df = os.path.splitext(nome_arquivo)[0]
+        info_anterior = estado["fontes"].get(nome_df)
+        assinaturas[nome_df] = calcular_assinatura_arquivo(caminho_completo, info_anterior)
+        custos_ausentes = nome_df != "colaboradores" and not os.path.isfile(_caminho_custos_fonte(diretorio_estado, nome_df))
+        if not info_anterior or info_anterior.get("sha256") != assinaturas[nome_df]["sha256"] or custos_ausentes:
+            arquivos_alterados.append(nome_arquivo)
+
+    nomes_df_esperados = [os.path.splitext(a)[0] for a in nomes_arquivos]
+    caminho_consolidado = os.path.join(diretorio_estado, ARQUIVO_CONSOLIDADO)
+    mesmas_fontes = sorted(estado["fontes"]) == sorted(nomes_df_esperados)
+    if not arquivos_alterados and mesmas_fontes and os.path.isfile(caminho_consolidado):
+        print(f"{func_prefix} Nenhuma fonte alterada. Reutilizando o último consolidado.")
+        df_consolidado = feather.read_table(caminho_consolidado, memory_map=True).to_pandas()
+        if modo_compacto:
+            df_consolidado.attrs["valores_em_centavos"] = True
+        mapeamento = {nome_df: info["mapeamento"] for nome_df, info in estado["fontes"].items()}
+        return df_consolidado, mapeamento
+
+    print(f"{func_prefix} Fontes a reprocessar: {arquivos_alterados or 'nenhuma (recalculando totais)'}")
+    mapeamento_colunas: Dict[str, Any] = {
+        nome_df: info["mapeamento"] for nome_df, info in estado["fontes"].items() if nome_df in nomes_df_esperados
+    }
+    colunas_por_planilha: Dict[str, List[str]] = {
+        nome_df: info["colunas"] for nome_df, info in estado["fontes"].items() if nome_df in nomes_df_esperados
+    }
+    if arquivos_alterados:
+        amostras = ler_esquemas_planilhas(diretorio_input, arquivos_alterados)
+        if amostras is None:
+            return None
+        esquemas = {nome_df: list(df.columns) for nome_df, df in amostras.items()}
+        if arquivo_mapeamento:
+            mapeamento_novo = carregar_mapeamento_arquivo(arquivo_mapeamento, esquemas)
+        else:
+            from src.agent_mapper import obter_mapeamento_colunas  # Só a Etapa 2 precisa da pilha do LLM.
+            mapeamento_novo = obter_mapeamento_colunas(
+                esquemas, forcar_atualizacao=forcar_atualizacao_mapeamento, amostras=amostras
+            )
+        faltantes = [nome_df for nome_df in esquemas if nome_df not in (mapeamento_novo or {})]
+        if faltantes:
+            print(f"{func_prefix} ERRO: Sem mapeamento para as fontes alteradas {faltantes}.")
+            return None
+        mapeamento_colunas.update(mapeamento_novo)
+        colunas_por_planilha.update(definir_colunas_necessarias(mapeamento_novo, esquemas))
+
+    os.makedirs(diretorio_estado, exist_ok=True)
+    for nome_arquivo in arquivos_alterados:
+        nome_df = os.path.splitext(nome_arquivo)[0]
+        if nome_df == "colaboradores":
+            continue
+        df_custos_fonte = agregar_custos_em_streaming(
+            diretorio_input, [nome_arquivo], mapeamento_colunas, modo_compacto=modo_compacto
+        )
+        if df_custos_fonte is None:
+            return None
+        feather.write_feather(df_custos_fonte, _caminho_custos_fonte(diretorio_estado, nome_df))
+        print(f"{func_prefix} Custos de '{nome_df}' recalculados e persistidos.")
+
+    dataframes_brutos = carregar_planilhas_entrada(diretorio_input, ["colaboradores.xlsx"], colunas_por_planilha)
+    if dataframes_brutos is None:
+        return None
+
+    custos_por_fonte = []
+    for nome_df in nomes_df_esperados:
+        if nome_df == "colaboradores":
+            continue
+        df_fonte = feather.read_table(_caminho_custos_fonte(diretorio_estado, nome_df), memory_map=True).to_pandas()
+        custos_por_fonte.append(df_fonte)
+    custos_pre_agregados = pd.concat(custos_por_fonte, ignore_index=True) if custos_por_fonte else None
+
+    df_consolidado = consolidar_e_calcular_custos(
+        dataframes_brutos, mapeamento_colunas, modo_compacto=modo_compacto,
+        custos_pre_agregados=custos_pre_agregados
+    )
+    if df_consolidado is None:
+        return None
+
+    feather.write_feather(df_consolidado.reset_index(drop=True), caminho_consolidado)
+    estado["fontes"] = {
+        nome_df: {**assinaturas[nome_df], "mapeamento": mapeamento_colunas[nome_df],
+                  "colunas": colunas_por_planilha.get(nome_df, [])}
+        for nome_df in nomes_df_esperados
+    }
+    salvar_estado_incremental(estado, diretorio_estado)
+    print("--- Consolidação Incremental Concluída ---")
+    return df_consolidado, mapeamento_colunas
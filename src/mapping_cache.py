@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import hashlib
+from typing import Dict, List, Optional, Any
+
+DIRETORIO_CACHE_PADRAO = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'cache'
+)
+ARQUIVO_CACHE_MAPEAMENTO = "mapeamento_colunas_cache.json"
+ARQUIVO_ULTIMO_MAPEAMENTO = "ultimo_mapeamento.json"
+# Chaves que todo mapeamento de planilha precisa ter (ver `processar_mapeamento_identificado`).
+CHAVES_MAPEAMENTO_PLANILHA = (
+    "coluna_original_nome", "coluna_original_cpf", "coluna_original_custo_principal",
+    "nome_padronizado_para_nome", "nome_padronizado_para_cpf", "nome_padronizado_custo"
+)
+IDADE_MAXIMA_CACHE_DIAS = float(os.getenv("MAPEAMENTO_CACHE_IDADE_MAXIMA_DIAS", "90"))
+MAX_ENTRADAS_CACHE = int(os.getenv("MAPEAMENTO_CACHE_MAX_ENTRADAS", "500"))
+
+
+def _caminho_cache(diretorio_cache: Optional[str] = None) -> str:
+    return os.path.join(diretorio_cache or DIRETORIO_CACHE_PADRAO, ARQUIVO_CACHE_MAPEAMENTO)
+
+
+def calcular_chave_esquema(
+    nome_planilha: str,
+    colunas: List[str],
+    modelo: str,
+    versao_prompt: str
+) -> str:
+    """
+    Gera a impressão digital do esquema: hash de (planilha, colunas na ordem, modelo, versão do prompt).
+    """
+    conteudo = json.dumps(
+        [nome_planilha, [str(c) for c in colunas], modelo, versao_prompt],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+
+def carregar_cache_mapeamento(diretorio_cache: Optional[str] = None) -> Dict[str, Any]:
+    func_prefix = "[carregar_cache_mapeamento]"
+    caminho = _caminho_cache(diretorio_cache)
+    if not os.path.isfile(caminho):
+        return {}
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"{func_prefix} ALERTA: Cache de mapeamento ilegível em '{caminho}' ({e}). Ignorando.")
+        return {}
+
+
+def salvar_cache_mapeamento(cache: Dict[str, Any], diretorio_cache: Optional[str] = None) -> None:
+    func_prefix = "[salvar_cache_mapeamento]"
+    caminho = _caminho_cache(diretorio_cache)
+    try:
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        caminho_tmp = f"{caminho}.tmp"
+        with open(caminho_tmp, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2, ensure_ascii=False)
+        os.replace(caminho_tmp, caminho)
+    except OSError as e:
+        print(f"{func_prefix} ALERTA: Não foi possível gravar o cache de mapeamento: {e}")
+
+
+def aplicar_politica_expiracao(
+    cache: Dict[str, Any],
+    idade_maxima_dias: float = IDADE_MAXIMA_CACHE_DIAS,
+    max_entradas: int = MAX_ENTRADAS_CACHE
+) -> int:
+    """
+    Remove entradas mais antigas que `idade_maxima_dias` e, se ainda exceder `max_entradas`,
+    descarta as menos usadas recentemente. Retorna o número de entradas removidas.
+    """
+    agora = time.time()
+    limite_idade = idade_maxima_dias * 86400
+    expiradas = [k for k, v in cache.items() if agora - v.get("criado_em", 0) > limite_idade]
+    for chave in expiradas:
+        del cache[chave]
+
+    excedentes = max(0, len(cache) - max_entradas)
+    if excedentes:
+        por_acesso = sorted(cache.items(), key=lambda item: item[1].get("ultimo_acesso", 0))
+        for chave, _ in por_acesso[:excedentes]:
+            del cache[chave]
+    return len(expiradas) + excedentes
+
+
+def buscar_mapeamento_em_cache(
+    cache: Dict[str, Any],
+    nome_planilha: str,
+    colunas: List[str],
+    modelo: str,
+    versao_prompt: str,
+    idade_maxima_dias: float = IDADE_MAXIMA_CACHE_DIAS
+) -> Optional[Dict[str, Any]]:
+    chave = calcular_chave_esquema(nome_planilha, colunas, modelo, versao_prompt)
+    entrada = cache.get(chave)
+    if not entrada:
+        return None
+    if time.time() - entrada.get("criado_em", 0) > idade_maxima_dias * 86400:
+        del cache[chave]
+        return None
+    entrada["ultimo_acesso"] = time.time()
+    return entrada.get("resultado")
+
+
+def registrar_mapeamento_em_cache(
+    cache: Dict[str, Any],
+    nome_planilha: str,
+    colunas: List[str],
+    modelo: str,
+    versao_prompt: str,
+    resultado: Dict[str, Any]
+) -> None:
+    agora = time.time()
+    cache[calcular_chave_esquema(nome_planilha, colunas, modelo, versao_prompt)] = {
+        "planilha": nome_planilha,
+        "colunas": [str(c) for c in colunas],
+        "modelo": modelo,
+        "versao_prompt": versao_prompt,
+        "criado_em": agora,
+        "ultimo_acesso": agora,
+        "resultado": resultado,
+    }
+
+
+def invalidar_cache_mapeamento(
+    nome_planilha: Optional[str] = None,
+    diretorio_cache: Optional[str] = None
+) -> int:
+    """
+    Invalida as entradas de uma planilha específica ou, sem `nome_planilha`, todo o cache.
+    Retorna o número de entradas removidas.
+    """
+    func_prefix = "[invalidar_cache_mapeamento]"
+    cache = carregar_cache_mapeamento(diretorio_cache)
+    if nome_planilha is None:
+        removidas = len(cache)
+        cache = {}
+    else:
+        chaves = [k for k, v in cache.items() if v.get("planilha") == nome_planilha]
+        for chave in chaves:
+            del cache[chave]
+        removidas = len(chaves)
+    salvar_cache_mapeamento(cache, diretorio_cache)
+    print(f"{func_prefix} {removidas} entrada(s) removida(s) do cache de mapeamento.")
+    return removidas
+
+
+def caminho_ultimo_mapeamento(diretorio_cache: Optional[str] = None) -> str:
+    return os.path.join(diretorio_cache or DIRETORIO_CACHE_PADRAO, ARQUIVO_ULTIMO_MAPEAMENTO)
+
+
+def salvar_ultimo_mapeamento(mapeamento: Dict[str, Any], diretorio_cache: Optional[str] = None) -> None:
+    """Grava o mapeamento completo da última execução, reutilizável com `--mapeamento-anterior`."""
+    func_prefix = "[salvar_ultimo_mapeamento]"
+    caminho = caminho_ultimo_mapeamento(diretorio_cache)
+    try:
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        caminho_tmp = f"{caminho}.tmp"
+        with open(caminho_tmp, "w", encoding="utf-8") as f:
+            json.dump(mapeamento, f, indent=2, ensure_ascii=False)
+        os.replace(caminho_tmp, caminho)
+    except OSError as e:
+        print(f"{func_prefix} ALERTA: Não foi possível gravar o último mapeamento: {e}")
+
+
+def carregar_mapeamento_arquivo(
+    caminho: str,
+    esquemas: Dict[str, List[str]]
+) -> Optional[Dict[str, Any]]:
+    """
+    Lê um mapeamento de colunas já pronto (mesmo formato do retornado pela Etapa 2) e o valida contra
+    os `esquemas` lidos: cada planilha precisa estar presente, com todas as chaves e com colunas que
+    existam no cabeçalho. Retorna apenas as planilhas de `esquemas`, ou None se algo não conferir.
+    """
+    func_prefix = "[carregar_mapeamento_arquivo]"
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            mapeamento = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"{func_prefix} ERRO: Não foi possível ler o mapeamento em '{caminho}': {e}")
+        return None
+    if not isinstance(mapeamento, dict):
+        print(f"{func_prefix} ERRO: O mapeamento em '{caminho}' deve ser um objeto JSON por planilha.")
+        return None
+
+    resultado: Dict[str, Any] = {}
+    for nome_planilha, colunas in esquemas.items():
+        mapa = mapeamento.get(nome_planilha)
+        if not isinstance(mapa, dict) or not all(mapa.get(chave) for chave in CHAVES_MAPEAMENTO_PLANILHA):
+            print(f"{func_prefix} ERRO: Mapeamento ausente ou incompleto para '{nome_planilha}' em '{caminho}'.")
+            return None
+        colunas_existentes = {str(c) for c in colunas}
+        inexistentes = [
+            mapa[chave] for chave in CHAVES_MAPEAMENTO_PLANILHA[:3] if str(mapa[chave]) not in colunas_existentes
+        ]
+        if inexistentes:
+            print(f"{func_prefix} ERRO: Colunas {inexistentes} não existem em '{nome_planilha}'. "
+                  f"O cabeçalho mudou? Rode sem o mapeamento fornecido para remapear.")
+            return None
+        resultado[nome_planilha] = mapa
+    return resultado
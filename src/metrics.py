@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Any
+
+try:
+    import resource
+except ImportError:  # Indisponível no Windows: o pico de RSS fica sem medição.
+    resource = None
+
+_configuracao: Dict[str, Any] = {"arquivo": None, "diretorio_perfis": None, "usar_tracemalloc": False}
+_eventos: List[Dict[str, Any]] = []
+_pilha_etapas: List[str] = []
+_instrumentacao_pesada_ativa = False
+
+
+def configurar_metricas(
+    arquivo_metricas: Optional[str] = None,
+    diretorio_perfis: Optional[str] = None,
+    usar_tracemalloc: bool = False
+) -> None:
+    """
+    Define o destino das métricas. Com `arquivo_metricas`, cada evento é acrescentado ao arquivo
+    como uma linha JSON. Com `diretorio_perfis`, cada etapa gera um `<etapa>.prof` (cProfile);
+    com `usar_tracemalloc`, cada etapa registra o pico de memória alocada pelo Python.
+    """
+    _configuracao["arquivo"] = arquivo_metricas
+    _configuracao["diretorio_perfis"] = diretorio_perfis
+    _configuracao["usar_tracemalloc"] = usar_tracemalloc
+    for caminho in (arquivo_metricas and os.path.dirname(os.path.abspath(arquivo_metricas)), diretorio_perfis):
+        if caminho:
+            os.makedirs(caminho, exist_ok=True)
+
+
+def obter_rss_bytes() -> Optional[int]:
+    """RSS atual do processo (Linux, via /proc); None onde não estiver disponível."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def obter_pico_rss_bytes() -> Optional[int]:
+    """Pico de RSS do processo desde o início (ru_maxrss vem em KiB no Linux e em bytes no macOS)."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico if os.uname().sysname == "Darwin" else pico * 1024
+
+
+def iniciar_medicao() -> Dict[str, Any]:
+    tempos = os.times()
+    return {
+        "wall": time.perf_counter(),
+        "cpu": time.process_time(),
+        "cpu_filhos": tempos.children_user + tempos.children_system,
+        "pico_rss": obter_pico_rss_bytes(),
+    }
+
+
+def finalizar_medicao(inicio: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Tempo de parede, CPU do processo, CPU dos processos filhos já encerrados e memória desde `inicio`.
+    `pico_rss_processo_bytes` é o pico do processo inteiro até aqui (ru_maxrss não zera por etapa);
+    `aumento_pico_rss_bytes` é quanto a etapa elevou esse pico (0 se ficou abaixo do pico anterior).
+    """
+    tempos = os.times()
+    pico_rss = obter_pico_rss_bytes()
+    return {
+        "wall_s": round(time.perf_counter() - inicio["wall"], 6),
+        "cpu_s": round(time.process_time() - inicio["cpu"], 6),
+        "cpu_filhos_s": round(tempos.children_user + tempos.children_system - inicio["cpu_filhos"], 6),
+        "rss_bytes": obter_rss_bytes(),
+        "pico_rss_processo_bytes": pico_rss,
+        "aumento_pico_rss_bytes": None if pico_rss is None or inicio["pico_rss"] is None else pico_rss - inicio["pico_rss"],
+    }
+
+
+def registrar_evento(tipo: str, **campos: Any) -> Dict[str, Any]:
+    """Guarda o evento em memória e, se configurado, acrescenta-o ao arquivo de métricas (JSON lines)."""
+    evento = {"tipo": tipo, "instante": datetime.now().isoformat(timespec="milliseconds"), "pid": os.getpid(), **campos}
+    _eventos.append(evento)
+    if _configuracao["arquivo"]:
+        try:
+            with open(_configuracao["arquivo"], "a", encoding="utf-8") as f:
+                f.write(json.dumps(evento, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            print(f"[registrar_evento] ALERTA: Não foi possível gravar a métrica: {e}")
+    return evento
+
+
+@contextmanager
+def medir_etapa(nome: str, perfilar: bool = True, **contexto: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Mede o bloco como uma etapa e registra um evento `etapa` ao final, mesmo em caso de exceção.
+    O dicionário produzido pode receber campos extras (ex.: número de linhas) durante o bloco.
+    cProfile e tracemalloc valem só para a etapa mais externa com `perfilar`, pois não admitem aninhamento.
+    """
+    global _instrumentacao_pesada_ativa
+    extras: Dict[str, Any] = {}
+    etapa_pai = _pilha_etapas[-1] if _pilha_etapas else None
+    _pilha_etapas.append(nome)
+
+    dona_instrumentacao = perfilar and not _instrumentacao_pesada_ativa and (
+        _configuracao["diretorio_perfis"] or _configuracao["usar_tracemalloc"]
+    )
+    perfil = None
+    if dona_instrumentacao:
+        _instrumentacao_pesada_ativa = True
+        if _configuracao["usar_tracemalloc"]:
+            tracemalloc.start()
+        if _configuracao["diretorio_perfis"]:
+            perfil = cProfile.Profile()
+            perfil.enable()
+
+    inicio = iniciar_medicao()
+    status = "ok"
+    try:
+        yield extras
+    except BaseException:
+        status = "erro"
+        raise
+    finally:
+        medidas = finalizar_medicao(inicio)
+        if dona_instrumentacao:
+            if perfil is not None:
+                perfil.disable()
+                caminho_perfil = os.path.join(_configuracao["diretorio_perfis"], f"{nome}.prof")
+                perfil.dump_stats(caminho_perfil)
+                medidas["perfil"] = caminho_perfil
+            if _configuracao["usar_tracemalloc"]:
+                medidas["pico_tracemalloc_bytes"] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            _instrumentacao_pesada_ativa = False
+        _pilha_etapas.pop()
+        registrar_evento("etapa", etapa=nome, etapa_pai=etapa_pai, status=status, **contexto, **medidas, **extras)
+
+
+def obter_eventos(tipo: Optional[str] = None) -> List[Dict[str, Any]]:
+    return [e for e in _eventos if tipo is None or e["tipo"] == tipo]
+
+
+def limpar_metricas() -> None:
+    """Descarta os eventos em memória (ex.: entre execuções de um processo de longa duração)."""
+    _eventos.clear()
+
+
+def imprimir_resumo_metricas() -> None:
+    """Resumo legível das etapas e das chamadas ao LLM registradas nesta execução."""
+    print("\n--- Resumo de Métricas ---")
+    for evento in obter_eventos("etapa"):
+        linha = f"{evento['etapa']}: {evento['wall_s']:.3f}s parede, {evento['cpu_s']:.3f}s CPU"
+        if evento.get("cpu_filhos_s"):
+            linha += f", {evento['cpu_filhos_s']:.3f}s CPU filhos"
+        if evento.get("pico_rss_processo_bytes"):
+            linha += (f", pico RSS do processo {evento['pico_rss_processo_bytes'] / 2**20:.1f} MiB"
+                      f" (+{(evento.get('aumento_pico_rss_bytes') or 0) / 2**20:.1f} MiB na etapa)")
+        if evento.get("pico_tracemalloc_bytes") is not None:
+            linha += f", pico tracemalloc {evento['pico_tracemalloc_bytes'] / 2**20:.1f} MiB"
+        recuo = "    " if evento.get("etapa_pai") else "  "
+        print(f"{recuo}{linha} [{evento['status']}]")
+    chamadas_llm = obter_eventos("llm_chamada")
+    if chamadas_llm:
+        latencia_total = sum(e.get("latencia_s", 0.0) for e in chamadas_llm)
+        espera_total = sum(e.get("espera_limitador_s", 0.0) + e.get("espera_backoff_s", 0.0) for e in chamadas_llm)
+        tokens_total = sum(e.get("total_tokens") or 0 for e in chamadas_llm)
+        print(f"  LLM: {len(chamadas_llm)} chamada(s), {latencia_total:.2f}s de latência, "
+              f"{espera_total:.2f}s de espera (limitador/backoff), {tokens_total} tokens")
+    print("--- Fim do Resumo de Métricas ---")
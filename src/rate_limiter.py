@@ -0,0 +1,66 @@
+import os
+import time
+import random
+import asyncio
+from typing import Optional
+
+REQUISICOES_POR_MINUTO_PADRAO = float(os.getenv("LLM_REQUISICOES_POR_MINUTO", "30"))
+TOKENS_POR_MINUTO_PADRAO = float(os.getenv("LLM_TOKENS_POR_MINUTO", "6000"))
+
+
+class LimitadorTaxa:
+    """
+    Token bucket duplo (requisições/minuto e tokens/minuto) para chamadas assíncronas ao LLM.
+    Cada balde começa cheio e é reabastecido continuamente; `adquirir` aguarda apenas o
+    necessário para que haja saldo nos dois baldes, em vez de um intervalo fixo entre chamadas.
+    """
+
+    def __init__(
+        self,
+        requisicoes_por_minuto: float = REQUISICOES_POR_MINUTO_PADRAO,
+        tokens_por_minuto: float = TOKENS_POR_MINUTO_PADRAO
+    ):
+        self.capacidade_requisicoes = max(1.0, requisicoes_por_minuto)
+        self.capacidade_tokens = max(1.0, tokens_por_minuto)
+        self.saldo_requisicoes = self.capacidade_requisicoes
+        self.saldo_tokens = self.capacidade_tokens
+        self._ultima_recarga = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _recarregar(self) -> None:
+        agora = time.monotonic()
+        decorrido = agora - self._ultima_recarga
+        self._ultima_recarga = agora
+        self.saldo_requisicoes = min(
+            self.capacidade_requisicoes,
+            self.saldo_requisicoes + decorrido * self.capacidade_requisicoes / 60.0
+        )
+        self.saldo_tokens = min(
+            self.capacidade_tokens,
+            self.saldo_tokens + decorrido * self.capacidade_tokens / 60.0
+        )
+
+    async def adquirir(self, tokens_estimados: int = 0) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Uma requisição maior que o balde inteiro nunca caberia; limita ao máximo possível.
+        tokens = min(float(tokens_estimados), self.capacidade_tokens)
+        async with self._lock:
+            while True:
+                self._recarregar()
+                if self.saldo_requisicoes >= 1.0 and self.saldo_tokens >= tokens:
+                    self.saldo_requisicoes -= 1.0
+                    self.saldo_tokens -= tokens
+                    return
+                espera_requisicoes = (1.0 - self.saldo_requisicoes) * 60.0 / self.capacidade_requisicoes
+                espera_tokens = (tokens - self.saldo_tokens) * 60.0 / self.capacidade_tokens
+                await asyncio.sleep(max(espera_requisicoes, espera_tokens, 0.01))
+
+    def ajustar_tokens(self, tokens_estimados: int, tokens_reais: int) -> None:
+        """Corrige o saldo de tokens com o consumo real informado pela API."""
+        self.saldo_tokens = min(self.capacidade_tokens, self.saldo_tokens + tokens_estimados - tokens_reais)
+
+
+def calcular_espera_backoff(tentativa: int, base_segundos: float = 2.0, maximo_segundos: float = 60.0) -> float:
+    """Backoff exponencial com jitter completo: aleatório entre 0 e min(máximo, base * 2^tentativa)."""
+    return random.uniform(0, min(maximo_segundos, base_segundos * (2 ** tentativa)))
@@ -1,123 +1,383 @@
 import pandas as pd
 import os
-from typing import Dict, Any
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Any, Tuple
 import traceback
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.utils import get_column_letter
 
+from src.data_handler import formatar_cpf, calcular_rollups_departamento, ROTULO_SEM_DEPARTAMENTO
+from src.metrics import medir_etapa
+
+try:
+    import xlsxwriter
+except ImportError:  # xlsxwriter é opcional: sem ele, usa o modo write-only do openpyxl.
+    xlsxwriter = None
+
+NOME_ABA_RELATORIO = 'RateioDeCustos'
+NOME_TABELA_RELATORIO = 'rateio_custos'
+FORMATO_MOEDA_BRL = 'R$ #,##0.00'
+FORMATO_PERCENTUAL = '0.00%'
+
+def calcular_larguras_colunas(df: pd.DataFrame) -> Dict[str, float]:
+    """
+    Largura de cada coluna a partir do maior texto (cabeçalho ou valor), calculada
+    vetorialmente no DataFrame em vez de reler as células da planilha.
+    """
+    larguras = {}
+    for col in df.columns:
+        valores = df[col].dropna()
+        max_valor = int(valores.astype(str).str.len().max()) if not valores.empty else 0
+        larguras[col] = (max(len(str(col)), max_valor) + 2) * 1.1
+    return larguras
+
+def _linhas_para_escrita(df: pd.DataFrame):
+    """Itera as linhas como tuplas, trocando valores ausentes por None (célula vazia)."""
+    colunas_com_nulos = [col for col in df.columns if df[col].hasnans]
+    if colunas_com_nulos:
+        df = df.astype({col: object for col in colunas_com_nulos})
+        for col in colunas_com_nulos:
+            df[col] = df[col].where(df[col].notna(), None)
+    return df.itertuples(index=False, name=None)
+
+# Uma aba a escrever: (nome, DataFrame, colunas monetárias, colunas percentuais).
+Aba = Tuple[str, pd.DataFrame, List[str], List[str]]
+
+def _escrever_xlsx_xlsxwriter(caminho: str, abas: List[Aba]) -> None:
+    """Escrita em streaming (constant_memory) com formatos de moeda e percentual aplicados por coluna, não por célula."""
+    workbook = xlsxwriter.Workbook(caminho, {'constant_memory': True})
+    try:
+        formato_cabecalho = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        formato_moeda = workbook.add_format({'num_format': FORMATO_MOEDA_BRL})
+        formato_percentual = workbook.add_format({'num_format': FORMATO_PERCENTUAL})
+        for nome_aba, df, colunas_monetarias, colunas_percentuais in abas:
+            worksheet = workbook.add_worksheet(nome_aba)
+            larguras = calcular_larguras_colunas(df)
+            for idx, col in enumerate(df.columns):
+                formato = formato_moeda if col in colunas_monetarias else formato_percentual if col in colunas_percentuais else None
+                worksheet.set_column(idx, idx, larguras[col], formato)
+            worksheet.write_row(0, 0, [str(col) for col in df.columns], formato_cabecalho)
+            for idx_linha, linha in enumerate(_linhas_para_escrita(df), start=1):
+                worksheet.write_row(idx_linha, 0, linha)
+    finally:
+        workbook.close()
+
+def _escrever_xlsx_openpyxl_write_only(caminho: str, abas: List[Aba]) -> None:
+    """Alternativa sem xlsxwriter: openpyxl em modo write-only (streaming, sem reler células)."""
+    workbook = Workbook(write_only=True)
+    for nome_aba, df, colunas_monetarias, colunas_percentuais in abas:
+        worksheet = workbook.create_sheet(nome_aba)
+        for idx, (col, largura) in enumerate(calcular_larguras_colunas(df).items(), start=1):
+            worksheet.column_dimensions[get_column_letter(idx)].width = largura
+        worksheet.append([str(col) for col in df.columns])
+        formatos_por_posicao = {
+            i: FORMATO_MOEDA_BRL if col in colunas_monetarias else FORMATO_PERCENTUAL
+            for i, col in enumerate(df.columns) if col in colunas_monetarias or col in colunas_percentuais
+        }
+        for linha in _linhas_para_escrita(df):
+            linha = list(linha)
+            for i, formato in formatos_por_posicao.items():
+                celula = WriteOnlyCell(worksheet, value=linha[i])
+                celula.number_format = formato
+                linha[i] = celula
+            worksheet.append(linha)
+    workbook.save(caminho)
+
+def _escrever_xlsx(caminho: str, abas: List[Aba]) -> str:
+    if xlsxwriter is not None:
+        _escrever_xlsx_xlsxwriter(caminho, abas)
+    else:
+        _escrever_xlsx_openpyxl_write_only(caminho, abas)
+    return caminho
+
+def montar_abas_rollup(rollups: Dict[str, pd.DataFrame]) -> List[Aba]:
+    """Abas de totais por departamento/centro de custo: participações em percentual, demais valores decimais em moeda."""
+    abas = []
+    for nome_aba, df_rollup in rollups.items():
+        colunas_percentuais = [col for col in df_rollup.columns if col.startswith("Participacao")]
+        colunas_monetarias = [
+            col for col in df_rollup.columns
+            if col not in colunas_percentuais and pd.api.types.is_float_dtype(df_rollup[col])
+        ]
+        abas.append((nome_aba, df_rollup, colunas_monetarias, colunas_percentuais))
+    return abas
+
+def _nome_arquivo_seguro(texto: str) -> str:
+    return re.sub(r'[^\w&.-]+', '_', str(texto)).strip('_') or ROTULO_SEM_DEPARTAMENTO.replace(' ', '_')
+
+def gerar_workbooks_por_departamento(
+    df_para_exportar: pd.DataFrame,
+    colunas_monetarias: List[str],
+    caminho_output_dir: str,
+    nome_base_output: str,
+    max_processos: Optional[int] = None
+) -> List[str]:
+    """
+    Um workbook por departamento (`<nome_base>_departamentos/<nome_base>_<Departamento>.xlsx`), com as
+    linhas do relatório desse departamento, escritos em paralelo em um pool de processos.
+    """
+    diretorio = os.path.join(caminho_output_dir, f"{nome_base_output}_departamentos")
+    os.makedirs(diretorio, exist_ok=True)
+    departamentos = df_para_exportar["Departamento"].astype(object).fillna(ROTULO_SEM_DEPARTAMENTO)
+    tarefas = [
+        (os.path.join(diretorio, f"{nome_base_output}_{_nome_arquivo_seguro(departamento)}.xlsx"),
+         [(NOME_ABA_RELATORIO, df_departamento.reset_index(drop=True), colunas_monetarias, [])])
+        for departamento, df_departamento in df_para_exportar.groupby(departamentos, sort=True)
+    ]
+    nucleos_disponiveis = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    num_processos = min(len(tarefas), max_processos or nucleos_disponiveis)
+    if num_processos <= 1:
+        return [_escrever_xlsx(caminho, abas) for caminho, abas in tarefas]
+    with ProcessPoolExecutor(max_workers=num_processos) as executor:
+        return list(executor.map(_escrever_xlsx, *zip(*tarefas)))
+
+def preparar_dataframe_relatorio(
+    df_final_calculado: pd.DataFrame, 
+    mapeamento_colunas: Dict[str, Any]
+) -> Tuple[pd.DataFrame, List[str]]:
+    """
+    Seleciona e ordena as colunas do relatório, formata o CPF e arredonda os valores monetários
+    (em reais). Retorna o DataFrame pronto para exportação e a lista de colunas monetárias.
+    Usado por todos os formatos de saída, para que todos tenham a mesma ordem de colunas.
+    """
+    func_prefix = "[preparar_dataframe_relatorio]"
+    colunas_disponiveis = df_final_calculado.columns
+
+    colunas_monetarias = []
+    coluna_salario = mapeamento_colunas.get("colaboradores", {}).get("nome_padronizado_custo")
+    if coluna_salario and coluna_salario in colunas_disponiveis:
+        colunas_monetarias.append(coluna_salario)
+
+    for nome_df, mapa in mapeamento_colunas.items():
+        if nome_df != "colaboradores":
+            custo_col_nome = mapa.get("nome_padronizado_custo")
+            if custo_col_nome and custo_col_nome in colunas_disponiveis and custo_col_nome not in colunas_monetarias:
+                colunas_monetarias.append(custo_col_nome)
+    
+    novas_colunas_subtotal_e_total = ["Centro_Custo_Ferramentas", "Centro_Custo_Beneficios", "Custo_Geral_Total"]
+    for col in novas_colunas_subtotal_e_total:
+        if col in colunas_disponiveis and col not in colunas_monetarias:
+            colunas_monetarias.append(col)
+    
+    print(f"{func_prefix} Colunas monetárias para formatação: {colunas_monetarias}")
+
+    colunas_relatorio_ordenadas = ["CPF_Padronizado", "Nome_Padronizado"]
+    if "Departamento" in colunas_disponiveis:
+        colunas_relatorio_ordenadas.append("Departamento")
+    if coluna_salario and coluna_salario in colunas_disponiveis:
+        colunas_relatorio_ordenadas.append(coluna_salario)
+    
+    custos_ferramentas_ordenados = sorted([
+        mapa['nome_padronizado_custo'] 
+        for nome_df, mapa in mapeamento_colunas.items() 
+        if nome_df in ["github", "google_workspace"] and mapa.get('nome_padronizado_custo') in colunas_disponiveis
+    ])
+    colunas_relatorio_ordenadas.extend(custos_ferramentas_ordenados)
+    if "Centro_Custo_Ferramentas" in colunas_disponiveis:
+        colunas_relatorio_ordenadas.append("Centro_Custo_Ferramentas")
+    
+    custos_beneficios_ordenados = sorted([
+        mapa['nome_padronizado_custo'] 
+        for nome_df, mapa in mapeamento_colunas.items() 
+        if nome_df in ["gympass", "unimed"] and mapa.get('nome_padronizado_custo') in colunas_disponiveis
+    ])
+    colunas_relatorio_ordenadas.extend(custos_beneficios_ordenados)
+    if "Centro_Custo_Beneficios" in colunas_disponiveis:
+        colunas_relatorio_ordenadas.append("Centro_Custo_Beneficios")
+    
+    if "Custo_Geral_Total" in colunas_disponiveis:
+        colunas_relatorio_ordenadas.append("Custo_Geral_Total")
+    
+    colunas_finais_existentes = []
+    for col in colunas_relatorio_ordenadas:
+        if col in colunas_disponiveis and col not in colunas_finais_existentes:
+            colunas_finais_existentes.append(col)
+    
+    # Copia só as colunas do relatório (não o DataFrame inteiro): as alterações abaixo
+    # substituem colunas nesta cópia e não afetam o DataFrame de entrada.
+    df_para_exportar = df_final_calculado[colunas_finais_existentes].copy()
+    print(f"{func_prefix} Ordem final das colunas: {list(df_para_exportar.columns)}")
+
+    if pd.api.types.is_integer_dtype(df_para_exportar["CPF_Padronizado"]):
+        df_para_exportar["CPF_Padronizado"] = formatar_cpf(df_para_exportar["CPF_Padronizado"])
+
+    divisor_monetario = 100 if df_final_calculado.attrs.get("valores_em_centavos") else 1
+    for col_monetaria in colunas_monetarias:
+        if col_monetaria in df_para_exportar.columns:
+            df_para_exportar[col_monetaria] = (
+                pd.to_numeric(df_para_exportar[col_monetaria], errors='coerce') / divisor_monetario
+            ).round(2)
+    
+    print(f"{func_prefix} Dados monetários arredondados.")
+    return df_para_exportar, colunas_monetarias
+
 def gerar_relatorio_excel(
     df_final_calculado: pd.DataFrame, 
     mapeamento_colunas: Dict[str, Any],
     caminho_output_dir: str, 
-    nome_arquivo_output: str
+    nome_arquivo_output: str,
+    rollups: Optional[Dict[str, pd.DataFrame]] = None,
+    dividir_por_departamento: bool = False
 ) -> bool:
     """
     Gera o relatório final em formato Excel, com formatação de moeda
     e arredondamento para duas casas decimais nas colunas monetárias.
+    Ao lado de 'RateioDeCustos' são gravadas as abas de totais por departamento e centro de custo:
+    as de `rollups` (calculadas na consolidação) ou, se não informadas, calculadas aqui sobre o DataFrame.
+    Com `dividir_por_departamento`, também gera um workbook por departamento, em paralelo.
     """
     func_prefix = "[gerar_relatorio_excel]"
-    print(f"\n--- Iniciando Geração do Relatório Excel com Formatação ---")
+    print("\n--- Iniciando Geração do Relatório Excel com Formatação ---")
 
     if df_final_calculado is None or df_final_calculado.empty:
         print(f"{func_prefix} ERRO: DataFrame final está vazio ou não foi fornecido.")
         return False
 
     try:
-        df_para_exportar = df_final_calculado.copy()
-
-        colunas_monetarias = []
-        coluna_salario = mapeamento_colunas.get("colaboradores", {}).get("nome_padronizado_custo")
-        if coluna_salario and coluna_salario in df_para_exportar.columns:
-            colunas_monetarias.append(coluna_salario)
-
-        for nome_df, mapa in mapeamento_colunas.items():
-            if nome_df != "colaboradores":
-                custo_col_nome = mapa.get("nome_padronizado_custo")
-                if custo_col_nome and custo_col_nome in df_para_exportar.columns and custo_col_nome not in colunas_monetarias:
-                    colunas_monetarias.append(custo_col_nome)
-        
-        novas_colunas_subtotal_e_total = ["Centro_Custo_Ferramentas", "Centro_Custo_Beneficios", "Custo_Geral_Total"]
-        for col in novas_colunas_subtotal_e_total:
-            if col in df_para_exportar.columns and col not in colunas_monetarias:
-                colunas_monetarias.append(col)
-        
-        print(f"{func_prefix} Colunas monetárias para formatação: {colunas_monetarias}")
-
-        for col_monetaria in colunas_monetarias:
-            if col_monetaria in df_para_exportar.columns:
-                df_para_exportar[col_monetaria] = pd.to_numeric(df_para_exportar[col_monetaria], errors='coerce').round(2)
-        
-        print(f"{func_prefix} Dados monetários arredondados.")
-
-        colunas_relatorio_ordenadas = ["CPF_Padronizado", "Nome_Padronizado"]
-        if "Departamento" in df_para_exportar.columns:
-            colunas_relatorio_ordenadas.append("Departamento")
-        if coluna_salario and coluna_salario in df_para_exportar.columns:
-            colunas_relatorio_ordenadas.append(coluna_salario)
-        
-        custos_ferramentas_ordenados = sorted([
-            mapa['nome_padronizado_custo'] 
-            for nome_df, mapa in mapeamento_colunas.items() 
-            if nome_df in ["github", "google_workspace"] and mapa.get('nome_padronizado_custo') in df_para_exportar.columns
-        ])
-        colunas_relatorio_ordenadas.extend(custos_ferramentas_ordenados)
-        if "Centro_Custo_Ferramentas" in df_para_exportar.columns:
-            colunas_relatorio_ordenadas.append("Centro_Custo_Ferramentas")
-        
-        custos_beneficios_ordenados = sorted([
-            mapa['nome_padronizado_custo'] 
-            for nome_df, mapa in mapeamento_colunas.items() 
-            if nome_df in ["gympass", "unimed"] and mapa.get('nome_padronizado_custo') in df_para_exportar.columns
-        ])
-        colunas_relatorio_ordenadas.extend(custos_beneficios_ordenados)
-        if "Centro_Custo_Beneficios" in df_para_exportar.columns:
-            colunas_relatorio_ordenadas.append("Centro_Custo_Beneficios")
-        
-        if "Custo_Geral_Total" in df_para_exportar.columns:
-            colunas_relatorio_ordenadas.append("Custo_Geral_Total")
-        
-        colunas_finais_existentes = []
-        for col in colunas_relatorio_ordenadas:
-            if col in df_para_exportar.columns and col not in colunas_finais_existentes:
-                colunas_finais_existentes.append(col)
-        
-        df_para_exportar = df_para_exportar[colunas_finais_existentes]
-        print(f"{func_prefix} Ordem final das colunas: {list(df_para_exportar.columns)}")
+        df_para_exportar, colunas_monetarias = preparar_dataframe_relatorio(df_final_calculado, mapeamento_colunas)
 
         os.makedirs(caminho_output_dir, exist_ok=True)
         caminho_completo_output = os.path.join(caminho_output_dir, nome_arquivo_output)
 
-        with pd.ExcelWriter(caminho_completo_output, engine='openpyxl') as writer:
-            df_para_exportar.to_excel(writer, index=False, sheet_name='RateioDeCustos')
-            
-            worksheet = writer.sheets['RateioDeCustos']
-            formato_moeda_brl = 'R$ #,##0.00'
-
-            header_list = list(df_para_exportar.columns)
-            for col_nome_monetaria in colunas_monetarias:
-                if col_nome_monetaria in header_list:
-                    col_idx_excel = header_list.index(col_nome_monetaria) + 1
-                    letra_coluna = get_column_letter(col_idx_excel)
-                    for i in range(2, worksheet.max_row + 1):
-                        worksheet[f'{letra_coluna}{i}'].number_format = formato_moeda_brl
-            print(f"{func_prefix} Formato de moeda aplicado às colunas monetárias.")
-
-            for i, column_header in enumerate(header_list):
-                column_letter = get_column_letter(i + 1)
-                max_length = len(str(column_header))
-                for row_idx in range(1, worksheet.max_row + 1):
-                    cell_value = worksheet[f"{column_letter}{row_idx}"].value
-                    if cell_value is not None:
-                        max_length = max(max_length, len(str(cell_value)))
-                
-                adjusted_width = (max_length + 2) * 1.1 
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-            print(f"{func_prefix} Largura das colunas ajustada.")
+        if rollups is None:
+            rollups = calcular_rollups_departamento(df_final_calculado, mapeamento_colunas)
+        abas = [(NOME_ABA_RELATORIO, df_para_exportar, colunas_monetarias, [])] + montar_abas_rollup(rollups)
+        _escrever_xlsx(caminho_completo_output, abas)
+        print(f"{func_prefix} Formato de moeda aplicado às colunas monetárias. Abas: {[aba[0] for aba in abas]}")
 
         print(f"{func_prefix} Relatório salvo e formatado com sucesso em: {caminho_completo_output}")
-        print(f"--- Geração do Relatório Excel Concluída ---")
+        if dividir_por_departamento and "Departamento" in df_para_exportar.columns:
+            nome_base = os.path.splitext(nome_arquivo_output)[0]
+            caminhos = gerar_workbooks_por_departamento(
+                df_para_exportar, colunas_monetarias, caminho_output_dir, nome_base
+            )
+            print(f"{func_prefix} {len(caminhos)} workbook(s) por departamento gerado(s) em: {os.path.dirname(caminhos[0])}")
+        print("--- Geração do Relatório Excel Concluída ---")
         return True
 
     except Exception as e:
         print(f"{func_prefix} ERRO ao gerar o relatório Excel formatado: {e}")
         traceback.print_exc()
-        return False
\ No newline at end of file
+        return False
+
+def _escrever_parquet_particionado(df: pd.DataFrame, caminho_output_dir: str, nome_base: str) -> str:
+    """Dataset Parquet particionado por competência e departamento (Competencia=AAAA-MM/Departamento=...)."""
+    caminho = os.path.join(caminho_output_dir, f"{nome_base}_parquet")
+    colunas_particao = [col for col in ["Competencia", "Departamento"] if col in df.columns]
+    df.to_parquet(
+        caminho, index=False, partition_cols=colunas_particao,
+        existing_data_behavior="delete_matching"
+    )
+    return caminho
+
+def _escrever_csv_gzip(df: pd.DataFrame, caminho_output_dir: str, nome_base: str) -> str:
+    caminho = os.path.join(caminho_output_dir, f"{nome_base}.csv.gz")
+    df.to_csv(caminho, index=False, compression="gzip")
+    return caminho
+
+def _escrever_sqlite(df: pd.DataFrame, caminho_output_dir: str, nome_base: str) -> str:
+    """Acrescenta a competência à tabela, substituindo as linhas já existentes da mesma competência."""
+    caminho = os.path.join(caminho_output_dir, f"{nome_base}.sqlite")
+    with sqlite3.connect(caminho) as conexao:
+        tabela_existe = conexao.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (NOME_TABELA_RELATORIO,)
+        ).fetchone()
+        if tabela_existe:
+            conexao.execute(
+                f"DELETE FROM {NOME_TABELA_RELATORIO} WHERE Competencia IN ({','.join('?' * df['Competencia'].nunique())})",
+                tuple(df["Competencia"].unique())
+            )
+        df.to_sql(NOME_TABELA_RELATORIO, conexao, if_exists="append", index=False)
+        conexao.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{NOME_TABELA_RELATORIO}_competencia_cpf "
+            f"ON {NOME_TABELA_RELATORIO} (Competencia, CPF_Padronizado)"
+        )
+    return caminho
+
+def _escrever_duckdb(df: pd.DataFrame, caminho_output_dir: str, nome_base: str) -> str:
+    """Mesmo comportamento da saída SQLite, em um banco DuckDB (requer o pacote opcional `duckdb`)."""
+    import duckdb
+    caminho = os.path.join(caminho_output_dir, f"{nome_base}.duckdb")
+    conexao = duckdb.connect(caminho)
+    try:
+        conexao.register("df_saida", df)
+        conexao.execute(f"CREATE TABLE IF NOT EXISTS {NOME_TABELA_RELATORIO} AS SELECT * FROM df_saida LIMIT 0")
+        conexao.execute(
+            f"DELETE FROM {NOME_TABELA_RELATORIO} WHERE Competencia IN (SELECT DISTINCT Competencia FROM df_saida)"
+        )
+        conexao.execute(f"INSERT INTO {NOME_TABELA_RELATORIO} BY NAME SELECT * FROM df_saida")
+    finally:
+        conexao.close()
+    return caminho
+
+ESCRITORES_SAIDA: Dict[str, Callable[[pd.DataFrame, str, str], str]] = {
+    "parquet": _escrever_parquet_particionado,
+    "csv": _escrever_csv_gzip,
+    "sqlite": _escrever_sqlite,
+    "duckdb": _escrever_duckdb,
+}
+FORMATOS_SAIDA_DISPONIVEIS = ["xlsx"] + list(ESCRITORES_SAIDA)
+
+def gerar_saidas_relatorio(
+    df_final_calculado: pd.DataFrame, 
+    mapeamento_colunas: Dict[str, Any],
+    caminho_output_dir: str, 
+    nome_base_output: str,
+    formatos: List[str],
+    competencia: Optional[str] = None,
+    rollups: Optional[Dict[str, pd.DataFrame]] = None,
+    dividir_por_departamento: bool = False
+) -> bool:
+    """
+    Gera o resultado do rateio em cada formato de `formatos` ("xlsx", "parquet", "csv", "sqlite", "duckdb").
+    Os formatos além do XLSX recebem a coluna `Competencia` (AAAA-MM; padrão: mês atual), usada como
+    partição no Parquet e como chave de substituição nas tabelas SQLite/DuckDB.
+    `rollups` e `dividir_por_departamento` são repassados ao XLSX (ver `gerar_relatorio_excel`).
+    Retorna True somente se todos os formatos foram gerados.
+    """
+    func_prefix = "[gerar_saidas_relatorio]"
+    formatos_invalidos = [f for f in formatos if f not in FORMATOS_SAIDA_DISPONIVEIS]
+    if formatos_invalidos:
+        print(f"{func_prefix} ERRO: Formato(s) de saída desconhecido(s): {formatos_invalidos}. "
+              f"Disponíveis: {FORMATOS_SAIDA_DISPONIVEIS}")
+        return False
+
+    sucesso = True
+    if "xlsx" in formatos:
+        with medir_etapa("saida_xlsx", formato="xlsx"):
+            sucesso = gerar_relatorio_excel(
+                df_final_calculado, mapeamento_colunas, caminho_output_dir, f"{nome_base_output}.xlsx",
+                rollups=rollups, dividir_por_departamento=dividir_por_departamento
+            )
+
+    outros_formatos = [f for f in formatos if f != "xlsx"]
+    if not outros_formatos:
+        return sucesso
+    if df_final_calculado is None or df_final_calculado.empty:
+        print(f"{func_prefix} ERRO: DataFrame final está vazio ou não foi fornecido.")
+        return False
+
+    try:
+        df_para_exportar, _ = preparar_dataframe_relatorio(df_final_calculado, mapeamento_colunas)
+    except Exception as e:
+        print(f"{func_prefix} ERRO ao preparar os dados para exportação: {e}")
+        traceback.print_exc()
+        return False
+    df_para_exportar.insert(0, "Competencia", competencia or datetime.now().strftime("%Y-%m"))
+    if "Departamento" in df_para_exportar.columns:
+        df_para_exportar["Departamento"] = df_para_exportar["Departamento"].astype("string")
+    os.makedirs(caminho_output_dir, exist_ok=True)
+
+    for formato in outros_formatos:
+        try:
+            with medir_etapa(f"saida_{formato}", formato=formato, linhas=len(df_para_exportar)):
+                caminho = ESCRITORES_SAIDA[formato](df_para_exportar, caminho_output_dir, nome_base_output)
+            print(f"{func_prefix} Saída '{formato}' gerada em: {caminho}")
+        except Exception as e:
+            print(f"{func_prefix} ERRO ao gerar a saída '{formato}': {type(e).__name__} - {e}")
+            sucesso = False
+    return sucesso
@@ -0,0 +1,176 @@
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import unquote
+
+import pandas as pd
+
+from src.data_handler import normalizar_cpf, obter_assinaturas, ROTULO_SEM_DEPARTAMENTO
+from src.historico import caminho_historico, carregar_competencia, COLUNAS_NAO_MONETARIAS
+
+HOST_PADRAO = "127.0.0.1"
+PORTA_PADRAO = 8765
+INTERVALO_RECARGA_S = 2.0
+
+
+def _registros_json(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Linhas como dicionários serializáveis em JSON (NaN/NaT -> None)."""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+class IndiceCustos:
+    """
+    Índice em memória da competência mais recente do histórico (`src/historico.py`): um dicionário
+    CPF -> lista de registros para consultas pontuais (uma chave pode ser compartilhada, ex. CPFs
+    mascarados) e os totais por departamento pré-calculados, ambos substituídos de uma só vez a cada
+    recarga, para que as consultas nunca vejam um estado parcial.
+    """
+
+    def __init__(self, diretorio_historico: Optional[str] = None, competencia: Optional[str] = None):
+        self.diretorio_historico = diretorio_historico
+        self.competencia_fixa = competencia
+        self.competencia: Optional[str] = None
+        self._por_cpf: Dict[int, List[Dict[str, Any]]] = {}
+        self._por_departamento: Dict[str, Dict[str, Any]] = {}
+        self._assinatura = None
+        self._trava_recarga = threading.Lock()
+
+    def _assinatura_atual(self):
+        diretorio, nome_arquivo = os.path.split(caminho_historico(self.diretorio_historico))
+        return obter_assinaturas(diretorio, [nome_arquivo])[nome_arquivo]
+
+    @property
+    def total_cpfs(self) -> int:
+        return len(self._por_cpf)
+
+    def recarregar(self) -> bool:
+        """Relê a competência do histórico e reconstrói os índices. Retorna False se não houver dados."""
+        func_prefix = "[IndiceCustos.recarregar]"
+        with self._trava_recarga:
+            assinatura = self._assinatura_atual()
+            competencia, df = carregar_competencia(self.competencia_fixa, self.diretorio_historico)
+            if competencia is None or df.empty:
+                print(f"{func_prefix} ALERTA: Nenhuma competência disponível no histórico.")
+                self._assinatura = assinatura
+                return False
+
+            df["Departamento"] = df["Departamento"].fillna(ROTULO_SEM_DEPARTAMENTO)
+            colunas_monetarias = [
+                col for col in df.columns if col not in COLUNAS_NAO_MONETARIAS and not col.startswith("Data_Ativacao_")
+            ]
+            com_cpf = df[df["CPF_Padronizado"].notna()]
+            por_cpf: Dict[int, List[Dict[str, Any]]] = {}
+            for chave, registro in zip(com_cpf["CPF_Padronizado"].astype("int64").tolist(), _registros_json(com_cpf)):
+                por_cpf.setdefault(chave, []).append(registro)
+
+            agregados = df.groupby("Departamento", sort=True)[colunas_monetarias].sum()
+            eh_colaborador = df["Nao_Alocado"].fillna(0) == 0 if "Nao_Alocado" in df.columns else pd.Series(True, index=df.index)
+            agregados.insert(0, "Colaboradores", eh_colaborador.groupby(df["Departamento"], sort=True).sum().astype("int64"))
+            if "Custo_Geral_Total" in agregados.columns:
+                per_capita = agregados["Custo_Geral_Total"] / agregados["Colaboradores"].where(agregados["Colaboradores"] > 0)
+                agregados["Custo_Per_Capita"] = per_capita.fillna(0).round(2)
+            agregados[colunas_monetarias] = agregados[colunas_monetarias].round(2)
+            por_departamento = dict(zip(agregados.index.tolist(), _registros_json(agregados.reset_index())))
+
+            # Troca atômica das referências: leitores concorrentes veem o índice antigo ou o novo, inteiro.
+            self._por_cpf, self._por_departamento = por_cpf, por_departamento
+            self.competencia, self._assinatura = competencia, assinatura
+        print(f"{func_prefix} Competência '{competencia}' carregada: {len(por_cpf)} CPFs, {len(por_departamento)} departamentos.")
+        return True
+
+    def recarregar_se_alterado(self) -> bool:
+        """Recarrega apenas se o arquivo do histórico mudou (tamanho ou data de modificação)."""
+        if self._assinatura_atual() == self._assinatura:
+            return False
+        return self.recarregar()
+
+    def consultar_cpf(self, cpf: Any) -> List[Dict[str, Any]]:
+        """Registros com a chave do CPF (formatado ou não) na competência carregada; vazio se não houver."""
+        chaves, _ = normalizar_cpf(pd.Series([cpf]))
+        if pd.isna(chaves.iloc[0]):
+            return []
+        return self._por_cpf.get(int(chaves.iloc[0]), [])
+
+    def consultar_departamento(self, departamento: str) -> Optional[Dict[str, Any]]:
+        return self._por_departamento.get(departamento)
+
+    def listar_departamentos(self) -> List[Dict[str, Any]]:
+        return list(self._por_departamento.values())
+
+
+def _criar_tratador(indice: IndiceCustos):
+    class TratadorConsultas(BaseHTTPRequestHandler):
+        """GET /cpf/<cpf>, /departamentos, /departamentos/<nome> e /saude, com respostas em JSON."""
+
+        def _responder(self, status: int, corpo: Any) -> None:
+            conteudo = json.dumps(corpo, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(conteudo)))
+            self.end_headers()
+            self.wfile.write(conteudo)
+
+        def do_GET(self):
+            partes = [unquote(p) for p in self.path.split("?", 1)[0].strip("/").split("/", 1)]
+            recurso, argumento = partes[0], (partes[1] if len(partes) > 1 else None)
+            if recurso == "saude":
+                self._responder(200, {"competencia": indice.competencia, "cpfs": indice.total_cpfs})
+            elif recurso == "cpf" and argumento:
+                registros = indice.consultar_cpf(argumento)
+                if not registros:
+                    self._responder(404, {"erro": f"CPF '{argumento}' não encontrado na competência {indice.competencia}."})
+                else:
+                    self._responder(200, {"competencia": indice.competencia, "registros": registros})
+            elif recurso == "departamentos" and argumento:
+                agregado = indice.consultar_departamento(argumento)
+                if agregado is None:
+                    self._responder(404, {"erro": f"Departamento '{argumento}' não encontrado."})
+                else:
+                    self._responder(200, agregado)
+            elif recurso == "departamentos":
+                self._responder(200, {"competencia": indice.competencia, "departamentos": indice.listar_departamentos()})
+            else:
+                self._responder(404, {"erro": "Rotas: /cpf/<cpf>, /departamentos, /departamentos/<nome>, /saude."})
+
+        def log_message(self, formato, *args):
+            pass  # Sem um log por requisição no terminal.
+
+    return TratadorConsultas
+
+
+def servir_consultas(
+    host: str = HOST_PADRAO,
+    porta: int = PORTA_PADRAO,
+    diretorio_historico: Optional[str] = None,
+    competencia: Optional[str] = None,
+    intervalo_recarga_s: float = INTERVALO_RECARGA_S
+) -> None:
+    """
+    Serviço HTTP local de consultas sobre o histórico. Uma thread verifica o arquivo do histórico a cada
+    `intervalo_recarga_s` segundos e recarrega o índice quando uma nova execução o atualiza. Roda até Ctrl+C.
+    """
+    func_prefix = "[servir_consultas]"
+    indice = IndiceCustos(diretorio_historico, competencia)
+    indice.recarregar()
+    parar = threading.Event()
+
+    def verificar_recarga():
+        while not parar.wait(intervalo_recarga_s):
+            try:
+                indice.recarregar_se_alterado()
+            except Exception as e:  # Uma gravação em andamento não derruba o serviço: tenta de novo no próximo ciclo.
+                print(f"{func_prefix} ALERTA: Falha ao recarregar o histórico: {type(e).__name__} - {e}")
+
+    threading.Thread(target=verificar_recarga, daemon=True).start()
+    servidor = ThreadingHTTPServer((host, porta), _criar_tratador(indice))
+    print(f"\n--- Serviço de Consultas em http://{host}:{porta} (Ctrl+C para encerrar) ---")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{func_prefix} Encerrado pelo usuário.")
+    finally:
+        parar.set()
+        servidor.server_close()
+    print("--- Serviço de Consultas Encerrado ---")
@@ -0,0 +1,165 @@
+import time
+import signal
+import threading
+from typing import Dict, List, Optional, Any
+
+import pandas as pd
+
+from src.data_handler import (
+    ler_esquemas_planilhas, definir_colunas_necessarias, carregar_planilhas_entrada,
+    consolidar_e_calcular_custos, obter_assinaturas
+)
+from src.report_generator import gerar_saidas_relatorio
+from src.metrics import medir_etapa, limpar_metricas
+
+INTERVALO_VERIFICACAO_S = 0.5
+DEBOUNCE_PADRAO_S = 2.0
+
+
+class SessaoPipelineAquecida:
+    """
+    Mantém em memória os esquemas, o mapeamento de colunas e os DataFrames já carregados de cada planilha,
+    para que uma alteração em um arquivo exija apenas reler esse arquivo (e remapeá-lo, se o cabeçalho mudou)
+    antes de reconsolidar e regenerar as saídas.
+    """
+
+    def __init__(
+        self,
+        diretorio_input: str,
+        diretorio_output: str,
+        nomes_planilhas: List[str],
+        nome_base_relatorio: str,
+        formatos_saida: List[str],
+        competencia: Optional[str] = None,
+        modo_compacto: bool = False
+    ):
+        self.diretorio_input = diretorio_input
+        self.diretorio_output = diretorio_output
+        self.nomes_planilhas = nomes_planilhas
+        self.nome_base_relatorio = nome_base_relatorio
+        self.formatos_saida = formatos_saida
+        self.competencia = competencia
+        self.modo_compacto = modo_compacto
+        self.esquemas: Dict[str, List[str]] = {}
+        self.mapeamento: Dict[str, Any] = {}
+        self.dataframes: Dict[str, pd.DataFrame] = {}
+
+    def recarregar(self, arquivos: List[str], forcar_atualizacao_mapeamento: bool = False) -> bool:
+        """Relê os `arquivos` informados; só os que tiveram o cabeçalho alterado passam de novo pelo mapeamento."""
+        func_prefix = "[SessaoPipelineAquecida.recarregar]"
+        amostras = ler_esquemas_planilhas(self.diretorio_input, arquivos)
+        if amostras is None:
+            return False
+        esquemas_novos = {nome_df: list(df.columns) for nome_df, df in amostras.items()}
+        esquemas_alterados = {
+            nome_df: colunas for nome_df, colunas in esquemas_novos.items()
+            if forcar_atualizacao_mapeamento or self.esquemas.get(nome_df) != colunas or nome_df not in self.mapeamento
+        }
+        if esquemas_alterados:
+            from src.agent_mapper import obter_mapeamento_colunas  # Só a Etapa 2 precisa da pilha do LLM.
+            mapeamento_novo = obter_mapeamento_colunas(
+                esquemas_alterados, forcar_atualizacao=forcar_atualizacao_mapeamento,
+                amostras={nome_df: amostras[nome_df] for nome_df in esquemas_alterados}
+            ) or {}
+            faltantes = [nome_df for nome_df in esquemas_alterados if nome_df not in mapeamento_novo]
+            if faltantes:
+                print(f"{func_prefix} ERRO: Sem mapeamento para {faltantes}. Mantendo os dados anteriores.")
+                return False
+            self.mapeamento.update(mapeamento_novo)
+        else:
+            print(f"{func_prefix} Cabeçalhos inalterados; mapeamento reaproveitado.")
+
+        colunas_por_planilha = definir_colunas_necessarias(
+            {nome_df: self.mapeamento[nome_df] for nome_df in esquemas_novos}, esquemas_novos
+        )
+        dataframes_novos = carregar_planilhas_entrada(
+            self.diretorio_input, arquivos, colunas_por_planilha, paralelo=len(arquivos) > 1
+        )
+        if dataframes_novos is None:
+            return False
+        self.esquemas.update(esquemas_novos)
+        self.dataframes.update(dataframes_novos)
+        return True
+
+    def regenerar(self) -> bool:
+        """Reconsolida a partir dos DataFrames em memória e regrava as saídas."""
+        rollups: Dict[str, pd.DataFrame] = {}
+        df_final = consolidar_e_calcular_custos(
+            self.dataframes, self.mapeamento, modo_compacto=self.modo_compacto, rollups_departamento=rollups
+        )
+        if df_final is None or df_final.empty:
+            print("[SessaoPipelineAquecida.regenerar] ERRO: Falha na consolidação; saídas não atualizadas.")
+            return False
+        return gerar_saidas_relatorio(
+            df_final, self.mapeamento, self.diretorio_output, self.nome_base_relatorio,
+            self.formatos_saida, competencia=self.competencia, rollups=rollups
+        )
+
+
+def observar_diretorio(
+    sessao: SessaoPipelineAquecida,
+    debounce_s: float = DEBOUNCE_PADRAO_S,
+    intervalo_s: float = INTERVALO_VERIFICACAO_S,
+    forcar_atualizacao_mapeamento: bool = False,
+    max_ciclos: Optional[int] = None
+) -> None:
+    """
+    Modo observação: carrega tudo uma vez e, a cada alteração nas planilhas de entrada, relê apenas os
+    arquivos alterados e regenera as saídas. Uma rajada de gravações só é processada depois de
+    `debounce_s` segundos sem novas mudanças e com todos os arquivos presentes. Roda até Ctrl+C
+    (ou até `max_ciclos` regenerações, se informado).
+    """
+    func_prefix = "[observar_diretorio]"
+    print(f"\n--- Iniciando Modo Observação em '{sessao.diretorio_input}' ---")
+    with medir_etapa("observacao_carga_inicial", perfilar=False):
+        processadas = obter_assinaturas(sessao.diretorio_input, sessao.nomes_planilhas)
+        if not (sessao.recarregar(sessao.nomes_planilhas, forcar_atualizacao_mapeamento) and sessao.regenerar()):
+            print(f"{func_prefix} Carga inicial falhou; aguardando alterações nas planilhas para tentar novamente.")
+            processadas = {nome: None for nome in sessao.nomes_planilhas}
+
+    ciclos = 0
+    observadas = dict(processadas)
+    ultima_mudanca: Optional[float] = None
+    # SIGTERM (ex.: gerenciador de serviços) encerra como Ctrl+C; só é possível na thread principal.
+    tratador_anterior = None
+    if threading.current_thread() is threading.main_thread():
+        tratador_anterior = signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"{func_prefix} Aguardando alterações (debounce de {debounce_s:.1f}s). Ctrl+C para encerrar.")
+    try:
+        while max_ciclos is None or ciclos < max_ciclos:
+            time.sleep(intervalo_s)
+            atuais = obter_assinaturas(sessao.diretorio_input, sessao.nomes_planilhas)
+            if atuais != observadas:
+                observadas = atuais
+                ultima_mudanca = time.monotonic()
+                continue
+            if ultima_mudanca is None or time.monotonic() - ultima_mudanca < debounce_s:
+                continue
+            ultima_mudanca = None
+            if any(assinatura is None for assinatura in atuais.values()):
+                print(f"{func_prefix} ALERTA: Há planilhas ausentes; aguardando que voltem ao diretório.")
+                continue
+            alterados = [nome for nome in sessao.nomes_planilhas if atuais[nome] != processadas.get(nome)]
+            if not alterados:
+                continue
+
+            limpar_metricas()
+            inicio = time.perf_counter()
+            print(f"\n{func_prefix} Alteração detectada em {alterados}. Regenerando...")
+            # Sem carga inicial bem-sucedida, a sessão ainda não tem todas as planilhas: relê todas.
+            arquivos = alterados if len(sessao.dataframes) == len(sessao.nomes_planilhas) else sessao.nomes_planilhas
+            with medir_etapa("observacao_regeneracao", perfilar=False, arquivos=arquivos):
+                # O remapeamento forçado vale só para a carga inicial; depois, cabeçalhos inalterados reaproveitam o mapeamento.
+                sucesso = sessao.recarregar(arquivos) and sessao.regenerar()
+            if sucesso:
+                processadas = atuais
+                print(f"{func_prefix} Saídas regeneradas em {time.perf_counter() - inicio:.2f}s.")
+            else:
+                print(f"{func_prefix} ERRO ao regenerar; será tentado de novo na próxima alteração.")
+            ciclos += 1
+    except KeyboardInterrupt:
+        print(f"\n{func_prefix} Encerrado pelo usuário.")
+    finally:
+        if tratador_anterior is not None:
+            signal.signal(signal.SIGTERM, tratador_anterior)
+    print("--- Modo Observação Encerrado ---")
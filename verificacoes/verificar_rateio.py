@@ -0,0 +1,145 @@
+import os
+import sys
+from typing import Any, Callable, Dict, List, Tuple
+
+import pandas as pd
+
+from src.data_handler import (
+    ler_esquemas_planilhas, definir_colunas_necessarias, carregar_planilhas_entrada,
+    consolidar_e_calcular_custos, agregar_custos_em_streaming, NOMES_PLANILHAS_PADRAO, ROTULO_NAO_ALOCADO
+)
+from src.agent_mapper import processar_mapeamento_identificado
+from src.report_generator import preparar_dataframe_relatorio
+
+DIRETORIO_INPUT_PADRAO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "input")
+# Colunas (nome, CPF, custo) das planilhas de data/input: mapeamento fixo, sem cache, heurística nem LLM.
+IDENTIFICACAO_DADOS_EXEMPLO: Dict[str, Tuple[str, str, str]] = {
+    "colaboradores": ("Nome", "CPF", "Salario"),
+    "github": ("Assinante", "Documento", "Valor Mensal"),
+    "gympass": ("Assinante", "Documento", "Valor Mensal"),
+    "google_workspace": ("Assinante", "Documento", "Valor Mensal"),
+    "unimed": ("Beneficiário", "CPF", "Total"),
+}
+# Chaves mascaradas compartilhadas por dois colaboradores em data/input (resolvidas pelo nome).
+CHAVES_COMPARTILHADAS_EXEMPLO = [179182058, 500293169]
+
+
+def montar_mapeamento(identificacao: Dict[str, Tuple[str, str, str]]) -> Dict[str, Any]:
+    mapeamento: Dict[str, Any] = {}
+    for nome_planilha, (col_nome, col_cpf, col_custo) in identificacao.items():
+        mapeamento.update(processar_mapeamento_identificado(nome_planilha, col_nome, col_cpf, col_custo))
+    return mapeamento
+
+
+def custo_em_reais(df: pd.DataFrame, coluna: str) -> pd.Series:
+    return df[coluna] / 100 if df.attrs.get("valores_em_centavos") else df[coluna]
+
+
+def verificar_dados_exemplo(diretorio_input: str, modo_compacto: bool, modo_streaming: bool) -> None:
+    """Consolida data/input e confere, por fonte, o total do consolidado com o total bruto da fatura."""
+    mapeamento = montar_mapeamento(IDENTIFICACAO_DADOS_EXEMPLO)
+    amostras = ler_esquemas_planilhas(diretorio_input, NOMES_PLANILHAS_PADRAO)
+    colunas = definir_colunas_necessarias(mapeamento, {nome: list(df.columns) for nome, df in amostras.items()})
+    custos_pre_agregados = None
+    if modo_streaming:
+        dataframes = carregar_planilhas_entrada(diretorio_input, ["colaboradores.xlsx"], colunas, usar_cache=False)
+        custos_pre_agregados = agregar_custos_em_streaming(
+            diretorio_input, NOMES_PLANILHAS_PADRAO, mapeamento, modo_compacto=modo_compacto
+        )
+    else:
+        dataframes = carregar_planilhas_entrada(diretorio_input, NOMES_PLANILHAS_PADRAO, colunas, usar_cache=False)
+    rollups: Dict[str, pd.DataFrame] = {}
+    df = consolidar_e_calcular_custos(
+        dataframes, mapeamento, modo_compacto=modo_compacto, custos_pre_agregados=custos_pre_agregados,
+        rollups_departamento=rollups
+    )
+    assert df is not None, "consolidação falhou"
+    assert not df["Nao_Alocado"].any(), f"custos não alocados nos dados de exemplo: {df[df['Nao_Alocado']].to_dict('records')}"
+
+    for nome_planilha, (col_nome, col_cpf, col_custo) in IDENTIFICACAO_DADOS_EXEMPLO.items():
+        if nome_planilha == "colaboradores":
+            continue
+        fatura = pd.read_excel(os.path.join(diretorio_input, f"{nome_planilha}.xlsx"))
+        coluna = mapeamento[nome_planilha]["nome_padronizado_custo"]
+        total_fatura = round(pd.to_numeric(fatura[col_custo], errors="coerce").sum(), 2)
+        total_consolidado = round(custo_em_reais(df, coluna).sum(), 2)
+        assert total_consolidado == total_fatura, f"{coluna}: consolidado {total_consolidado} != fatura {total_fatura}"
+
+        # Chave compartilhada: cada colaborador recebe apenas as linhas da fatura com o seu nome.
+        fatura_por_nome = pd.to_numeric(fatura[col_custo], errors="coerce").groupby(fatura[col_nome]).sum()
+        for chave in CHAVES_COMPARTILHADAS_EXEMPLO:
+            for _, linha in df[df["CPF_Padronizado"] == chave].iterrows():
+                esperado = round(fatura_por_nome.get(linha["Nome_Padronizado"], 0.0), 2)
+                obtido = round(linha[coluna] / 100 if df.attrs.get("valores_em_centavos") else linha[coluna], 2)
+                assert obtido == esperado, f"{coluna} de {linha['Nome_Padronizado']}: {obtido} != {esperado}"
+
+    # Totais por departamento = soma das linhas gravadas (já arredondadas) no relatório, em qualquer modo.
+    df_relatorio, colunas_monetarias = preparar_dataframe_relatorio(df, mapeamento)
+    departamentos = df_relatorio["Departamento"].astype(str)
+    somas = df_relatorio[colunas_monetarias].groupby(departamentos).sum().round(2)
+    somas.loc["Total Geral"] = df_relatorio[colunas_monetarias].sum().round(2)
+    rollup = rollups["Departamentos"].set_index("Departamento").loc[somas.index, colunas_monetarias]
+    diferencas = (rollup - somas).abs().max()
+    assert (diferencas < 1e-6).all(), f"totais por departamento diferem das linhas do relatório: {diferencas.to_dict()}"
+
+
+def verificar_casos_alocacao() -> None:
+    """Casos sintéticos: CPF validado, chave compartilhada resolvida pelo nome, chave ambígua, CPF mascarado e sem CPF."""
+    colaboradores = pd.DataFrame({
+        "Nome": ["Ana Souza", "Bruno Lima", "Carla Dias", "Davi Rocha", "Davi Rocha", "Eva Melo"],
+        "CPF": ["529.982.247-25", "111.222.333-XX", "111.222.333-XX", "444.555.666-XX", "444.555.666-XX", "777.888.999-XX"],
+        "Departamento": ["TI", "TI", "RH", "RH", "TI", "RH"],
+        "Salario": [1000.0] * 6,
+    })
+    github = pd.DataFrame({
+        "Assinante": [
+            "Ana S.",         # CPF validado e único: vinculado só pela chave, mesmo com outro nome
+            "Carla  DIAS",    # chave compartilhada: resolvida pelo nome normalizado
+            "Davi Rocha",     # chave e nome repetidos: ambíguo -> Não Alocado
+            "Eva Mello",      # CPF mascarado com nome divergente: nunca só pelos dígitos -> Não Alocado
+            "Sem Documento",  # sem CPF -> Não Alocado
+        ],
+        "Documento": ["52998224725", "111.222.333-XX", "444.555.666-XX", "777.888.999-XX", None],
+        "Valor Mensal": [10.0, 20.0, 40.0, 80.0, 160.0],
+    })
+    mapeamento = montar_mapeamento({
+        "colaboradores": ("Nome", "CPF", "Salario"), "github": ("Assinante", "Documento", "Valor Mensal"),
+    })
+    for modo_compacto in (False, True):
+        df = consolidar_e_calcular_custos(
+            {"colaboradores": colaboradores, "github": github}, mapeamento, modo_compacto=modo_compacto
+        )
+        assert df is not None, "consolidação falhou"
+        custo = custo_em_reais(df, "Custo_GitHub")
+        por_nome = dict(zip(df["Nome_Padronizado"], custo))
+        assert por_nome["Ana Souza"] == 10.0, por_nome
+        assert por_nome["Carla Dias"] == 20.0 and por_nome["Bruno Lima"] == 0.0, por_nome
+        assert custo[df["Nome_Padronizado"] == "Davi Rocha"].sum() == 0.0, por_nome
+        assert por_nome["Eva Melo"] == 0.0, por_nome
+        linha_nao_alocada = df[df["Nao_Alocado"]]
+        assert len(linha_nao_alocada) == 1 and linha_nao_alocada["Nome_Padronizado"].iloc[0] == ROTULO_NAO_ALOCADO
+        assert custo[df["Nao_Alocado"]].iloc[0] == 40.0 + 80.0 + 160.0, por_nome
+        assert custo.sum() == github["Valor Mensal"].sum(), "total do consolidado difere da fatura"
+
+
+VERIFICACOES: List[Tuple[str, Callable[[], None]]] = [
+    ("dados de exemplo", lambda: verificar_dados_exemplo(DIRETORIO_INPUT_PADRAO, False, False)),
+    ("dados de exemplo (compacto)", lambda: verificar_dados_exemplo(DIRETORIO_INPUT_PADRAO, True, False)),
+    ("dados de exemplo (streaming)", lambda: verificar_dados_exemplo(DIRETORIO_INPUT_PADRAO, False, True)),
+    ("dados de exemplo (streaming, compacto)", lambda: verificar_dados_exemplo(DIRETORIO_INPUT_PADRAO, True, True)),
+    ("casos de alocação", verificar_casos_alocacao),
+]
+
+
+if __name__ == "__main__":
+    falhas = []
+    for descricao, verificacao in VERIFICACOES:
+        try:
+            verificacao()
+            falhas.append(None)
+        except AssertionError as e:
+            falhas.append(str(e) or "asserção falhou")
+    print("\n--- Verificação do Rateio ---")
+    for (descricao, _), falha in zip(VERIFICACOES, falhas):
+        print(f"  [{'OK' if falha is None else 'FALHA'}] {descricao}" + ("" if falha is None else f" -> {falha}"))
+    sys.exit(1 if any(falhas) else 0)